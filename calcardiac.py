@@ -0,0 +1,248 @@
+"""
+CalCardiac command line.
+
+    python calcardiac.py convert CSV_DIR ADIBIN_DIR    UCSF alarm csv files to adibin files
+    python calcardiac.py inspect FILE.adibin ...       print adibin file and channel headers
+    python calcardiac.py sample CSV_DIR SIZE COUNT     sort csv files into random batches
+    python calcardiac.py train WINDOWS.npy LABELS.npy  train pvc_p on cached windows
+    python calcardiac.py predict WINDOWS.npy           score windows with pvc_p
+    python calcardiac.py score ADIBIN_DIR              score alarms with a pickled classical model
+    python calcardiac.py startup                       time every subcommand's start up
+
+Only the standard library is imported at start up. Each subcommand imports what it
+needs when it runs, so --help or a header inspection never loads TensorFlow, SciPy
+or wfdb; predict with --weights scores with NumPy alone (see numpy_pvc).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SOURCE_DIRS = {'ucsf': os.path.join(ROOT, 'dataEngineering', 'ucsfUtilities'),
+               'mitbih': os.path.join(ROOT, 'dataEngineering', 'mitbihExploration'),
+               'cnn': os.path.join(ROOT, 'dataScience', '1dcnnClassifier')}
+
+# modules a light subcommand must never import
+HEAVY_MODULES = ('tensorflow', 'scipy', 'wfdb')
+
+# start up budget (s) of the light subcommands
+STARTUP_BUDGET = 0.1
+
+
+def use(*names):
+    for name in names:
+        if SOURCE_DIRS[name] not in sys.path:
+            sys.path.append(SOURCE_DIRS[name])
+
+
+###############################################################
+###                       Subcommands                       ###
+###############################################################
+
+def convert(args):
+    use('ucsf')
+    from csvToAdibin import csvToAdibin
+    report = csvToAdibin(args.csv_dir, args.adibin_dir, dbg=args.verbose,
+                         workers=args.workers,
+                         manifest_path=args.manifest, archive=args.archive,
+                         catalog_path=args.catalog, metrics_path=args.metrics)
+    print(report)
+
+
+def inspect(args):
+    use('ucsf')
+    from parseCsv import read_headers
+    for filename in args.files:
+        with open(filename, 'rb') as adibin_file:
+            file_header, channel_headers, data_offset = read_headers(adibin_file)
+        print(filename)
+        for key, value in file_header.items():
+            print('  %-18s %s' % (key, value))
+        print('  %-18s %s' % ('DataOffset', data_offset))
+        for channel in channel_headers:
+            print('  channel %d: %s [%s] scale=%g offset=%g range=(%g, %g)' % tuple(channel))
+
+
+def sample(args):
+    use('ucsf')
+    from makeRandomSamples import makeRandomSamples
+    makeRandomSamples(args.size, args.count, args.csv_dir, args.verbose)
+
+
+def train(args):
+    use('cnn')
+    import numpy as np
+    from input_pipeline import data_gen
+    from pvc_p import pvc_p
+
+    X = np.load(args.windows, mmap_mode='r')
+    y = np.load(args.labels, mmap_mode='r')
+    X = X.reshape(X.shape + (1,)) if X.ndim == 2 else X
+    model = pvc_p(args.batch_size, X.shape[1], X.shape[2])
+    if args.session:
+        model.load_session(args.session)
+    training_error, validation_error = model.train_n_steps(args.steps,
+                                                           data_gen(X, y, args.batch_size))
+    print('training error %.4f, validation error %.4f' % (training_error[-1], validation_error[-1]))
+    if args.save:
+        model.save_session(args.save)
+    if args.export:
+        model.export_weights(args.export)
+
+
+def predict(args):
+    use('cnn')
+    import numpy as np
+
+    X = np.load(args.windows, mmap_mode='r')
+    X = X.reshape(X.shape + (1,)) if X.ndim == 2 else X
+    if args.weights:
+        from numpy_pvc import numpy_pvc
+        model = numpy_pvc(args.weights)
+    elif args.session:
+        from pvc_p import pvc_p
+        model = pvc_p(10, X.shape[1], X.shape[2])
+        model.load_session(args.session)
+    else:
+        raise SystemExit('predict needs --weights or --session')
+
+    probabilities = model.predict_proba(X)
+    if args.out:
+        np.save(args.out, probabilities)
+    print('%d windows, %d PVC' % (len(probabilities), int((probabilities > args.thresh).sum())))
+
+
+def score(args):
+    use('ucsf')
+    from scoreAlarms import scoreAlarms
+    options = {'model_path': args.model} if args.model else {}
+    print(scoreAlarms(args.adibin_dir, args.output, sec=args.sec, workers=args.workers,
+                      dbg=args.verbose, **options))
+
+
+# Runs every command line in a fresh interpreter and reports its wall time
+# and which heavy modules it imported
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.argv = %(argv)r
+sys.path.insert(0, %(root)r)
+import calcardiac
+try:
+    calcardiac.main(sys.argv[1:])
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print('STARTUP', time.perf_counter() - start,
+      ','.join(name for name in calcardiac.HEAVY_MODULES if name in sys.modules))
+"""
+
+
+def startup_time(argv, repeats=5):
+    times = []
+    heavy = ''
+    for i in range(repeats):
+        script = STARTUP_SCRIPT % {'argv': ['calcardiac.py'] + argv, 'root': ROOT}
+        start_time = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL).stdout.decode()
+        times.append(time.perf_counter() - start_time)
+        for line in output.splitlines():
+            if line.startswith('STARTUP'):
+                heavy = (line.split() + [''])[2]
+    times.sort()
+    return times[len(times) // 2], heavy
+
+
+def startup(args):
+    command_lines = [[name, '--help'] for name in SUBCOMMANDS]
+    command_lines += [['inspect'] + args.inspect] if args.inspect else []
+    failed = False
+    for argv in command_lines:
+        seconds, heavy = startup_time(argv, args.repeats)
+        light = argv[0] in ('inspect', 'sample') or '--help' in argv
+        over = light and seconds > STARTUP_BUDGET
+        failed = failed or over or (light and heavy != '')
+        print('%-40s %7.1f ms  %s%s' % (' '.join(argv), seconds * 1000,
+                                        'imports ' + heavy if heavy else '',
+                                        '  OVER BUDGET' if over else ''))
+    if failed:
+        sys.exit(1)
+
+
+SUBCOMMANDS = {'convert': convert, 'inspect': inspect, 'sample': sample,
+               'train': train, 'predict': predict, 'score': score}
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='calcardiac', description='CalCardiac tools')
+    subparsers = parser.add_subparsers(dest='command')
+
+    convert_parser = subparsers.add_parser('convert', help='convert UCSF alarm csv files to adibin files')
+    convert_parser.add_argument('csv_dir')
+    convert_parser.add_argument('adibin_dir')
+    convert_parser.add_argument('--workers', type=int, default=1,
+                                help='worker processes, 1 (default) converts serially in this process')
+    convert_parser.add_argument('--manifest', help='sqlite manifest for incremental runs')
+    convert_parser.add_argument('--archive', choices=['adibin', 'raw'],
+                                help='write one alarm archive per csv file instead of adibin files, '
+                                     'holding adibin blobs or raw int16 blocks')
+    convert_parser.add_argument('--catalog', help='sqlite alarm catalog to add converted alarms to')
+    convert_parser.add_argument('--metrics', help="JSON lines metrics file, '-' for stdout")
+    convert_parser.add_argument('--verbose', action='store_true')
+
+    inspect_parser = subparsers.add_parser('inspect', help='print adibin file and channel headers')
+    inspect_parser.add_argument('files', nargs='+')
+
+    sample_parser = subparsers.add_parser('sample', help='move csv files into random batch directories')
+    sample_parser.add_argument('csv_dir')
+    sample_parser.add_argument('size', type=int, help='files per batch')
+    sample_parser.add_argument('count', type=int, help='number of batches')
+    sample_parser.add_argument('--verbose', action='store_true')
+
+    train_parser = subparsers.add_parser('train', help='train pvc_p on (n, T, C) windows and (n,) labels')
+    train_parser.add_argument('windows')
+    train_parser.add_argument('labels')
+    train_parser.add_argument('--steps', type=int, default=1000)
+    train_parser.add_argument('--batch-size', type=int, default=64)
+    train_parser.add_argument('--session', help='saved session to continue from')
+    train_parser.add_argument('--save', help='session name to save to in tf_saved_models/')
+    train_parser.add_argument('--export', help='.npz to export the weights to for predict --weights')
+
+    predict_parser = subparsers.add_parser('predict', help='PVC probabilities of (n, T, C) windows')
+    predict_parser.add_argument('windows')
+    predict_parser.add_argument('--weights', help='.npz from train --export, scored without TensorFlow')
+    predict_parser.add_argument('--session', help='saved session in tf_saved_models/')
+    predict_parser.add_argument('--out', help='.npy to save the probabilities to')
+    predict_parser.add_argument('--thresh', type=float, default=0.5)
+
+    score_parser = subparsers.add_parser('score', help='score UCSF alarm adibins with a pickled classical model')
+    score_parser.add_argument('adibin_dir')
+    score_parser.add_argument('--output', default='alarmScores.csv')
+    score_parser.add_argument('--model', help='RandomForestSmall.pkl (default), LogRegSmall.pkl or RandomForest_10s.pkl path')
+    score_parser.add_argument('--sec', type=float, help='model window half-width in seconds, for other models')
+    score_parser.add_argument('--workers', type=int, help='worker processes (all cores by default)')
+    score_parser.add_argument('--verbose', action='store_true')
+
+    startup_parser = subparsers.add_parser('startup', help='time the start up of every subcommand')
+    startup_parser.add_argument('--inspect', nargs='+', help='adibin files to also time inspect on')
+    startup_parser.add_argument('--repeats', type=int, default=5)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if args.command is None:
+        make_parser().print_help()
+    elif args.command == 'startup':
+        startup(args)
+    else:
+        SUBCOMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Compares FFT and polyphase resampling in processing_components on UCSF, MIT-BIH and
+# model rates, for batched 2-D and 3-D inputs and for an awkward (prime) length
+import time
+import numpy as np
+
+from processing_components import resample, UCSF_FS, MITBIH_FS, MODEL_FS
+
+def best_time(function, repeats=3):
+    best = float('inf')
+    for i in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def test_signal(shape, axis, rate_from):
+    # slow sine with an offset and a fractional number of periods, so neither end
+    #  lines up with the other
+    t = np.arange(shape[axis]) / rate_from
+    x = np.sin(2 * np.pi * 1.37 * t) + 0.3
+    return np.moveaxis(np.broadcast_to(x, np.moveaxis(np.empty(shape), axis, -1).shape), -1, axis)
+
+def edge_error(x, rate_from, rate_to, method, axis):
+    # worst error in the first and last second; both methods pass the sine unchanged
+    #  in the middle, FFT resampling rings at the ends because it treats x as periodic
+    y = resample(x, rate_from, rate_to, axis=axis, method=method)
+    y = np.moveaxis(y, axis, -1).reshape(-1, y.shape[axis])
+    expected = np.sin(2 * np.pi * 1.37 * np.arange(y.shape[1]) / rate_to) + 0.3
+    edge = rate_to
+    return max(np.abs(y[:, :edge] - expected[:edge]).max(),
+               np.abs(y[:, -edge:] - expected[-edge:]).max())
+
+def benchmark_resample(repeats=3):
+    rng = np.random.RandomState(0)
+    cases = [('7 x 60 s UCSF (channels, samples)', (7, 60 * UCSF_FS), -1, UCSF_FS, MITBIH_FS),
+             ('7 x 60 s UCSF (channels, samples)', (7, 60 * UCSF_FS), -1, UCSF_FS, MODEL_FS),
+             ('512 MIT-BIH windows (batch, samples, 1)', (512, 3600, 1), 1, MITBIH_FS, MODEL_FS),
+             ('30 min MIT-BIH record (2, 650000)', (2, 650000), -1, MITBIH_FS, MODEL_FS),
+             ('prime length (2, 650011)', (2, 650011), -1, MITBIH_FS, MODEL_FS)]
+
+    results = []
+    for name, shape, axis, rate_from, rate_to in cases:
+        x = rng.randn(*shape)
+        sine = test_signal(shape, axis, rate_from)
+        result = {'case': name, 'rate_from': rate_from, 'rate_to': rate_to}
+        for method in ('fft', 'polyphase'):
+            result[method + '_seconds'] = best_time(lambda: resample(x, rate_from, rate_to, axis, method), repeats)
+            result[method + '_edge_error'] = edge_error(sine, rate_from, rate_to, method, axis)
+        results.append(result)
+    return results
+
+if __name__ == '__main__':
+    for result in benchmark_resample():
+        print('%-42s %d -> %d Hz: fft %.4fs (edge error %.3f), polyphase %.4fs (edge error %.3f), %.1fx'
+              % (result['case'], result['rate_from'], result['rate_to'],
+                 result['fft_seconds'], result['fft_edge_error'],
+                 result['polyphase_seconds'], result['polyphase_edge_error'],
+                 result['fft_seconds'] / result['polyphase_seconds']))
@@ -0,0 +1,164 @@
+# This module provides functions for preprocessing ECG signals
+# https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.resample.html#scipy.signal.resample
+# https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.resample_poly.html
+import fractions
+import functools
+import numpy as np
+import scipy.signal as sig
+
+# UCSF monitors, MIT-BIH and the model inputs
+UCSF_FS = 240
+MITBIH_FS = 360
+MODEL_FS = 200
+
+def resample_1d(signal, sampling_rate_from, sampling_rate_to):
+    # signal in samples, rates in samples per second
+    seconds = len(signal)/sampling_rate_from
+    return sig.resample(signal, int(np.floor(sampling_rate_to*seconds)))
+
+def rate_ratio(sampling_rate_from, sampling_rate_to, max_denominator=1000):
+    # smallest (up, down) with up/down == sampling_rate_to/sampling_rate_from
+    ratio = fractions.Fraction(sampling_rate_to) / fractions.Fraction(sampling_rate_from)
+    ratio = ratio.limit_denominator(max_denominator)
+    return ratio.numerator, ratio.denominator
+
+@functools.lru_cache(maxsize=None)
+def polyphase_filter(up, down):
+    # the low-pass FIR resample_poly designs by default, designed once per rate pair
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = sig.firwin(2 * half_len + 1, 1. / max_rate, window=('kaiser', 5.0))
+    h.setflags(write=False)
+    return h
+
+def resample(x, sampling_rate_from, sampling_rate_to, axis=-1, method='polyphase',
+             padtype='line'):
+    # x: any array, resampled along axis, e.g. (channels, samples) with axis=-1 or
+    #  (batch, samples, channels) with axis=1
+    # method: 'polyphase' filters with a cached rational FIR (ceil(n*up/down) samples
+    #  out), 'fft' is the resample_1d behaviour (floor(n*to/from) samples out)
+    # padtype: how resample_poly extends x past its ends; 'line' avoids both the FFT's
+    #  wrap-around ringing and the dip towards zero of resample_poly's default
+    x = np.asarray(x)
+    if sampling_rate_from == sampling_rate_to:
+        return x
+    if method == 'fft':
+        seconds = x.shape[axis]/sampling_rate_from
+        return sig.resample(x, int(np.floor(sampling_rate_to*seconds)), axis=axis)
+    if method != 'polyphase':
+        raise ValueError("method must be 'polyphase' or 'fft'")
+
+    up, down = rate_ratio(sampling_rate_from, sampling_rate_to)
+    h = polyphase_filter(up, down)
+    if np.issubdtype(x.dtype, np.floating):
+        h = h.astype(x.dtype)
+    return sig.resample_poly(x, up, down, axis=axis, window=h, padtype=padtype)
+
+class StreamingResampler(object):
+    # Resamples a stream chunk by chunk along axis, exactly as
+    #  resample(whole_signal, ..., method='polyphase', padtype=padtype) would
+    #  (padtype 'constant' or 'edge', the two that only need the first and last
+    #  samples). Only the last few filter lengths of input are kept, so memory
+    #  does not grow with the stream.
+    def __init__(self, sampling_rate_from, sampling_rate_to, axis=-1, padtype='edge'):
+        if padtype not in ('constant', 'edge'):
+            raise ValueError("padtype must be 'constant' or 'edge'")
+        self.up, self.down = rate_ratio(sampling_rate_from, sampling_rate_to)
+        self.axis = axis
+        self.padtype = padtype
+
+        # resample_poly's filter: scaled by up and front padded so output 0 lands
+        #  on input 0, then split into up phases of taps_per_phase taps
+        h = polyphase_filter(self.up, self.down) * self.up
+        half_len = (len(h) - 1) // 2
+        n_pre_pad = self.down - half_len % self.down
+        self.n_pre_remove = (half_len + n_pre_pad) // self.down
+        h = np.concatenate((np.zeros(n_pre_pad), h))
+        self.taps_per_phase = -(-len(h) // self.up)
+        h = np.concatenate((h, np.zeros(self.taps_per_phase * self.up - len(h))))
+        self.phases = h.reshape(self.taps_per_phase, self.up).T
+
+        self.reset()
+
+    def reset(self):
+        self.n_in = 0
+        self.m = 0
+        self.buffer = None
+        self.buffer_start = -self.taps_per_phase
+        # shape of the stream's other axes, for empty outputs before any sample
+        self.channel_shape = ()
+
+    def _outputs(self, m_end):
+        # filter outputs m .. m_end-1 (upfirdn numbering) from the buffered input;
+        #  output m is sum_i x[m*down//up - i] * phases[m*down % up, i]
+        m = np.arange(self.m, m_end)
+        newest = m * self.down // self.up
+        index = newest[:, np.newaxis] - np.arange(self.taps_per_phase) - self.buffer_start
+        taps = self.phases[m * self.down % self.up]
+        y = np.einsum('...mk,mk->...m', self.buffer[..., index], taps)
+
+        # drop filter warm up, then input nothing later output needs
+        y = y[..., max(0, self.n_pre_remove - self.m):]
+        self.m = m_end
+        keep_from = self.m * self.down // self.up - self.taps_per_phase + 1 - self.buffer_start
+        if keep_from > 0:
+            self.buffer = self.buffer[..., keep_from:]
+            self.buffer_start += keep_from
+        return y
+
+    def process(self, chunk):
+        # returns every output sample that no longer depends on future input
+        chunk = np.moveaxis(np.asarray(chunk, dtype=float), self.axis, -1)
+        self.channel_shape = chunk.shape[:-1]
+        if self.buffer is None:
+            # an empty first chunk has no sample to pad the start with
+            if chunk.shape[-1] == 0:
+                return np.moveaxis(chunk, -1, self.axis)
+            before = chunk[..., :1] if self.padtype == 'edge' else np.zeros(chunk.shape[:-1] + (1,))
+            self.buffer = np.repeat(before, self.taps_per_phase, axis=-1)
+        self.buffer = np.concatenate((self.buffer, chunk), axis=-1)
+        self.n_in += chunk.shape[-1]
+
+        m_end = -(-self.n_in * self.up // self.down)
+        y = self._outputs(m_end) if m_end > self.m else self.buffer[..., :0]
+        return np.moveaxis(y, -1, self.axis)
+
+    def flush(self):
+        # the outputs that needed samples past the end; the stream is then reset
+        if self.buffer is None:
+            y = np.moveaxis(np.zeros(self.channel_shape + (0,)), -1, self.axis)
+            self.reset()
+            return y
+        after = self.buffer[..., -1:] if self.padtype == 'edge' else np.zeros(self.buffer.shape[:-1] + (1,))
+        self.buffer = np.concatenate((self.buffer, np.repeat(after, self.taps_per_phase, axis=-1)), axis=-1)
+
+        n_out = -(-self.n_in * self.up // self.down)
+        y = self._outputs(self.n_pre_remove + n_out) if self.n_pre_remove + n_out > self.m \
+            else self.buffer[..., :0]
+        y = np.moveaxis(y, -1, self.axis)
+        self.reset()
+        return y
+
+def resample_stream(chunks, sampling_rate_from, sampling_rate_to, axis=-1, padtype='edge'):
+    # generator version of StreamingResampler over an iterable of chunks
+    resampler = StreamingResampler(sampling_rate_from, sampling_rate_to, axis, padtype)
+    for chunk in chunks:
+        yield resampler.process(chunk)
+    yield resampler.flush()
+
+def test():
+    x = np.random.RandomState(0).randn(3, 2400)
+    for rate_to in (MITBIH_FS, MODEL_FS):
+        up, down = rate_ratio(UCSF_FS, rate_to)
+        assert np.allclose(resample(x, UCSF_FS, rate_to), sig.resample_poly(x, up, down, axis=-1, padtype='line'))
+        assert np.allclose(resample(x.T[np.newaxis], UCSF_FS, rate_to, axis=1)[0].T,
+                           resample(x, UCSF_FS, rate_to))
+        assert resample(x, UCSF_FS, rate_to, method='fft').shape[-1] == \
+            len(resample_1d(x[0], UCSF_FS, rate_to))
+        chunks = np.array_split(x, 17, axis=-1)
+        chunks = [x[:, :0]] + chunks[:5] + [x[:, :0]] + chunks[5:]
+        assert np.allclose(np.concatenate(list(resample_stream(chunks, UCSF_FS, rate_to)), axis=-1),
+                           resample(x, UCSF_FS, rate_to, padtype='edge'))
+
+if __name__ == '__main__':
+    test()
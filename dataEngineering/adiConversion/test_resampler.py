@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from processing_components import resample, resample_stream, StreamingResampler, \
+    UCSF_FS, MITBIH_FS, MODEL_FS
+
+
+@pytest.mark.parametrize('rate_to', [MITBIH_FS, MODEL_FS])
+@pytest.mark.parametrize('padtype', ['edge', 'constant'])
+def test_streaming_matches_one_shot(rate_to, padtype):
+    x = np.random.RandomState(0).randn(3, 2400)
+    chunks = np.array_split(x, 17, axis=-1)
+    streamed = np.concatenate(list(resample_stream(chunks, UCSF_FS, rate_to, padtype=padtype)),
+                              axis=-1)
+    assert np.allclose(streamed, resample(x, UCSF_FS, rate_to, padtype=padtype))
+
+
+def test_empty_chunks():
+    x = np.random.RandomState(1).randn(2400)
+    empty = x[:0]
+    chunks = [empty, empty] + np.array_split(x, 7) + [empty]
+    chunks.insert(4, empty)
+    streamed = np.concatenate(list(resample_stream(chunks, UCSF_FS, MITBIH_FS)))
+    assert np.allclose(streamed, resample(x, UCSF_FS, MITBIH_FS, padtype='edge'))
+
+
+def test_empty_first_chunk_along_axis_0():
+    x = np.random.RandomState(2).randn(2400, 2)
+    resampler = StreamingResampler(UCSF_FS, MITBIH_FS, axis=0)
+    assert resampler.process(x[:0]).shape == (0, 2)
+    streamed = np.concatenate([resampler.process(x[:1000]), resampler.process(x[1000:]),
+                               resampler.flush()])
+    assert np.allclose(streamed, resample(x, UCSF_FS, MITBIH_FS, axis=0, padtype='edge'))
+
+
+@pytest.mark.parametrize('axis, shape', [(0, (0, 3)), (-1, (3, 0)), (1, (2, 0, 4))])
+def test_flush_of_empty_stream_keeps_channel_shape(axis, shape):
+    resampler = StreamingResampler(UCSF_FS, MITBIH_FS, axis=axis)
+    assert resampler.process(np.zeros(shape)).shape == shape
+    assert resampler.flush().shape == shape
+    assert StreamingResampler(UCSF_FS, MITBIH_FS).flush().shape == (0,)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Per-beat features of MIT-BIH records for the classical models, in one vectorized pass.
+
+The pickled models were fit on raw channel 1 windows, one flattened window per annotation,
+exactly as get_window cuts them:
+
+    RandomForest_10s.pkl   5 s either side   3600 values
+    RandomForestSmall.pkl  0.4 s either side  288 values
+    LogRegSmall.pkl        0.4 s either side  288 values
+
+so model_input is that layout and nothing else. RR-interval, QRS and morphology features
+(FEATURE_NAMES) are computed alongside it, row for row, for models fit on top of them.
+"""
+
+import collections
+import concurrent.futures
+import os
+import pickle
+
+import numpy as np
+
+# build_windows (and with it wfdb) is only imported to read records, so beat_features
+# itself can score windows from other sources, like the UCSF alarms in scoreAlarms
+from get_window import get_window, PVC_LABELS, NAMELIST, MITBIH_FS
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# model file -> window half-width in seconds
+MODEL_WINDOWS = {'RandomForest_10s.pkl': 5,
+                 'RandomForestSmall.pkl': 0.4,
+                 'LogRegSmall.pkl': 0.4}
+MODEL_CHANNELS = [1]
+
+# annotation symbols that are beats; the others ('+', '~', '|', ...) mark rhythm,
+# noise or comments and are skipped when measuring RR intervals
+BEAT_SYMBOLS = ['N', 'L', 'R', 'B', 'A', 'a', 'J', 'S', 'V', 'r',
+                'F', 'e', 'j', 'n', 'E', '/', 'f', 'Q', '?']
+
+LOCAL_BEATS = 10        # RR intervals in the local average
+QRS_SEC = 0.05          # QRS region either side of the annotation mark
+BEAT_SEC = 0.4          # morphology region either side of the annotation mark
+
+FEATURE_NAMES = ['pre_rr', 'post_rr', 'local_rr', 'rr_ratio',
+                 'r_amplitude', 'qrs_amplitude', 'qrs_width', 'qrs_energy', 'max_slope',
+                 'beat_mean', 'beat_std', 'beat_skew', 'beat_kurtosis']
+
+# model_input: (n_beats, 2*sec*fs) raw windows, the layout the pickled models expect
+# features: (n_beats, len(FEATURE_NAMES)) float32
+# labels, record, beat_index, symbol: (n_beats,) parallel arrays, as in window_batch
+feature_batch = collections.namedtuple('feature_batch', ['model_input', 'features', 'labels',
+                                                         'record', 'beat_index', 'symbol'])
+
+
+def rr_features(samples, symbols, fs=MITBIH_FS, local_beats=LOCAL_BEATS):
+    """
+    RR-interval features of every annotation, in seconds.
+    parameter: samples: numpy array of annotation sample indices (sorted)
+               symbols: annotation symbols
+    return: (n_annotations, 4) float32 array of pre_rr, post_rr, local_rr, rr_ratio;
+            NaN where there is no beat before (or after) the annotation
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+    beats = samples[np.isin(np.asarray(symbols), BEAT_SYMBOLS)]
+    features = np.full((len(samples), 4), np.nan, dtype=np.float32)
+    if len(beats) == 0:
+        return features
+
+    # last beat strictly before and first beat strictly after every annotation
+    previous = np.searchsorted(beats, samples, 'left') - 1
+    following = np.searchsorted(beats, samples, 'right')
+    has_previous = previous >= 0
+    has_following = following < len(beats)
+
+    features[has_previous, 0] = (samples - beats[previous])[has_previous] / float(fs)
+    features[has_following, 1] = (beats[following[has_following]] - samples[has_following]) / float(fs)
+
+    # mean of the local_beats RR intervals ending at the previous beat: the sum of
+    # consecutive intervals telescopes to a difference of two beat positions
+    first = np.maximum(previous - local_beats, 0)
+    intervals = previous - first
+    has_local = has_previous & (intervals > 0)
+    features[has_local, 2] = ((beats[previous] - beats[first])[has_local] /
+                              intervals[has_local].astype(float) / fs)
+    features[:, 3] = features[:, 0] / features[:, 2]
+    return features
+
+
+def morphology_features(windows, fs=MITBIH_FS, qrs_sec=QRS_SEC, beat_sec=BEAT_SEC):
+    """
+    QRS and morphology features of windows centred on their annotation mark.
+    parameter: windows: (n_beats, width) array
+    return: (n_beats, 9) float32 array in FEATURE_NAMES[4:] order
+    """
+    windows = np.asarray(windows)
+    n_beats, width = windows.shape
+    centre = width // 2
+    beat_half = min(int(round(beat_sec * fs)), centre)
+    qrs_half = min(int(round(qrs_sec * fs)), beat_half)
+
+    beat = windows[:, centre - beat_half:centre + beat_half].astype(np.float32)
+    baseline = np.median(beat, axis=1, keepdims=True)
+    beat = beat - baseline
+    qrs = beat[:, beat_half - qrs_half:beat_half + qrs_half]
+
+    features = np.empty((n_beats, 9), dtype=np.float32)
+    if n_beats == 0:
+        return features
+    features[:, 0] = beat[:, beat_half]
+    features[:, 1] = qrs.max(axis=1) - qrs.min(axis=1)
+
+    # width proxy: time the QRS region spends above half its peak deviation
+    peak = np.abs(qrs).max(axis=1, keepdims=True)
+    features[:, 2] = (np.abs(qrs) > 0.5 * peak).sum(axis=1) / float(fs)
+    features[:, 3] = np.einsum('ij,ij->i', qrs, qrs) / fs
+    features[:, 4] = np.abs(np.diff(beat, axis=1)).max(axis=1) * fs if beat.shape[1] > 1 else 0
+
+    mean = beat.mean(axis=1, keepdims=True)
+    centred = beat - mean
+    variance = (centred**2).mean(axis=1)
+    std = np.sqrt(variance)
+    safe_variance = np.where(variance > 0, variance, 1)
+    features[:, 5] = mean[:, 0] + baseline[:, 0]
+    features[:, 6] = std
+    features[:, 7] = (centred**3).mean(axis=1) / safe_variance**1.5
+    features[:, 8] = (centred**4).mean(axis=1) / safe_variance**2 - 3
+    return features
+
+
+def beat_features(signals, annotation, sec, fs=None, labels=PVC_LABELS, default_label=0):
+    """
+    model input and features of every annotation whose sec-second window fits in the record.
+    parameter: signals: (samples,) or (samples, 1) numpy array of the model channel
+               annotation: wfdb.annotation object (anything with .sample, .symbol and .fs)
+               sec: half-width of the model window in seconds, see MODEL_WINDOWS
+    return: four numpy arrays
+            model_input: (n_beats, 2*sec*fs) flattened windows, the get_window layout
+            features: (n_beats, len(FEATURE_NAMES)) float32
+            window_labels: (n_beats,) labels
+            beat_index: (n_beats,) index into annotation.sample
+    """
+    fs = annotation.fs if fs is None else fs
+    windows, window_labels, beat_index = get_window(signals, annotation, sec, labels,
+                                                    default_label, return_index=True, fs=fs)
+    model_input = windows.reshape(len(windows), int(round(2*sec*fs)) * windows.shape[2])
+
+    features = np.empty((len(beat_index), len(FEATURE_NAMES)), dtype=np.float32)
+    features[:, :4] = rr_features(annotation.sample, annotation.symbol, fs)[beat_index]
+    features[:, 4:] = morphology_features(model_input, fs)
+    return model_input, features, window_labels, beat_index
+
+
+def record_features(record, model='RandomForestSmall.pkl', data_dir=None, pb_dir='mitdb',
+                    fs=MITBIH_FS):
+    """
+    feature_batch of one record for a model in MODEL_WINDOWS.
+    """
+    from build_windows import read_annotation, read_signals
+
+    signals = read_signals(record, MODEL_CHANNELS, data_dir, pb_dir)
+    annotation = read_annotation(record, data_dir, pb_dir)
+    model_input, features, window_labels, beat_index = beat_features(
+        signals, annotation, MODEL_WINDOWS[model], fs)
+    symbols = np.asarray(annotation.symbol)[beat_index]
+    return feature_batch(model_input, features, window_labels,
+                         np.full(len(beat_index), record, dtype=np.int32), beat_index, symbols)
+
+
+def database_features(records=NAMELIST, model='RandomForestSmall.pkl', workers=None,
+                      data_dir=None, pb_dir='mitdb', fs=MITBIH_FS, dbg=False):
+    """
+    feature_batch of every record, one record per task on a process pool.
+    parameter: records: record numbers, default all 48 in NAMELIST
+               model: a key of MODEL_WINDOWS
+               workers: pool size, os.cpu_count() when None; 1 runs in this process
+    return: feature_batch with the records in order
+    """
+    if workers == 1:
+        parts = [record_features(record, model, data_dir, pb_dir, fs) for record in records]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(record_features, record, model, data_dir, pb_dir, fs)
+                       for record in records]
+            parts = []
+            for record, future in zip(records, futures):
+                parts.append(future.result())
+                if dbg:
+                    print('record', record, 'is done.')
+
+    # copy the parts into preallocated arrays, freeing each part as it is copied
+    n_beats = sum(len(part.labels) for part in parts)
+    batch = feature_batch(*[np.empty((n_beats,) + field.shape[1:],
+                                     dtype=np.result_type(*[getattr(part, name).dtype for part in parts]))
+                            for name, field in zip(feature_batch._fields, parts[0])])
+    offset = 0
+    while parts:
+        part = parts.pop(0)
+        for target, values in zip(batch, part):
+            target[offset:offset + len(values)] = values
+        offset += len(part.labels)
+    return batch
+
+
+def load_model(model='RandomForestSmall.pkl', model_dir=MODEL_DIR):
+    """
+    unpickles one of the saved models (needs scikit-learn).
+    """
+    with open(os.path.join(model_dir, model), 'rb') as model_file:
+        return pickle.load(model_file)
+
+
+def pvc_scores(model_object, batch):
+    """
+    PVC score of every beat: the probability of class 1 for classifiers, the
+    prediction itself for the random forest regressors.
+    """
+    if hasattr(model_object, 'predict_proba'):
+        return model_object.predict_proba(batch.model_input)[:, 1]
+    return model_object.predict(batch.model_input)
+
+
+if __name__ == '__main__':
+    import time
+
+    start_time = time.time()
+    batch = database_features(dbg=True)
+    print(len(batch.labels), 'beats in', time.time() - start_time, 'seconds')
+    print('model input', batch.model_input.shape, 'features', batch.features.shape)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Builds beat windows for every MIT-BIH record in one pass into preallocated arrays.
+"""
+
+import collections
+
+import numpy as np
+import wfdb
+
+from get_window import get_window, window_starts, PVC_LABELS, NAMELIST, MITBIH_FS
+
+# windows: (n_beats, 2*sec*fs, channels) array
+# labels, record, beat_index, symbol: (n_beats,) parallel arrays
+window_batch = collections.namedtuple('window_batch',
+                                      ['windows', 'labels', 'record', 'beat_index', 'symbol'])
+
+
+def read_annotation(record, data_dir=None, pb_dir='mitdb'):
+    """
+    reads the beat annotations of a record, locally from data_dir if given, else from physiobank.
+    """
+    if data_dir is not None:
+        return wfdb.rdann(data_dir + str(record), 'atr')
+    return wfdb.rdann(str(record), 'atr', sampfrom=0, sampto=None, shift_samps=True, pb_dir=pb_dir)
+
+
+def read_signal_length(record, data_dir=None, pb_dir='mitdb'):
+    """
+    reads only the header of a record to get its number of samples.
+    """
+    if data_dir is not None:
+        return wfdb.rdheader(data_dir + str(record)).sig_len
+    return wfdb.rdheader(str(record), pb_dir=pb_dir).sig_len
+
+
+def read_signals(record, channels, data_dir=None, pb_dir='mitdb'):
+    """
+    reads the signal columns of a record as a (samples, channels) array.
+    """
+    if data_dir is not None:
+        signals, fields = wfdb.rdsamp(data_dir + str(record), channels=list(channels))
+    else:
+        signals, fields = wfdb.rdsamp(str(record), sampfrom=0, sampto='end',
+                                      channels=list(channels), pb_dir=pb_dir)
+    return signals
+
+
+def build_windows(records=NAMELIST, secs=(5,), channels=(1,), labels=PVC_LABELS,
+                  default_label=0, drop_unlabeled=False, dtype=np.float32,
+                  data_dir=None, pb_dir='mitdb', fs=MITBIH_FS, dbg=False):
+    """
+    windows every annotation of every record for each half-width in secs.
+    Annotations and headers are read first to size every output array, then each record's
+    signal is read once and its windows for all widths are written in place, so memory is
+    the final arrays plus one record.
+    parameter: records: record numbers, default all 48 in NAMELIST
+               secs: half-widths in seconds, e.g. (0.4, 5)
+               channels: signal columns to window
+               labels, default_label, drop_unlabeled: as in get_window
+               dtype: dtype of the window arrays
+               data_dir: local directory with the .dat/.hea/.atr files (physiobank when None)
+               fs: sampling frequency used to turn secs into samples
+    return: dict from sec to window_batch
+    """
+    half_widths = dict((sec, int(round(sec*fs))) for sec in secs)
+
+    # pass 1: annotations and record lengths only
+    annotations = {}
+    symbol_length = 1
+    counts = dict((sec, []) for sec in secs)
+    for record in records:
+        annotation = read_annotation(record, data_dir, pb_dir)
+        signal_length = read_signal_length(record, data_dir, pb_dir)
+        symbols = np.asarray(annotation.symbol)
+        symbol_length = max(symbol_length, symbols.dtype.itemsize // 4)
+        for sec in secs:
+            starts, beat_index = window_starts(annotation.sample, half_widths[sec], signal_length)
+            if drop_unlabeled:
+                beat_index = beat_index[np.isin(symbols[beat_index], list(labels))]
+            counts[sec].append(len(beat_index))
+        annotations[record] = annotation
+
+    label_dtype = np.asarray(list(labels.values()) + [default_label]).dtype
+    batches = {}
+    for sec in secs:
+        n_beats = sum(counts[sec])
+        batches[sec] = window_batch(
+            windows=np.empty((n_beats, 2*half_widths[sec], len(channels)), dtype=dtype),
+            labels=np.empty(n_beats, dtype=label_dtype),
+            record=np.empty(n_beats, dtype=np.int32),
+            beat_index=np.empty(n_beats, dtype=np.int64),
+            symbol=np.empty(n_beats, dtype='<U%d' % symbol_length))
+
+    # pass 2: one signal read per record, every width filled in place
+    offsets = dict((sec, 0) for sec in secs)
+    for i, record in enumerate(records):
+        signals = read_signals(record, channels, data_dir, pb_dir)
+        annotation = annotations.pop(record)
+        symbols = np.asarray(annotation.symbol)
+        for sec in secs:
+            start, end = offsets[sec], offsets[sec] + counts[sec][i]
+            batch = batches[sec]
+            windows, window_labels, beat_index = get_window(
+                signals, annotation, sec, labels, default_label,
+                drop_unlabeled=drop_unlabeled, return_index=True, fs=fs,
+                out=batch.windows[start:end])
+            batch.labels[start:end] = window_labels
+            batch.record[start:end] = record
+            batch.beat_index[start:end] = beat_index
+            batch.symbol[start:end] = symbols[beat_index]
+            offsets[sec] = end
+        if dbg:
+            print('record', record, 'is done.')
+
+    return batches
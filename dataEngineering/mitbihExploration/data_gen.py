@@ -1,54 +1,114 @@
-import scipy as sci
-import wfdb
 import os
 import json
+import collections
+
+# Bytes of records kept in memory; a full 2 channel MIT-BIH record is ~10 MB
+CACHE_BYTES = 256 * 1024 * 1024
+
 
 class data_gen(object):
+    """This class converts ECG signals from MIT-BIH Arrhythmia dataset and labels into structured, tabular data.
+
+    Records are read on first access and kept in a least recently used cache of at most
+    cache_bytes, so nothing is loaded up front.
+    """
 
-    def __init__(self, window_size):
-        self.__doc__ = 
-        """This class converts ECG signals from MIT-BIH Arrhythmia dataset and labels into structured, tabular data.
-    
-        """
+    def __init__(self, window_size, data_dir='MIT-BIH/', cache_bytes=CACHE_BYTES):
         # Data Parameters
-        self.data_dir = 'MIT-BIH/'
-        
-        self.record_numbers = set(map(lambda x: x.split('.')[0], os.listdir('MIT-BIH/')))
-        self.all_patients_data = dict([(record_num, []) for record_num in self.record_numbers])
+        self.data_dir = data_dir
+
+        # data_dir is listed on first use of record_numbers, not here
+        self._record_numbers = None
+
+        # record_num -> (sample, annot), oldest first
+        self.all_patients_data = collections.OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
 
         # Model Parameters
         self.window_size = window_size
 
         self.alpha = 0.5
 
-        self.read_all_records()
+    @property
+    def record_numbers(self):
+        if self._record_numbers is None:
+            self._record_numbers = set(map(lambda x: x.split('.')[0], os.listdir(self.data_dir)))
+        return self._record_numbers
 
     def read_all_records(self):
-        """Aggregates data from all records into a [m,n,2] pseudoimage"""
+        """Aggregates data from all records into a [m,n,2] pseudoimage.
+        Only as many records as fit in cache_bytes stay in memory."""
         for r in self.record_numbers:
             self.read_single_record(r)
 
     def read_single_record(self, record_num):
-        """Updates the records dictionary with data from a given record number. 
+        """Updates the records dictionary with data from a given record number.
         The data_dir should contain the .atr, .dat, and .hea files."""
+        record_num = str(record_num)
+        if record_num in self.all_patients_data:
+            self.all_patients_data.move_to_end(record_num)
+            return self.all_patients_data[record_num]
+
+        import wfdb
         try:
             sample = wfdb.rdsamp(self.data_dir + record_num)
             annot = wfdb.rdann(self.data_dir + record_num, 'atr')
         except ValueError:
-            raise ValueError('Record not found') 
+            raise ValueError('Record not found')
 
         # validation_index = sci.random.choice(range(len(annot.sample)))
-        self.all_patients_data[str(record_num)] = (sample, annot)
+        self.all_patients_data[record_num] = (sample, annot)
+        self.cached_bytes += self.record_bytes(sample, annot)
+
+        # Evict least recently used records, always keeping the one just read
+        while self.cached_bytes > self.cache_bytes and len(self.all_patients_data) > 1:
+            old_sample, old_annot = self.all_patients_data.popitem(last=False)[1]
+            self.cached_bytes -= self.record_bytes(old_sample, old_annot)
+
+        return sample, annot
+
+    @staticmethod
+    def record_bytes(sample, annot):
+        """Approximate memory held by a cached record."""
+        # annotation sample indices plus about as much again for symbols and the rest
+        return sample[0].nbytes + 2 * annot.sample.nbytes
 
-    def get_data_obj(self, record_num):
-        """Returns the data object for the given record."""
-        return self.all_patients_data[str(record_num)][0]
+    def get_data_obj(self, record_num, sampfrom=0, sampto=None):
+        """Returns the data object for the given record.
+        With sampfrom/sampto only that sample range is read, unless the whole record
+        is already cached."""
+        record_num = str(record_num)
+        if sampfrom == 0 and sampto is None:
+            return self.read_single_record(record_num)[0]
+
+        if record_num in self.all_patients_data:
+            self.all_patients_data.move_to_end(record_num)
+            signals, fields = self.all_patients_data[record_num][0]
+            signals = signals[sampfrom:sampto]
+            return signals, dict(fields, sig_len=len(signals))
+
+        import wfdb
+        try:
+            return wfdb.rdsamp(self.data_dir + record_num, sampfrom=sampfrom, sampto=sampto)
+        except ValueError:
+            raise ValueError('Record not found')
+
+    def get_annot_obj(self, record_num, sampfrom=0, sampto=None):
+        """Returns the annotation object for the given record.
+        With sampfrom/sampto only annotations in that range are read; sample indices
+        stay relative to the start of the record."""
+        record_num = str(record_num)
+        if sampfrom == 0 and sampto is None:
+            return self.read_single_record(record_num)[1]
+
+        import wfdb
+        try:
+            return wfdb.rdann(self.data_dir + record_num, 'atr', sampfrom=sampfrom, sampto=sampto)
+        except ValueError:
+            raise ValueError('Record not found')
 
-    def get_annot_obj(self, record_num):
-        """Returns the data object for the given record."""
-        return self.all_patients_data[str(record_num)][1]
 
-        
     def to_json(self, record_num, n=100, channel=0):
         """Return a sample of windows in JSON"""
         return json.dumps(self.generate_data_batch(record_num, n, channel))
@@ -5,41 +5,87 @@ Created on Tue Mar 27 21:22:36 2018
 @author: Yuntao Wang
 """
 
-def get_window (signals, annotation, sec):
+import numpy as np
+
+# the 48 MIT-BIH Arrhythmia records used by the notebooks
+NAMELIST = [record for record in list(range(100, 125)) + list(range(200, 235))
+            if record not in [110, 120, 204, 206, 211, 216, 218, 224, 225, 226, 227, 229]]
+
+MITBIH_FS = 360
+
+# symbol -> label; any other symbol gets default_label
+PVC_LABELS = {'V': 1}
+
+
+def window_starts(samples, half_width, signal_length):
+    """
+    finds every annotation whose window fits inside the record.
+    parameter: samples: numpy array of annotation sample indices
+               half_width: number of samples before (and after) the annotation mark
+               signal_length: number of samples in the record
+    return: two numpy arrays
+            starts: first sample of every window that fits
+            beat_index: index into samples of each of those windows
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+    starts = samples - half_width
+    fits = (starts >= 0) & (samples + half_width <= signal_length)
+    return starts[fits], np.flatnonzero(fits)
+
+
+def get_window (signals, annotation, sec, labels=PVC_LABELS, default_label=0,
+                channels=None, drop_unlabeled=False, return_index=False, fs=None,
+                out=None):
     """
     this function gives a sec-seconds window (sec seconds before, sec seconds after the annotation mark)
-    of the ECG signals and assign value 1 if it's PVC beat and 0 otherwise.
-    parameter: signals: numpy array containing heart beat record values
-               annotation: wfdb.annotation object containing heart beat annotations
-               sec: positive integer number indicating the half-width of the window
-    return: two lists
-            siglist: a list of lists of length 360*2*sec 
-            annlist: a list containing 1 if PVC beat, 0 otherwise
+    of the ECG signals for every annotation at once and labels it with labels[symbol].
+    parameter: signals: numpy array containing heart beat record values, (samples,) or (samples, channels)
+               annotation: wfdb.annotation object (anything with .sample, .symbol and .fs)
+               sec: positive number indicating the half-width of the window
+               labels: dict from annotation symbol to label, default 1 for PVC ('V')
+               default_label: label for symbols not in labels
+               channels: optional list of signal columns to keep
+               drop_unlabeled: only keep annotations whose symbol is in labels
+               return_index: also return the annotation index of every window
+               fs: sampling frequency, if annotation.fs is not set
+               out: optional preallocated (n_beats, 2*sec*fs, channels) array to fill
+    return: two numpy arrays (three with return_index)
+            windows: (n_beats, 2*sec*fs, channels) array, one row per window
+            window_labels: (n_beats,) array of labels
+            beat_index: (n_beats,) index into annotation.sample
+    windows.reshape(len(windows), -1) is the old flattened siglist layout.
     """
-    siglist = []
-    annlist = []
-    
-    #loop through the annotation.symbol list
-    for i in range(len(annotation.symbol)):
-        timestamp = annotation.sample[i] #get the timestamp
-        
-        #test if that timestamp can have sec seconds before and after window
-        windowStart = timestamp - sec*annotation.fs
-        windowEnd = timestamp + sec*annotation.fs
-        if windowStart >= 0 & windowEnd <= len(signals):
-            if annotation.symbol[i] == 'V':
-                # check if the length of this strip is 360*2*sec
-                if len(signals[windowStart:windowEnd,].flatten().tolist()) == 2*sec*annotation.fs:
-                    siglist.append(signals[windowStart:windowEnd,].flatten().tolist())
-                    annlist.append(1)
-                else:
-                    continue
-            else:
-                # check if the length of this strip is 360*2*sec
-                if len(signals[windowStart:windowEnd,].flatten().tolist()) == 2*sec*annotation.fs:
-                    siglist.append(signals[windowStart:windowEnd,].flatten().tolist())
-                    annlist.append(0)
-        else:
-            continue
-    
-    return siglist, annlist
\ No newline at end of file
+    fs = annotation.fs if fs is None else fs
+    half_width = int(round(sec*fs))
+
+    signals = np.asarray(signals)
+    if signals.ndim == 1:
+        signals = signals[:, np.newaxis]
+    if channels is not None:
+        signals = signals[:, channels]
+
+    symbols = np.asarray(annotation.symbol)
+    starts, beat_index = window_starts(annotation.sample, half_width, len(signals))
+    if drop_unlabeled:
+        keep = np.isin(symbols[beat_index], list(labels))
+        starts, beat_index = starts[keep], beat_index[keep]
+
+    # every window is a row of one strided (samples - width + 1, channels, width)
+    # view of the record, so a single fancy index gathers them all
+    if out is None:
+        out = np.empty((len(starts), 2*half_width, signals.shape[1]), dtype=signals.dtype)
+    if len(starts) > 0:
+        strided = np.lib.stride_tricks.sliding_window_view(signals, 2*half_width, axis=0)
+        out[...] = strided[starts].transpose(0, 2, 1)
+    windows = out
+
+    # label lookup done once per distinct symbol
+    window_symbols = symbols[beat_index]
+    window_labels = np.full(len(beat_index), default_label,
+                            dtype=np.asarray(list(labels.values()) + [default_label]).dtype)
+    for symbol, label in labels.items():
+        window_labels[window_symbols == symbol] = label
+
+    if return_index:
+        return windows, window_labels, beat_index
+    return windows, window_labels
@@ -0,0 +1,55 @@
+import collections
+
+import numpy as np
+import pytest
+
+from beat_features import beat_features, rr_features, FEATURE_NAMES, MODEL_WINDOWS
+
+annotation = collections.namedtuple('annotation', ['sample', 'symbol', 'fs'])
+FS = 360
+
+
+def make_record(beats, length):
+    signals = np.zeros(length, dtype=np.float32)
+    signals[beats] = 1.0
+    return signals
+
+
+@pytest.mark.parametrize('sec', sorted(set(MODEL_WINDOWS.values())))
+def test_empty_input(sec):
+    width = int(round(2*sec*FS))
+    for signals, samples in [(np.zeros(10*FS), []),          # no annotations
+                             (np.zeros(FS // 10), [18])]:     # record shorter than a window
+        model_input, features, labels, beat_index = beat_features(
+            signals, annotation(np.array(samples, dtype=np.int64), ['N'] * len(samples), FS), sec)
+        assert model_input.shape == (0, width)
+        assert features.shape == (0, len(FEATURE_NAMES))
+        assert labels.shape == beat_index.shape == (0,)
+
+
+def test_edge_beats_are_dropped():
+    samples = np.arange(50, 10*FS, FS // 2)
+    signals = make_record(samples, 10*FS)
+    model_input, features, labels, beat_index = beat_features(
+        signals, annotation(samples, ['N', 'V'] * (len(samples) // 2) + ['N'] * (len(samples) % 2), FS),
+        0.4)
+    half_width = int(round(0.4*FS))
+    kept = samples[beat_index]
+    assert np.all(kept >= half_width) and np.all(kept + half_width <= len(signals))
+    assert model_input.shape == (len(kept), 2*half_width)
+    assert np.all(model_input[:, half_width] == 1)
+    assert np.array_equal(labels, (np.arange(len(samples)) % 2)[beat_index])
+
+
+def test_rr_features():
+    samples = np.array([100, 460, 820, 900, 1180])
+    features = rr_features(samples, ['N', 'N', 'N', '+', 'V'])
+    assert np.isnan(features[0, 0]) and np.isnan(features[-1, 1])
+    assert np.allclose(features[2, :3], [1, 1, 1])
+    # the rhythm mark is not a beat but still gets the intervals around it
+    assert np.allclose(features[3, :2], [80.0 / FS, 280.0 / FS])
+    assert np.isclose(features[4, 0], 360.0 / FS)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
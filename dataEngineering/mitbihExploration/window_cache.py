@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of extracted MIT-BIH beat windows as memory-mappable .npy files.
+
+Every entry is a directory holding windows.npy, labels.npy, record.npy, beat_index.npy,
+symbol.npy and meta.json. The directory name is a hash of the parameters (record(s),
+half-width, channels, sampling rates, labels, dtype, PREPROCESSING_VERSION), and meta.json
+holds the size and mtime of the source .dat/.hea/.atr files, so changing a parameter
+selects another entry and touching a source file rebuilds the entry on next use.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'adiConversion'))
+from processing_components import resample
+
+from build_windows import build_windows, window_batch, NAMELIST, MITBIH_FS
+from get_window import PVC_LABELS
+
+# bump whenever window extraction or resampling changes what ends up in the arrays
+PREPROCESSING_VERSION = 2
+
+CACHE_DIR = 'windowCache/'
+
+BATCH_FIELDS = list(window_batch._fields)
+
+
+def source_signature(record, data_dir=None):
+    """
+    size and mtime of every source file of a record, or 'physiobank' when read remotely.
+    """
+    if data_dir is None:
+        return 'physiobank'
+    signature = {}
+    for extension in ('.dat', '.hea', '.atr'):
+        filename = data_dir + str(record) + extension
+        if os.path.exists(filename):
+            stat = os.stat(filename)
+            signature[extension] = [stat.st_size, stat.st_mtime]
+    return signature
+
+
+def entry_path(cache_dir, prefix, parameters):
+    """
+    cache directory of the entry for these parameters.
+    """
+    digest = hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_dir, '%s_%s' % (prefix, digest[:16]))
+
+
+def read_entry(path, sources, mmap_mode='r'):
+    """
+    memory-maps an entry, or returns None when it is missing or its sources changed.
+    """
+    try:
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if meta['sources'] != sources:
+        return None
+    return window_batch(*[np.load(os.path.join(path, field + '.npy'), mmap_mode=mmap_mode)
+                          for field in BATCH_FIELDS])
+
+
+def open_entry(path):
+    """
+    empty directory next to an entry's final place to write it in.
+    """
+    temporary_path = path + '.tmp%d' % os.getpid()
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    return temporary_path
+
+
+def close_entry(temporary_path, path, parameters, sources):
+    """
+    writes meta.json last, since an entry without it is never read, and renames the entry
+    into place so readers never see half of one.
+    """
+    with open(os.path.join(temporary_path, 'meta.json'), 'w') as meta_file:
+        json.dump({'parameters': parameters, 'sources': sources}, meta_file)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temporary_path, path)
+
+
+def write_entry(path, batch, parameters, sources):
+    """
+    saves every array of a window_batch as one entry.
+    """
+    temporary_path = open_entry(path)
+    for field in BATCH_FIELDS:
+        np.save(os.path.join(temporary_path, field + '.npy'), getattr(batch, field))
+    close_entry(temporary_path, path, parameters, sources)
+
+
+def resample_windows(windows, fs, fs_out, method='polyphase'):
+    """
+    resamples every window along the time axis from fs to fs_out.
+    """
+    if fs_out is None or fs_out == fs:
+        return windows
+    return resample(windows, fs, fs_out, axis=1, method=method)
+
+
+def window_parameters(sec, channels, fs, fs_out, labels, default_label, drop_unlabeled, dtype,
+                      resample_method):
+    return {'sec': sec,
+            'channels': list(channels),
+            'fs': fs,
+            'fs_out': fs_out,
+            'resample_method': resample_method if fs_out not in (None, fs) else None,
+            'labels': sorted(labels.items()),
+            'default_label': default_label,
+            'drop_unlabeled': drop_unlabeled,
+            'dtype': np.dtype(dtype).str,
+            'version': PREPROCESSING_VERSION}
+
+
+def record_windows(record, sec=5, channels=(1,), fs_out=None, labels=PVC_LABELS,
+                   default_label=0, drop_unlabeled=False, dtype=np.float32,
+                   data_dir=None, pb_dir='mitdb', fs=MITBIH_FS, cache_dir=CACHE_DIR,
+                   mmap_mode='r', resample_method='polyphase'):
+    """
+    windows of one record as a memory-mapped window_batch, built and cached on first use.
+    parameter: as in build_windows, plus
+               fs_out: sampling frequency to resample windows to (None keeps fs)
+               resample_method: 'polyphase' or 'fft', see processing_components.resample
+               cache_dir: where entries are kept
+               mmap_mode: passed to numpy.load, None reads the arrays into memory
+    """
+    parameters = window_parameters(sec, channels, fs, fs_out, labels, default_label,
+                                   drop_unlabeled, dtype, resample_method)
+    parameters['record'] = int(record)
+    sources = source_signature(record, data_dir)
+    path = entry_path(cache_dir, 'record_%s' % record, parameters)
+
+    batch = read_entry(path, sources, mmap_mode)
+    if batch is None:
+        batch = build_windows([record], (sec,), channels, labels, default_label,
+                              drop_unlabeled, dtype, data_dir, pb_dir, fs)[sec]
+        windows = resample_windows(batch.windows, fs, fs_out, resample_method)
+        batch = batch._replace(windows=windows.astype(dtype))
+        write_entry(path, batch, parameters, sources)
+        batch = read_entry(path, sources, mmap_mode)
+    return batch
+
+
+def training_windows(records=NAMELIST, sec=5, channels=(1,), fs_out=None, labels=PVC_LABELS,
+                     default_label=0, drop_unlabeled=False, dtype=np.float32,
+                     data_dir=None, pb_dir='mitdb', fs=MITBIH_FS, cache_dir=CACHE_DIR,
+                     mmap_mode='r', resample_method='polyphase', dbg=False):
+    """
+    windows of every record in records as one memory-mapped window_batch.
+    The combined set is an entry of its own, so a warm start only maps five files; on a
+    miss it is stitched together from the per-record entries one record at a time.
+    """
+    parameters = window_parameters(sec, channels, fs, fs_out, labels, default_label,
+                                   drop_unlabeled, dtype, resample_method)
+    parameters['records'] = [int(record) for record in records]
+    sources = dict((str(record), source_signature(record, data_dir)) for record in records)
+    path = entry_path(cache_dir, 'records_%d' % len(records), parameters)
+
+    batch = read_entry(path, sources, mmap_mode)
+    if batch is not None:
+        return batch
+
+    parts = [record_windows(record, sec, channels, fs_out, labels, default_label,
+                            drop_unlabeled, dtype, data_dir, pb_dir, fs, cache_dir,
+                            resample_method=resample_method)
+             for record in records]
+
+    # stream the parts into preallocated .npy files instead of concatenating in memory
+    temporary_path = open_entry(path)
+    n_beats = sum(len(part.labels) for part in parts)
+    for field in BATCH_FIELDS:
+        first = getattr(parts[0], field)
+        dtype = np.result_type(*[getattr(part, field).dtype for part in parts])
+        array = np.lib.format.open_memmap(os.path.join(temporary_path, field + '.npy'), mode='w+',
+                                          dtype=dtype, shape=(n_beats,) + first.shape[1:])
+        offset = 0
+        for part in parts:
+            values = getattr(part, field)
+            array[offset:offset + len(values)] = values
+            offset += len(values)
+        array.flush()
+        del array
+    close_entry(temporary_path, path, parameters, sources)
+
+    if dbg:
+        print(n_beats, 'windows cached in', path)
+    return read_entry(path, sources, mmap_mode)
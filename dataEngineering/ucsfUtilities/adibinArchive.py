@@ -0,0 +1,366 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import struct\
+    , json\
+    , zlib\
+    , os\
+    , numpy
+
+from parseCsv import map_channels\
+    , data_names\
+    , ScaledChannel
+
+
+'''
+********************************************************************************
+Archive Layout
+********************************************************************************
+
+An archive (.adiarc) holds many alarms back to back so that a whole admission
+is one file instead of one .adibin per alarm.
+
+    file header   'ADIA' + version                         (ARCHIVE_HEADER)
+    record        'ALRM' kind json_len blob_len crc32      (RECORD_HEADER)
+                  json {"key": [admission, alarm_id, time], "meta": {...}}
+                  blob, 8 byte aligned
+    record        ...
+    index         json list of every record header, with blob offsets
+    trailer       index_offset index_len 'AIDX'            (ARCHIVE_TRAILER)
+
+Record kinds:
+    'adibin'  the blob is a complete .adibin file
+    'raw'     the blob is a C-ordered (channels, samples) int16 block, and
+              the channel titles, units and scales live in the json meta
+
+Records are only ever appended. Reopening an archive for appending drops the
+old index and a new one is written on close. If a run dies before the index is
+written, the records are recovered by scanning them from the start.
+
+'''
+
+ARCHIVE_MAGIC = b'ADIA'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<4sI')
+
+RECORD_MAGIC = b'ALRM'
+RECORD_HEADER = struct.Struct('<4sBIQI')
+
+TRAILER_MAGIC = b'AIDX'
+ARCHIVE_TRAILER = struct.Struct('<QQ4s')
+
+RECORD_KINDS = {0: 'adibin', 1: 'raw'}
+RECORD_KIND_CODES = {'adibin': 0, 'raw': 1}
+
+ARCHIVE_EXTENSION = '.adiarc'
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Read Archive Index Function
+********************************************************************************
+'''
+
+def readArchiveIndex(archive_file):
+
+    # Returns (entries, data_end). entries is a list of index entries in file
+    #  order, data_end is where the next record would go.
+    archive_file.seek(0, os.SEEK_END)
+    file_size = archive_file.tell()
+
+    archive_file.seek(0)
+    magic, version = ARCHIVE_HEADER.unpack(archive_file.read(ARCHIVE_HEADER.size))
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError("not an alarm archive")
+
+    # Fast path: the index in the footer
+    if file_size >= ARCHIVE_HEADER.size + ARCHIVE_TRAILER.size:
+        archive_file.seek(file_size - ARCHIVE_TRAILER.size)
+        index_offset, index_length, magic = \
+            ARCHIVE_TRAILER.unpack(archive_file.read(ARCHIVE_TRAILER.size))
+        if magic == TRAILER_MAGIC \
+           and index_offset + index_length + ARCHIVE_TRAILER.size == file_size:
+            archive_file.seek(index_offset)
+            entries = json.loads(archive_file.read(index_length).decode())
+            return entries, index_offset
+
+    # Slow path: no intact footer, scan the records themselves
+    entries = []
+    position = ARCHIVE_HEADER.size
+    while position + RECORD_HEADER.size <= file_size:
+        archive_file.seek(position)
+        magic, kind, json_length, blob_length, crc = \
+            RECORD_HEADER.unpack(archive_file.read(RECORD_HEADER.size))
+        blob_offset = position + RECORD_HEADER.size + json_length
+        if magic != RECORD_MAGIC or blob_offset + blob_length > file_size:
+            break
+        record_json = json.loads(archive_file.read(json_length).decode())
+        entries.append({'key': record_json['key']
+                        , 'kind': RECORD_KINDS[kind]
+                        , 'offset': blob_offset
+                        , 'length': blob_length
+                        , 'crc32': crc
+                        , 'meta': record_json['meta']
+                        })
+        position = blob_offset + blob_length
+
+    return entries, position
+
+
+'''
+********************************************************************************
+Alarm Archive Class
+********************************************************************************
+'''
+
+class AlarmArchive(object):
+    """Append-only container of many alarms. Open with mode 'r' to read, 'w'
+    to start a new archive or 'a' to append to an existing one. Keys are
+    (admission_id, alarm_id, time_since_admission) tuples; when a key is
+    appended twice the later record wins."""
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+
+        if mode == 'w' or (mode == 'a' and not os.path.exists(path)):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.archive_file = open(path, 'w+b')
+            self.archive_file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+            self.entries = []
+            self.data_end = ARCHIVE_HEADER.size
+        elif mode in ('a', 'r'):
+            self.archive_file = open(path, 'r+b' if mode == 'a' else 'rb')
+            self.entries, self.data_end = readArchiveIndex(self.archive_file)
+        else:
+            raise ValueError("mode must be 'r', 'w' or 'a'")
+
+        # Drop the old footer (or a torn record) before appending
+        if mode == 'a':
+            self.archive_file.truncate(self.data_end)
+
+        self.index = dict((tuple(entry['key']), entry) for entry in self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return tuple(key) in self.index
+
+    def keys(self):
+        """Keys in the order their current records were written."""
+        return [tuple(entry['key']) for entry in self.entries
+                if self.index[tuple(entry['key'])] is entry]
+
+    def close(self):
+        if self.archive_file is None:
+            return
+        if self.mode != 'r':
+            index_bytes = json.dumps(self.entries).encode()
+            self.archive_file.seek(self.data_end)
+            self.archive_file.write(index_bytes)
+            self.archive_file.write(ARCHIVE_TRAILER.pack(self.data_end
+                                                         , len(index_bytes)
+                                                         , TRAILER_MAGIC))
+            self.archive_file.truncate()
+        self.archive_file.close()
+        self.archive_file = None
+
+    # param blob_parts: buffers that together make up the record blob
+    def _append(self, key, kind, blob_parts, meta):
+        key = [str(part) for part in key]
+        blob_length = sum(len(part) for part in blob_parts)
+        crc = 0
+        for part in blob_parts:
+            crc = zlib.crc32(part, crc)
+
+        # Pad the json with spaces so the blob starts 8 byte aligned
+        record_json = json.dumps({'key': key, 'meta': meta}).encode()
+        unpadded = self.data_end + RECORD_HEADER.size + len(record_json)
+        record_json += b' ' * (-unpadded % 8)
+        blob_offset = self.data_end + RECORD_HEADER.size + len(record_json)
+
+        self.archive_file.seek(self.data_end)
+        self.archive_file.write(RECORD_HEADER.pack(RECORD_MAGIC
+                                                   , RECORD_KIND_CODES[kind]
+                                                   , len(record_json)
+                                                   , blob_length
+                                                   , crc))
+        self.archive_file.write(record_json)
+        for part in blob_parts:
+            self.archive_file.write(part)
+
+        entry = {'key': key
+                 , 'kind': kind
+                 , 'offset': blob_offset
+                 , 'length': blob_length
+                 , 'crc32': crc
+                 , 'meta': meta
+                 }
+        self.entries.append(entry)
+        self.index[tuple(key)] = entry
+        self.data_end = blob_offset + blob_length
+        return entry
+
+    # param adibin_data: dict of packed buffers from createAdibin
+    def appendAdibin(self, key, adibin_data):
+        """Appends an alarm as a complete .adibin blob."""
+        return self._append(key, 'adibin', [adibin_data['file_header']
+                                            , adibin_data['channel_headers']
+                                            , adibin_data['channel_data']], {})
+
+    # param csv_data: dict from parseCsv
+    def appendRaw(self, key, csv_data):
+        """Appends an alarm as a raw (channels, samples) int16 block."""
+        from csvToAdibin import ADI_CHANNEL_UNITS, ADI_CHANNEL_SCALES
+
+        channel_titles = list(csv_data['channel_titles'])
+        meta = {'channel_titles': channel_titles
+                , 'units': [ADI_CHANNEL_UNITS[title].decode() for title in channel_titles]
+                , 'scales': [ADI_CHANNEL_SCALES[title] for title in channel_titles]
+                , 'samples_per_channel': csv_data['samples_per_channel']
+                }
+
+        # Same int16 range rule as the adibin encoder
+        channel_data = numpy.asarray(csv_data['channel_data'])
+        channel_data = channel_data[:, :csv_data['samples_per_channel']]
+        if channel_data.size > 0 and (channel_data.min() < -32768
+                                      or channel_data.max() > 32767):
+            raise struct.error("short format requires -32768 <= number <= 32767")
+        block = numpy.ascontiguousarray(channel_data, dtype='<i2')
+
+        return self._append(key, 'raw', [memoryview(block).cast('B')], meta)
+
+    def extend(self, other_path):
+        """Appends every current record of another archive, in its order."""
+        with AlarmArchive(other_path) as other:
+            for key in other.keys():
+                entry = other.index[key]
+                other.archive_file.seek(entry['offset'])
+                blob = other.archive_file.read(entry['length'])
+                self._append(key, entry['kind'], [blob], entry['meta'])
+
+    def readBlob(self, key):
+        """Returns the alarm as .adibin bytes, rebuilding raw records."""
+        entry = self.index[tuple(key)]
+        if entry['kind'] == 'adibin':
+            self.archive_file.seek(entry['offset'])
+            return self.archive_file.read(entry['length'])
+
+        from csvToAdibin import createAdibin
+        channel_data = self._mapRaw(entry)
+        adibin_data = createAdibin({'alarm_id': entry['key'][1]
+                                    , 'time_since_admission': entry['key'][2]
+                                    , 'num_channels': len(entry['meta']['channel_titles'])
+                                    , 'channel_titles': entry['meta']['channel_titles']
+                                    , 'channel_data': channel_data
+                                    , 'samples_per_channel': entry['meta']['samples_per_channel']
+                                    })
+        return bytes(adibin_data['file_header']) \
+            + bytes(adibin_data['channel_headers']) \
+            + bytes(adibin_data['channel_data'])
+
+    def verify(self, key):
+        """True if the stored blob still matches its crc32."""
+        entry = self.index[tuple(key)]
+        self.archive_file.seek(entry['offset'])
+        return zlib.crc32(self.archive_file.read(entry['length'])) == entry['crc32']
+
+    def _mapRaw(self, entry):
+        num_channels = len(entry['meta']['channel_titles'])
+        samples_per_channel = entry['meta']['samples_per_channel']
+        if num_channels * samples_per_channel == 0:
+            return numpy.zeros((num_channels, samples_per_channel), '<i2')
+        return numpy.memmap(self.path, dtype='<i2', mode='r'
+                            , offset=entry['offset']
+                            , shape=(num_channels, samples_per_channel))
+
+    def mapAlarm(self, key, physical=False):
+        """Memory-maps one alarm. Returns the same list of channel dicts as
+        parseCsv.map_channels; nothing is read until it is indexed."""
+        entry = self.index[tuple(key)]
+        if entry['kind'] == 'adibin':
+            return map_channels(self.path, physical=physical, base=entry['offset'])
+
+        channel_data = self._mapRaw(entry)
+        channels = []
+        for channel_num, title in enumerate(entry['meta']['channel_titles']):
+            scale = entry['meta']['scales'][channel_num]
+            data = channel_data[channel_num]
+            if physical:
+                data = ScaledChannel(data, scale, 0.0)
+            channels.append(dict(zip(data_names, [channel_num
+                                                  , title
+                                                  , entry['meta']['units'][channel_num]
+                                                  , scale
+                                                  , 0.0
+                                                  , 1.0
+                                                  , 0.0
+                                                  , data])))
+        return channels
+
+    def iterAlarms(self, physical=False):
+        """Streams (key, channels) for every alarm in file order."""
+        for key in self.keys():
+            yield key, self.mapAlarm(key, physical)
+
+
+'''
+********************************************************************************
+Export ADIBIN Files Function
+********************************************************************************
+'''
+
+def exportAdibins(archive_path, output_directory, dbg=False):
+
+    # Writes every alarm back out as its own .adibin, named as writeAdibin
+    #  names them: <admission_id>_<alarm_id>_<time_since_admission>.adibin
+    filenames = []
+    with AlarmArchive(archive_path) as archive:
+        for key in archive.keys():
+            filename = output_directory + "_".join(key) + ".adibin"
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+            with open(filename + ".tmp", 'wb') as adibin_file:
+                adibin_file.write(archive.readBlob(key))
+            os.replace(filename + ".tmp", filename)
+            filenames.append(filename)
+            if dbg == True:
+                print("Writing:", filename)
+
+    return filenames
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) == 3:
+        exportAdibins(sys.argv[1], sys.argv[2], dbg=True)
+    elif len(sys.argv) == 2:
+        with AlarmArchive(sys.argv[1]) as archive:
+            for key in archive.keys():
+                entry = archive.index[key]
+                print("_".join(key), entry['kind'], entry['offset'], entry['length'])
+    else:
+        print('Usage: python3 adibinArchive.py <archive.adiarc> [export_directory/]')
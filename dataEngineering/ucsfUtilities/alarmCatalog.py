@@ -0,0 +1,344 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import sqlite3\
+    , json\
+    , glob\
+    , os\
+    , collections
+
+from parseCsv import read_headers\
+    , map_channels
+from adibinArchive import AlarmArchive\
+    , ARCHIVE_EXTENSION
+
+
+'''
+********************************************************************************
+Catalog Schema
+********************************************************************************
+'''
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS alarms
+    (id INTEGER PRIMARY KEY
+    , admission_id TEXT NOT NULL
+    , alarm_id TEXT NOT NULL
+    , time_since_admission TEXT NOT NULL
+    , num_channels INTEGER
+    , channel_titles TEXT
+    , units TEXT
+    , scales TEXT
+    , samples_per_channel INTEGER
+    , secs_per_tick REAL
+    , duration REAL
+    , storage TEXT
+    , output_path TEXT
+    , archive_offset INTEGER
+    , size INTEGER
+    , UNIQUE (admission_id, alarm_id, time_since_admission)
+    );
+CREATE TABLE IF NOT EXISTS alarm_channels
+    (title TEXT NOT NULL
+    , alarm INTEGER NOT NULL REFERENCES alarms (id) ON DELETE CASCADE
+    , PRIMARY KEY (title, alarm)
+    ) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alarms_duration ON alarms (duration);
+CREATE INDEX IF NOT EXISTS alarms_alarm_id ON alarms (alarm_id);
+CREATE INDEX IF NOT EXISTS alarm_channels_alarm ON alarm_channels (alarm);
+'''
+
+# One matching alarm. storage is 'adibin' for a standalone .adibin file,
+#  'archive' for an adibin blob inside an archive and 'raw' for a raw int16
+#  block inside an archive; archive_offset is None for standalone files.
+AlarmHandle = collections.namedtuple('AlarmHandle'
+                                     , ['admission_id'
+                                        , 'alarm_id'
+                                        , 'time_since_admission'
+                                        , 'channel_titles'
+                                        , 'samples_per_channel'
+                                        , 'duration'
+                                        , 'storage'
+                                        , 'output_path'
+                                        , 'archive_offset'
+                                        , 'size'
+                                        ])
+
+SECS_PER_TICK = 1/240
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Open Catalog Function
+********************************************************************************
+'''
+
+def openCatalog(catalog_path):
+
+    # The UNIQUE key already indexes admission_id first, so admission
+    #  ranges use it directly
+    os.makedirs(os.path.dirname(os.path.abspath(catalog_path)), exist_ok=True)
+    catalog = sqlite3.connect(catalog_path)
+    catalog.execute('PRAGMA foreign_keys = ON')
+    catalog.execute('PRAGMA journal_mode = WAL')
+    catalog.execute('PRAGMA synchronous = NORMAL')
+    catalog.executescript(CATALOG_SCHEMA)
+
+    return catalog
+
+
+'''
+********************************************************************************
+Add Alarms Function
+********************************************************************************
+'''
+
+def addAlarms(catalog, admission_id, records, replace=False, keep=()):
+
+    # records are dicts with alarm_id, time_since_admission, channel_titles,
+    #  units, scales, samples_per_channel, output, size and optionally
+    #  archive_offset and storage. One transaction per call, later rows
+    #  replace earlier rows with the same key. With replace, every other
+    #  alarm of admission_id is deleted first, except the
+    #  (alarm_id, time_since_admission) keys in keep.
+    with catalog:
+        if replace:
+            keep = set(keep)
+            catalog.executemany('DELETE FROM alarms WHERE id = ?'
+                                , [(alarm,) for alarm, alarm_id, time_since_admission
+                                   in catalog.execute('''SELECT id
+                                                         , alarm_id
+                                                         , time_since_admission
+                                                         FROM alarms
+                                                         WHERE admission_id = ?'''
+                                                      , (admission_id,)).fetchall()
+                                   if (alarm_id, time_since_admission) not in keep])
+        for record in records:
+            samples_per_channel = record['samples_per_channel']
+            secs_per_tick = record.get('secs_per_tick', SECS_PER_TICK)
+            if record.get('archive_offset') is None:
+                storage = record.get('storage', 'adibin')
+            else:
+                storage = record.get('storage', 'archive')
+            catalog.execute('''DELETE FROM alarms
+                               WHERE admission_id = ?
+                               AND alarm_id = ?
+                               AND time_since_admission = ?'''
+                            , (admission_id
+                               , record['alarm_id']
+                               , record['time_since_admission']))
+            alarm = catalog.execute('''INSERT INTO alarms
+                                       (admission_id
+                                       , alarm_id
+                                       , time_since_admission
+                                       , num_channels
+                                       , channel_titles
+                                       , units
+                                       , scales
+                                       , samples_per_channel
+                                       , secs_per_tick
+                                       , duration
+                                       , storage
+                                       , output_path
+                                       , archive_offset
+                                       , size)
+                                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+                                    , (admission_id
+                                       , record['alarm_id']
+                                       , record['time_since_admission']
+                                       , len(record['channel_titles'])
+                                       , json.dumps(list(record['channel_titles']))
+                                       , json.dumps(list(record['units']))
+                                       , json.dumps(list(record['scales']))
+                                       , samples_per_channel
+                                       , secs_per_tick
+                                       , samples_per_channel * secs_per_tick
+                                       , storage
+                                       , record['output']
+                                       , record.get('archive_offset')
+                                       , record['size']
+                                       )).lastrowid
+            catalog.executemany('''INSERT OR IGNORE INTO alarm_channels
+                                   VALUES (?, ?)'''
+                                , [(title, alarm) for title in record['channel_titles']])
+
+
+'''
+********************************************************************************
+Find Alarms Function
+********************************************************************************
+'''
+
+def findAlarms(catalog, channels=(), min_duration=None, max_duration=None
+               , admission_from=None, admission_to=None, alarm_ids=None
+               , limit=None):
+
+    # Every alarm that has all of channels, lasts between min_duration and
+    #  max_duration seconds, and whose admission_id is in
+    #  [admission_from, admission_to]. Returns a list of AlarmHandles.
+    conditions = []
+    parameters = []
+
+    for title in channels:
+        conditions.append('''EXISTS (SELECT 1 FROM alarm_channels
+                                   WHERE title = ? AND alarm = alarms.id)''')
+        parameters.append(title.upper())
+    if min_duration is not None:
+        conditions.append('duration >= ?')
+        parameters.append(min_duration)
+    if max_duration is not None:
+        conditions.append('duration <= ?')
+        parameters.append(max_duration)
+    if admission_from is not None:
+        conditions.append('admission_id >= ?')
+        parameters.append(admission_from)
+    if admission_to is not None:
+        conditions.append('admission_id <= ?')
+        parameters.append(admission_to)
+    if alarm_ids is not None:
+        alarm_ids = list(alarm_ids)
+        conditions.append('alarm_id IN (' + ', '.join('?' * len(alarm_ids)) + ')')
+        parameters.extend(alarm_ids)
+
+    query = '''SELECT admission_id
+                      , alarm_id
+                      , time_since_admission
+                      , channel_titles
+                      , samples_per_channel
+                      , duration
+                      , storage
+                      , output_path
+                      , archive_offset
+                      , size
+               FROM alarms'''
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY admission_id, alarm_id, time_since_admission'
+    if limit is not None:
+        query += ' LIMIT %d' % limit
+
+    return [AlarmHandle(*(row[:3] + (json.loads(row[3]),) + row[4:]))
+            for row in catalog.execute(query, parameters)]
+
+
+'''
+********************************************************************************
+Open Alarm Function
+********************************************************************************
+'''
+
+def openAlarm(handle, physical=False):
+
+    # Memory-maps the alarm behind a handle, wherever it is stored
+    if handle.storage == 'raw':
+        with AlarmArchive(handle.output_path) as archive:
+            return archive.mapAlarm((handle.admission_id
+                                     , handle.alarm_id
+                                     , handle.time_since_admission)
+                                    , physical)
+
+    return map_channels(handle.output_path, physical=physical
+                        , base=handle.archive_offset or 0)
+
+
+'''
+********************************************************************************
+Catalog Existing Outputs Function
+********************************************************************************
+'''
+
+def catalogDirectory(catalog, adibin_directory_path):
+
+    # Backfills the catalog from .adibin files and archives that already
+    #  exist, reading only their headers
+    records = collections.defaultdict(list)
+
+    for filename in glob.glob(adibin_directory_path + '*.adibin'):
+        admission_id, alarm_id, time_since_admission = \
+            os.path.basename(filename)[:-len('.adibin')].rsplit('_', 2)
+        with open(filename, 'rb') as adibin_file:
+            file_header, channel_headers, data_offset = read_headers(adibin_file)
+        records[admission_id].append({'alarm_id': alarm_id
+                                      , 'time_since_admission': time_since_admission
+                                      , 'channel_titles': [c[1] for c in channel_headers]
+                                      , 'units': [c[2] for c in channel_headers]
+                                      , 'scales': [c[3] for c in channel_headers]
+                                      , 'samples_per_channel': file_header['SamplesPerChannel']
+                                      , 'secs_per_tick': file_header['SecsPerTick']
+                                      , 'output': filename
+                                      , 'size': os.path.getsize(filename)
+                                      })
+
+    for filename in glob.glob(adibin_directory_path + '*' + ARCHIVE_EXTENSION):
+        with AlarmArchive(filename) as archive:
+            for key in archive.keys():
+                entry = archive.index[key]
+                if entry['kind'] != 'adibin':
+                    meta = entry['meta']
+                    records[key[0]].append({'alarm_id': key[1]
+                                            , 'time_since_admission': key[2]
+                                            , 'channel_titles': meta['channel_titles']
+                                            , 'units': meta['units']
+                                            , 'scales': meta['scales']
+                                            , 'samples_per_channel': meta['samples_per_channel']
+                                            , 'storage': 'raw'
+                                            , 'output': filename
+                                            , 'archive_offset': entry['offset']
+                                            , 'size': entry['length']
+                                            })
+                    continue
+                archive.archive_file.seek(entry['offset'])
+                file_header, channel_headers, data_offset = \
+                    read_headers(archive.archive_file, entry['offset'])
+                records[key[0]].append({'alarm_id': key[1]
+                                        , 'time_since_admission': key[2]
+                                        , 'channel_titles': [c[1] for c in channel_headers]
+                                        , 'units': [c[2] for c in channel_headers]
+                                        , 'scales': [c[3] for c in channel_headers]
+                                        , 'samples_per_channel': file_header['SamplesPerChannel']
+                                        , 'secs_per_tick': file_header['SecsPerTick']
+                                        , 'output': filename
+                                        , 'archive_offset': entry['offset']
+                                        , 'size': entry['length']
+                                        })
+
+    for admission_id in records:
+        addAlarms(catalog, admission_id, records[admission_id])
+
+    return sum(len(alarms) for alarms in records.values())
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    import sys, time
+
+    if len(sys.argv) < 2:
+        print('Usage: python3 alarmCatalog.py <catalog.sqlite> [CHANNEL ...]'
+              ' [--backfill adibin_directory/]')
+        sys.exit(1)
+
+    catalog = openCatalog(sys.argv[1])
+    if len(sys.argv) == 4 and sys.argv[2] == '--backfill':
+        print(catalogDirectory(catalog, sys.argv[3]), "alarms cataloged")
+    else:
+        start_time = time.time()
+        handles = findAlarms(catalog, channels=sys.argv[2:])
+        end_time = time.time()
+        for handle in handles:
+            print(handle)
+        print("%d alarms in %.1f ms" % (len(handles), 1000 * (end_time - start_time)))
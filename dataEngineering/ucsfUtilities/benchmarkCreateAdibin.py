@@ -0,0 +1,168 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import struct\
+    , time\
+    , random\
+    , numpy
+
+from csvToAdibin import createAdibin\
+    , FILE_HEADER_LENGTH\
+    , CHANNEL_HEADER_LENGTH\
+    , ADI_FILE_HEADER_FORMAT_STRING\
+    , ADI_CHANNEL_HEADER_FORMAT_STRING\
+    , ADI_CHANNEL_UNITS\
+    , ADI_CHANNEL_SCALES
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Legacy Create ADIBIN Function
+********************************************************************************
+'''
+
+def createAdibinLegacy(data_dict):
+
+    # Reference copy of the original per-sample struct packing, kept only to
+    #  check that createAdibin stays byte-identical and to time the speedup
+    num_channels = data_dict['num_channels']
+    samples_per_channel = data_dict['samples_per_channel']
+
+    adibin_header = [b'CFWB', 1, 1/240, 1776, 7, 4, 0, 0, 0, 0
+                     , num_channels, samples_per_channel, 0, 3]
+
+    adibin_channel_headers = []
+    for i in range(num_channels):
+        title = data_dict['channel_titles'][i]
+        adibin_channel_headers.append(title.encode('utf-8'))
+        adibin_channel_headers.append(ADI_CHANNEL_UNITS[title])
+        adibin_channel_headers.append(ADI_CHANNEL_SCALES[title])
+        adibin_channel_headers.append(0)
+        adibin_channel_headers.append(1)
+        adibin_channel_headers.append(0)
+
+    adibin_channel_data = []
+    for j in range(samples_per_channel):
+        for i in range(num_channels):
+            adibin_channel_data.append(data_dict['channel_data'][i][j])
+
+    file_header_buffer = bytearray(FILE_HEADER_LENGTH)
+    struct.pack_into(ADI_FILE_HEADER_FORMAT_STRING
+                     , file_header_buffer
+                     , 0
+                     , *adibin_header
+                     )
+
+    channel_headers_format_string = ADI_CHANNEL_HEADER_FORMAT_STRING
+    for i in range(num_channels - 1):
+        channel_headers_format_string += ADI_CHANNEL_HEADER_FORMAT_STRING[1:]
+    channel_headers_buffer = bytearray(num_channels * CHANNEL_HEADER_LENGTH)
+    struct.pack_into(channel_headers_format_string
+                     , channel_headers_buffer
+                     , 0
+                     , *adibin_channel_headers
+                     )
+
+    channel_data_format_string = "<h"
+    for i in range((num_channels * samples_per_channel) - 1):
+        channel_data_format_string += "h"
+    channel_data_buffer = bytearray(struct.calcsize(channel_data_format_string))
+    struct.pack_into(channel_data_format_string
+                     , channel_data_buffer
+                     , 0
+                     , *adibin_channel_data
+                     )
+
+    return {'file_header': file_header_buffer
+            , 'channel_headers': channel_headers_buffer
+            , 'channel_data': channel_data_buffer
+            }
+
+
+'''
+********************************************************************************
+Synthetic Data Dictionary Function
+********************************************************************************
+'''
+
+def makeDataDict(channel_titles, seconds, sampling_rate=240, seed=0):
+
+    # Random int16 range samples shaped like parseCsv output
+    rng = random.Random(seed)
+    samples_per_channel = int(seconds * sampling_rate)
+    channel_data = [[rng.randint(-2048, 2047) for j in range(samples_per_channel)]
+                    for i in range(len(channel_titles))]
+
+    return {'alarm_id': 'benchmark'
+            , 'time_since_admission': '0'
+            , 'num_channels': len(channel_titles)
+            , 'channel_titles': channel_titles
+            , 'channel_data': channel_data
+            , 'samples_per_channel': samples_per_channel
+            }
+
+
+'''
+********************************************************************************
+Benchmark Function
+********************************************************************************
+'''
+
+def benchmarkCreateAdibin(channel_titles, seconds, repeats=3):
+
+    data_dict = makeDataDict(channel_titles, seconds)
+    array_dict = dict(data_dict
+                      , channel_data=numpy.array(data_dict['channel_data']
+                                                 , dtype=numpy.int16))
+
+    # Output must be byte-identical to the legacy encoder
+    legacy = createAdibinLegacy(data_dict)
+    for candidate in (createAdibin(data_dict), createAdibin(array_dict)):
+        for key in ('file_header', 'channel_headers', 'channel_data'):
+            assert bytes(candidate[key]) == bytes(legacy[key]), key
+
+    timings = {}
+    for name, function, argument in (('legacy', createAdibinLegacy, data_dict)
+                                     , ('lists', createAdibin, data_dict)
+                                     , ('array', createAdibin, array_dict)):
+        best = float('inf')
+        for i in range(repeats):
+            start_time = time.perf_counter()
+            function(argument)
+            best = min(best, time.perf_counter() - start_time)
+        timings[name] = best
+
+    return timings
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    channel_titles = ['I', 'II', 'III', 'V', 'SPO2', 'RESP', 'AR1']
+
+    for seconds in (10, 60, 600):
+        timings = benchmarkCreateAdibin(channel_titles, seconds)
+        print("%d channels x %4d s: legacy %.4fs, lists %.4fs (%.1fx)"
+              ", array %.4fs (%.1fx)"
+              % (len(channel_titles)
+                 , seconds
+                 , timings['legacy']
+                 , timings['lists']
+                 , timings['legacy'] / timings['lists']
+                 , timings['array']
+                 , timings['legacy'] / timings['array']
+                 ))
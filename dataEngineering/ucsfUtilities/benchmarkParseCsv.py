@@ -0,0 +1,141 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import json\
+    , base64\
+    , zlib\
+    , random\
+    , time\
+    , tracemalloc\
+    , numpy
+
+from csvToAdibin import parseCsv\
+    , base64ToJson
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Synthetic CSV Row Function
+********************************************************************************
+'''
+
+def makeCsvRow(channel_titles, seconds, sampling_rate=240, mismatch=0, seed=0):
+
+    # [alarm_id, time_since_admission, base64(zlib(json))] like the UCSF export
+    rng = random.Random(seed)
+    samples_per_channel = int(seconds * sampling_rate)
+    channel_json = []
+    for i in range(len(channel_titles)):
+        num_samples = samples_per_channel - (mismatch if i % 2 else 0)
+        channel_json.append({'Label': channel_titles[i].lower()
+                             , 'Text': ','.join(str(rng.randint(-2048, 2047))
+                                                for j in range(num_samples))
+                             })
+
+    zipped_string = base64.b64encode(
+        zlib.compress(json.dumps(channel_json).encode())).decode()
+
+    return ['benchmark', '0', zipped_string]
+
+
+'''
+********************************************************************************
+Legacy Parse CSV Function
+********************************************************************************
+'''
+
+def parseCsvLegacy(csv_row):
+
+    # Reference copy of the original list based channel decode
+    channel_json = base64ToJson(csv_row[2])
+    num_channels = len(channel_json)
+
+    channel_data = []
+    for i in range(num_channels):
+        channel_data.append([int(j) for j in channel_json[i]['Text'].split(',')])
+
+    if all(len(i) == len(channel_data[0]) for i in channel_data):
+        samples_per_channel = len(channel_data[0])
+    else:
+        max_sublist_len = len(max(channel_data, key=len))
+        for i in range (num_channels):
+            len_dif_tuple = (0, max_sublist_len - len(channel_data[i]))
+            channel_data[i] = numpy.pad(channel_data[i]
+                                        , pad_width = len_dif_tuple
+                                       )
+        samples_per_channel = max_sublist_len
+
+    return {'channel_data': channel_data
+            , 'samples_per_channel': samples_per_channel
+            }
+
+
+'''
+********************************************************************************
+Benchmark Function
+********************************************************************************
+'''
+
+def benchmarkParseCsv(csv_row, repeats=5):
+
+    # Both decoders must agree sample for sample
+    legacy = parseCsvLegacy(csv_row)
+    current = parseCsv(csv_row)
+    assert legacy['samples_per_channel'] == current['samples_per_channel']
+    assert numpy.array_equal(numpy.array(legacy['channel_data'])
+                             , current['channel_data'])
+
+    results = {}
+    for name, function in (('legacy', parseCsvLegacy), ('current', parseCsv)):
+
+        # Rows per second, best of repeats
+        best = float('inf')
+        for i in range(repeats):
+            start_time = time.perf_counter()
+            function(csv_row)
+            best = min(best, time.perf_counter() - start_time)
+
+        # Peak bytes allocated while parsing one row
+        tracemalloc.start()
+        function(csv_row)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {'rows_per_second': 1 / best
+                         , 'bytes_per_row': peak_bytes
+                         }
+
+    return results
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    channel_titles = ['I', 'II', 'III', 'V', 'SPO2', 'RESP', 'AR1']
+
+    for seconds, mismatch in ((10, 0), (60, 0), (600, 0), (600, 240)):
+        results = benchmarkParseCsv(makeCsvRow(channel_titles, seconds
+                                               , mismatch=mismatch))
+        print("%d channels x %4d s%s:" % (len(channel_titles)
+                                          , seconds
+                                          , " (mismatched)" if mismatch else ""))
+        for name in ('legacy', 'current'):
+            print("    %-8s %9.1f rows/s %12d bytes allocated/row"
+                  % (name
+                     , results[name]['rows_per_second']
+                     , results[name]['bytes_per_row']
+                     ))
@@ -0,0 +1,299 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import csv\
+    , json\
+    , glob\
+    , os\
+    , random\
+    , resource\
+    , shutil\
+    , tempfile\
+    , time\
+    , multiprocessing
+
+from csvToAdibin import base64ToJson\
+    , parseCsv\
+    , createAdibin\
+    , writeAdibin\
+    , csvToAdibin\
+    , ADI_CHANNEL_UNITS
+from parseCsv import parse_channels
+from benchmarkParseCsv import makeCsvRow
+
+
+'''
+********************************************************************************
+Benchmark Settings
+********************************************************************************
+
+Every stage runs in its own freshly spawned process, so peak_rss_mb is the
+high-water mark of that process only: the interpreter, numpy, the stage's
+untimed setup (its input rows, dicts or files) and the stage itself.
+stage_rss_mb is how far the stage raised that mark above where setup left it,
+so it is 0 when the stage fits in memory setup already touched. MB/s is
+always measured against the source csv bytes of the rows the stage handled, so
+stages can be compared directly.
+
+'''
+
+# Channel sets drawn from the units/scale tables
+CHANNEL_SETS = {'ecg': ['I', 'II', 'III', 'V']
+                , 'bedside': ['I', 'II', 'III', 'V', 'SPO2', 'RESP', 'AR1']
+                , 'all': sorted(ADI_CHANNEL_UNITS)
+                }
+
+STAGES = ['base64ToJson'
+          , 'parseCsv'
+          , 'createAdibin'
+          , 'writeAdibin'
+          , 'parse_channels'
+          , 'end_to_end'
+          ]
+
+# A stage is a regression when its rows/s falls by more than this fraction
+REGRESSION_TOLERANCE = 0.10
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Synthetic CSV Function
+********************************************************************************
+'''
+
+def makeSyntheticCsv(csv_filename, channel_titles, seconds, num_rows
+                     , sampling_rate=240, mismatch=0, mismatch_every=0, seed=0):
+
+    # A UCSF-format csv of num_rows alarms; every mismatch_every-th row has
+    #  every other channel short by mismatch samples
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(csv_filename)), exist_ok=True)
+
+    with open(csv_filename, 'w', newline='') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        for i in range(num_rows):
+            is_mismatched = mismatch_every and i % mismatch_every == 0
+            csv_row = makeCsvRow(channel_titles, seconds, sampling_rate
+                                 , mismatch if is_mismatched else 0
+                                 , rng.getrandbits(32))
+            csv_row[0] = str(1000 + i)
+            csv_row[1] = str(i * seconds * 1000)
+            csv_writer.writerow(csv_row)
+
+    return os.path.getsize(csv_filename)
+
+
+'''
+********************************************************************************
+Stage Functions
+********************************************************************************
+'''
+
+def readRows(csv_filename):
+
+    csv.field_size_limit(2**31 - 1)
+    with open(csv_filename, newline='') as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def runStage(stage, csv_filename, work_directory_path, repeats):
+
+    # Setup is untimed; returns the best of repeats for the stage alone
+    csv_rows = readRows(csv_filename)
+    csv_name = os.path.basename(csv_filename)[:-len('.csv')]
+    out_directory_path = os.path.join(work_directory_path, stage) + os.sep
+
+    if stage in ('createAdibin', 'writeAdibin', 'parse_channels'):
+        data_dicts = [parseCsv(csv_row) for csv_row in csv_rows]
+        for data_dict, csv_row in zip(data_dicts, csv_rows):
+            data_dict['alarm_id'], data_dict['time_since_admission'] = csv_row[:2]
+    if stage in ('writeAdibin', 'parse_channels'):
+        adibin_datas = [createAdibin(data_dict) for data_dict in data_dicts]
+    if stage == 'parse_channels':
+        adibin_filenames = [writeAdibin(adibin_data, csv_name, out_directory_path)
+                            for adibin_data in adibin_datas]
+
+    def base64ToJsonStage():
+        for csv_row in csv_rows:
+            base64ToJson(csv_row[2])
+
+    def parseCsvStage():
+        for csv_row in csv_rows:
+            parseCsv(csv_row)
+
+    def createAdibinStage():
+        for data_dict in data_dicts:
+            createAdibin(data_dict)
+
+    def writeAdibinStage():
+        for adibin_data in adibin_datas:
+            writeAdibin(adibin_data, csv_name, out_directory_path)
+
+    def parseChannelsStage():
+        for adibin_filename in adibin_filenames:
+            with open(adibin_filename, 'rb') as adibin_file:
+                parse_channels(adibin_file)
+
+    def endToEndStage():
+        shutil.rmtree(out_directory_path, ignore_errors=True)
+        csvToAdibin(os.path.dirname(csv_filename) + os.sep, out_directory_path)
+
+    stage_function = {'base64ToJson': base64ToJsonStage
+                      , 'parseCsv': parseCsvStage
+                      , 'createAdibin': createAdibinStage
+                      , 'writeAdibin': writeAdibinStage
+                      , 'parse_channels': parseChannelsStage
+                      , 'end_to_end': endToEndStage
+                      }[stage]
+
+    # ru_maxrss is in kilobytes on linux
+    setup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    best = float('inf')
+    for i in range(repeats):
+        start_time = time.perf_counter()
+        stage_function()
+        best = min(best, time.perf_counter() - start_time)
+
+    shutil.rmtree(out_directory_path, ignore_errors=True)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'seconds': best
+            , 'peak_rss_mb': peak_rss / 1024
+            , 'stage_rss_mb': (peak_rss - setup_rss) / 1024
+            }
+
+
+'''
+********************************************************************************
+Benchmark Function
+********************************************************************************
+'''
+
+def benchmarkPipeline(channel_set='bedside', seconds=60, num_rows=20
+                      , mismatch=0, mismatch_every=0, repeats=3, stages=STAGES
+                      , seed=0):
+
+    channel_titles = CHANNEL_SETS[channel_set]
+    config = {'channel_set': channel_set
+              , 'channel_titles': channel_titles
+              , 'seconds': seconds
+              , 'num_rows': num_rows
+              , 'mismatch': mismatch
+              , 'mismatch_every': mismatch_every
+              , 'repeats': repeats
+              , 'seed': seed
+              }
+
+    work_directory_path = tempfile.mkdtemp(prefix='benchmarkPipeline')
+    try:
+        csv_filename = os.path.join(work_directory_path, 'csv', 'benchmark.csv')
+        csv_bytes = makeSyntheticCsv(csv_filename, channel_titles, seconds, num_rows
+                                     , mismatch=mismatch
+                                     , mismatch_every=mismatch_every
+                                     , seed=seed)
+        config['csv_bytes'] = csv_bytes
+
+        # spawn, not fork, so no stage inherits another's memory high-water mark
+        context = multiprocessing.get_context('spawn')
+        results = {}
+        for stage in stages:
+            with context.Pool(1) as pool:
+                timing = pool.apply(runStage, (stage, csv_filename
+                                               , work_directory_path, repeats))
+            results[stage] = {'rows_per_second': num_rows / timing['seconds']
+                              , 'mb_per_second': csv_bytes / timing['seconds'] / 2**20
+                              , 'seconds': timing['seconds']
+                              , 'peak_rss_mb': timing['peak_rss_mb']
+                              , 'stage_rss_mb': timing['stage_rss_mb']
+                              }
+    finally:
+        shutil.rmtree(work_directory_path, ignore_errors=True)
+
+    return {'config': config, 'stages': results}
+
+
+'''
+********************************************************************************
+Compare To Baseline Function
+********************************************************************************
+'''
+
+def compareToBaseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+
+    # Returns {stage: current/baseline rows/s ratio} for every stage in both,
+    #  and the list of stages that regressed by more than tolerance
+    ratios = {}
+    regressions = []
+    for stage in results['stages']:
+        if stage not in baseline['stages']:
+            continue
+        ratios[stage] = results['stages'][stage]['rows_per_second'] \
+                        / baseline['stages'][stage]['rows_per_second']
+        if ratios[stage] < 1 - tolerance:
+            regressions.append(stage)
+
+    return ratios, regressions
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    import argparse, sys
+
+    parser = argparse.ArgumentParser(description='Benchmark the UCSF csv to adibin pipeline')
+    parser.add_argument('--channels', default='bedside', choices=sorted(CHANNEL_SETS))
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--rows', type=int, default=20)
+    parser.add_argument('--mismatch', type=int, default=0
+                        , help='samples missing from every other channel of a mismatched row')
+    parser.add_argument('--mismatch-every', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--output', default='benchmarkPipeline.json')
+    parser.add_argument('--baseline', help='earlier --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    results = benchmarkPipeline(args.channels, args.seconds, args.rows
+                                , args.mismatch, args.mismatch_every
+                                , args.repeats, args.stages)
+
+    with open(args.output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+    print("%d rows x %d channels x %g s, %.1f MB csv"
+          % (args.rows, len(results['config']['channel_titles'])
+             , args.seconds, results['config']['csv_bytes'] / 2**20))
+    for stage, result in results['stages'].items():
+        print("    %-16s %9.1f rows/s %8.1f MB/s %8.1f MB peak RSS (+%.1f MB in stage)"
+              % (stage
+                 , result['rows_per_second']
+                 , result['mb_per_second']
+                 , result['peak_rss_mb']
+                 , result['stage_rss_mb']
+                 ))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        ratios, regressions = compareToBaseline(results, baseline, args.tolerance)
+        for stage, ratio in ratios.items():
+            print("    %-16s %6.2fx baseline%s"
+                  % (stage, ratio, "  REGRESSION" if stage in regressions else ""))
+        if regressions:
+            sys.exit(1)
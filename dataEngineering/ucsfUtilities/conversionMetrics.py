@@ -0,0 +1,229 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import bisect\
+    , collections\
+    , json\
+    , sys\
+    , time
+
+
+'''
+********************************************************************************
+Metrics Settings
+********************************************************************************
+
+Stage timings go into fixed histogram buckets so snapshots from any number of
+workers merge by adding them up. A snapshot is plain json:
+
+    {"counters": {"rows": ..., "bytes_in": ..., ...},
+     "histograms": {"decompress": {"count": ..., "sum_seconds": ...,
+                                   "max_seconds": ..., "buckets": [...]}, ...}}
+
+buckets[i] counts timings <= HISTOGRAM_BUCKETS[i]; the last bucket is
+everything slower.
+
+'''
+
+# Upper bounds in seconds, 10 us to 10 s
+HISTOGRAM_BUCKETS = [1e-5, 2e-5, 5e-5
+                     , 1e-4, 2e-4, 5e-4
+                     , 1e-3, 2e-3, 5e-3
+                     , 1e-2, 2e-2, 5e-2
+                     , 1e-1, 2e-1, 5e-1
+                     , 1, 2, 5, 10
+                     ]
+
+# Seconds between json lines written by a MetricsEmitter
+EMIT_INTERVAL = 10
+
+
+'''
+********************************************************************************
+*********************************Classes****************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Stage Timer Class
+********************************************************************************
+'''
+
+class StageTimer:
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start_time)
+        return False
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+'''
+********************************************************************************
+Stage Metrics Class
+********************************************************************************
+'''
+
+class StageMetrics:
+
+    enabled = True
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.histograms = {}
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def time(self, stage):
+        return StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = {'count': 0
+                                                  , 'sum_seconds': 0.0
+                                                  , 'max_seconds': 0.0
+                                                  , 'buckets': [0] * (len(HISTOGRAM_BUCKETS) + 1)
+                                                  }
+        histogram['count'] += 1
+        histogram['sum_seconds'] += seconds
+        histogram['max_seconds'] = max(histogram['max_seconds'], seconds)
+        histogram['buckets'][bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        return {'counters': dict(self.counters)
+                , 'histograms': {stage: dict(histogram, buckets=list(histogram['buckets']))
+                                 for stage, histogram in self.histograms.items()}
+                }
+
+    def take(self):
+
+        # Snapshot of everything since the last take, then starts again from
+        #  zero, so a worker can send its progress in pieces that still add up
+        snapshot = self.snapshot()
+        self.counters = collections.Counter()
+        self.histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+
+        # Adds a snapshot from another StageMetrics, e.g. one sent back by a
+        #  worker process
+        if not snapshot:
+            return
+        self.counters.update(snapshot['counters'])
+        for stage, other in snapshot['histograms'].items():
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                self.histograms[stage] = dict(other, buckets=list(other['buckets']))
+                continue
+            histogram['count'] += other['count']
+            histogram['sum_seconds'] += other['sum_seconds']
+            histogram['max_seconds'] = max(histogram['max_seconds'], other['max_seconds'])
+            histogram['buckets'] = [a + b for a, b in zip(histogram['buckets']
+                                                          , other['buckets'])]
+
+
+'''
+********************************************************************************
+Null Metrics Class
+********************************************************************************
+'''
+
+class NullMetrics:
+
+    # Same surface as StageMetrics doing nothing, so instrumented code never
+    #  has to check whether metrics are on
+    enabled = False
+    timer = NullTimer()
+
+    def count(self, name, n=1):
+        pass
+
+    def time(self, stage):
+        return self.timer
+
+    def observe(self, stage, seconds):
+        pass
+
+    def snapshot(self):
+        return None
+
+    def take(self):
+        return None
+
+    def merge(self, snapshot):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+'''
+********************************************************************************
+Metrics Emitter Class
+********************************************************************************
+'''
+
+class MetricsEmitter:
+
+    # Writes one json line per interval to metrics_path ('-' for stdout).
+    #  extra is a dict (e.g. the converter report) copied into every line.
+    def __init__(self, metrics, metrics_path='-', interval=EMIT_INTERVAL, extra=None):
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        self.interval = interval
+        self.extra = extra
+        self.start_time = time.time()
+        self.last_emit_time = self.start_time
+
+    def maybeEmit(self):
+        if time.time() - self.last_emit_time >= self.interval:
+            self.emit()
+
+    def put(self, snapshot):
+
+        # Merges a progress snapshot of work still running, so the emitter
+        #  can be handed to that work directly as its metrics_sink
+        self.metrics.merge(snapshot)
+        self.maybeEmit()
+
+    def emit(self, final=False):
+        now = time.time()
+        self.last_emit_time = now
+        line = dict(self.metrics.snapshot()
+                    , time = now
+                    , elapsed_seconds = now - self.start_time
+                    , final = final
+                    )
+        if self.extra is not None:
+            line.update(self.extra)
+        line = json.dumps(line) + "\n"
+
+        if self.metrics_path == '-':
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        else:
+            with open(self.metrics_path, 'a') as metrics_file:
+                metrics_file.write(line)
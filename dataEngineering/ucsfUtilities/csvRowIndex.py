@@ -0,0 +1,164 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import csv\
+    , json\
+    , locale\
+    , os
+
+from csvToAdibin import base64ToJson\
+    , parseCsv
+
+
+'''
+********************************************************************************
+Row Index Layout
+********************************************************************************
+
+A row index is a json sidecar next to the csv, <name>.csv.rowidx:
+
+    {"source_size": ..., "source_mtime": ...,
+     "rows": [[alarm_id, time_since_admission, byte_offset, byte_length], ...]}
+
+Rows are in file order. An index whose source_size or source_mtime no longer
+matches the csv is stale and is rebuilt on the next lookup.
+
+'''
+
+ROW_INDEX_EXTENSION = '.rowidx'
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Index CSV Function
+********************************************************************************
+'''
+
+def indexCsv(csv_filename, index_filename=None):
+
+    # One pass over the file, reading whole lines but only parsing the two
+    #  identifier fields in front of the payload
+    if index_filename is None:
+        index_filename = csv_filename + ROW_INDEX_EXTENSION
+    encoding = locale.getpreferredencoding(False)
+
+    source_stat = os.stat(csv_filename)
+    rows = []
+    with open(csv_filename, 'rb') as csv_file:
+        position = 0
+        for line in csv_file:
+            if line.strip():
+                identifiers = line.split(b',', 2)
+                identifiers = b','.join(identifiers[:2]).decode(encoding)
+                alarm_id, time_since_admission = next(csv.reader([identifiers]))[:2]
+                rows.append([alarm_id, time_since_admission, position, len(line)])
+            position += len(line)
+
+    row_index = {'source_size': source_stat.st_size
+                 , 'source_mtime': source_stat.st_mtime
+                 , 'rows': rows
+                 }
+
+    with open(index_filename + ".tmp", 'w') as index_file:
+        json.dump(row_index, index_file)
+    os.replace(index_filename + ".tmp", index_filename)
+
+    return row_index
+
+
+'''
+********************************************************************************
+Load Row Index Function
+********************************************************************************
+'''
+
+def loadRowIndex(csv_filename, index_filename=None):
+
+    # Returns {(alarm_id, time_since_admission): (byte_offset, byte_length)},
+    #  (re)building the sidecar when it is missing or stale
+    if index_filename is None:
+        index_filename = csv_filename + ROW_INDEX_EXTENSION
+
+    source_stat = os.stat(csv_filename)
+    try:
+        with open(index_filename) as index_file:
+            row_index = json.load(index_file)
+        if row_index['source_size'] != source_stat.st_size \
+           or row_index['source_mtime'] != source_stat.st_mtime:
+            row_index = indexCsv(csv_filename, index_filename)
+    except (OSError, ValueError, KeyError):
+        row_index = indexCsv(csv_filename, index_filename)
+
+    # Later rows win, as they do when the converter overwrites outputs
+    return dict(((alarm_id, time_since_admission), (offset, length))
+                for alarm_id, time_since_admission, offset, length
+                in row_index['rows'])
+
+
+'''
+********************************************************************************
+Read CSV Row Function
+********************************************************************************
+'''
+
+def readCsvRow(csv_filename, alarm_id, time_since_admission, row_index=None):
+
+    # Seek straight to one row and parse just that line
+    if row_index is None:
+        row_index = loadRowIndex(csv_filename)
+    offset, length = row_index[(str(alarm_id), str(time_since_admission))]
+
+    with open(csv_filename, 'rb') as csv_file:
+        csv_file.seek(offset)
+        line = csv_file.read(length)
+
+    return next(csv.reader([line.decode(locale.getpreferredencoding(False))]))
+
+
+'''
+********************************************************************************
+Load Alarm Functions
+********************************************************************************
+'''
+
+def loadAlarmJson(csv_filename, alarm_id, time_since_admission, row_index=None):
+
+    # The decompressed channel json of one alarm
+    return base64ToJson(readCsvRow(csv_filename, alarm_id, time_since_admission
+                                   , row_index)[2])
+
+
+def loadAlarm(csv_filename, alarm_id, time_since_admission, row_index=None
+              , dbg=False):
+
+    # The parseCsv dict of one alarm
+    return parseCsv(readCsvRow(csv_filename, alarm_id, time_since_admission
+                               , row_index), dbg=dbg)
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) == 2:
+        row_index = indexCsv(sys.argv[1])
+        print(len(row_index['rows']), "rows indexed")
+    elif len(sys.argv) == 4:
+        loadAlarm(sys.argv[1], sys.argv[2], sys.argv[3], dbg=True)
+    else:
+        print('Usage: python3 csvRowIndex.py <file.csv> [alarm_id time_since_admission]')
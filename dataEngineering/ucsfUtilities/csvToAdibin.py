@@ -17,7 +17,20 @@ import struct\
     , sys\
     , time\
     , sqlite3\
-    , pickle
+    , pickle\
+    , locale\
+    , hashlib\
+    , multiprocessing\
+    , concurrent.futures
+
+from adibinArchive import AlarmArchive\
+    , ARCHIVE_EXTENSION
+from alarmCatalog import openCatalog\
+    , addAlarms
+from conversionMetrics import StageMetrics\
+    , MetricsEmitter\
+    , NULL_METRICS\
+    , EMIT_INTERVAL
 
 
 '''
@@ -41,6 +54,145 @@ Relevant Docs
 '''
 
 
+'''
+********************************************************************************
+ADIBIN Constants
+********************************************************************************
+'''
+
+# Define default file size variables for writing adibin file
+FILE_HEADER_LENGTH = 68
+CHANNEL_HEADER_LENGTH = 96
+# CHANNEL_TITLE_LENGTH = 32
+# UNITS_LENGTH = 32
+
+# Define format strings for struct
+ADI_FILE_HEADER_FORMAT_STRING = "<4sldlllllddllll"
+ADI_CHANNEL_HEADER_FORMAT_STRING = "<32s32sdddd"
+
+# Precompiled structs, so headers are packed without reparsing the format
+ADI_FILE_HEADER_STRUCT = struct.Struct(ADI_FILE_HEADER_FORMAT_STRING)
+ADI_CHANNEL_HEADER_STRUCT = struct.Struct(ADI_CHANNEL_HEADER_FORMAT_STRING)
+
+# Files bigger than this are split into row ranges in parallel runs
+CHUNK_BYTES = 256 * 1024 * 1024
+
+# Little-endian sample dtypes for the adibin data formats
+#  1: 8 byte double, 2: 4 byte float, 3: 2 byte int
+ADI_DATA_FORMAT_DTYPES = {1: numpy.dtype('<f8')
+                          , 2: numpy.dtype('<f4')
+                          , 3: numpy.dtype('<i2')
+                          }
+
+# Channel units by channel title
+ADI_CHANNEL_UNITS = {'I':b'mV' \
+                    , 'II':b'mV' \
+                    , 'III':b'mV' \
+                    , 'V':b'mV' \
+                    , 'AVR':b'mV' \
+                    , 'AVL':b'mV' \
+                    , 'AVF':b'mV'  \
+                    , 'SPO2':b'%' \
+                    , 'RR':b'Imp' \
+                    , 'RESP':b'Imp' \
+                    , 'AR1':b'mmHg' \
+                    , 'AR2':b'mmHg' \
+                    , 'AR3':b'mmHg' \
+                    , 'AR4':b'mmHg' \
+                    , 'AR5':b'mmHg' \
+                    , 'AR6':b'mmHg' \
+                    , 'AR7':b'mmHg' \
+                    , 'AR8':b'mmHg' \
+                    , 'CVP1':b'mmHg' \
+                    , 'CVP2':b'mmHg' \
+                    , 'CVP3':b'mmHg' \
+                    , 'CVP4':b'mmHg' \
+                    , 'CVP5':b'mmHg' \
+                    , 'CVP6':b'mmHg' \
+                    , 'CVP7':b'mmHg' \
+                    , 'CVP8':b'mmHg' \
+                    , 'FEM1':b'mmHg' \
+                    , 'FEM2':b'mmHg' \
+                    , 'FEM3':b'mmHg' \
+                    , 'FEM4':b'mmHg' \
+                    , 'FEM5':b'mmHg' \
+                    , 'FEM6':b'mmHg' \
+                    , 'FEM7':b'mmHg' \
+                    , 'FEM8':b'mmHg' \
+                    , 'ICT1':b'mmHg' \
+                    , 'ICT2':b'mmHg' \
+                    , 'ICT3':b'mmHg' \
+                    , 'ICT4':b'mmHg' \
+                    , 'ICT5':b'mmHg' \
+                    , 'ICT6':b'mmHg' \
+                    , 'ICT7':b'mmHg' \
+                    , 'ICT8':b'mmHg' \
+                    , 'PA1':b'mmHg' \
+                    , 'PA2':b'mmHg' \
+                    , 'PA3':b'mmHg' \
+                    , 'PA4':b'mmHg' \
+                    , 'PA5':b'mmHg' \
+                    , 'PA6':b'mmHg' \
+                    , 'PA7':b'mmHg' \
+                    , 'PA8':b'mmHg' \
+                    , '':b'blank' \
+                    }
+
+# Channel scales by channel title
+ADI_CHANNEL_SCALES = {'I': 2.44 \
+                     , 'II': 2.44 \
+                     , 'III': 2.44 \
+                     , 'V': 2.44 \
+                     , 'AVR': 2.44 \
+                     , 'AVL': 2.44 \
+                     , 'AVF': 2.44  \
+                     , 'SPO2': 1.0 \
+                     , 'RR': 0.1 \
+                     , 'RESP': 0.1 \
+                     , 'AR1': 0.2 \
+                     , 'AR2': 0.2 \
+                     , 'AR3': 0.2 \
+                     , 'AR4': 0.2 \
+                     , 'AR5': 0.2 \
+                     , 'AR6': 0.2 \
+                     , 'AR7': 0.2 \
+                     , 'AR8': 0.2 \
+                     , 'CVP1': 0.2 \
+                     , 'CVP2': 0.2 \
+                     , 'CVP3': 0.2 \
+                     , 'CVP4': 0.2 \
+                     , 'CVP5': 0.2 \
+                     , 'CVP6': 0.2 \
+                     , 'CVP7': 0.2 \
+                     , 'CVP8': 0.2 \
+                     , 'FEM1': 0.2 \
+                     , 'FEM2': 0.2 \
+                     , 'FEM3': 0.2 \
+                     , 'FEM4': 0.2 \
+                     , 'FEM5': 0.2 \
+                     , 'FEM6': 0.2 \
+                     , 'FEM7': 0.2 \
+                     , 'FEM8': 0.2 \
+                     , 'ICT1': 0.2 \
+                     , 'ICT2': 0.2 \
+                     , 'ICT3': 0.2 \
+                     , 'ICT4': 0.2 \
+                     , 'ICT5': 0.2 \
+                     , 'ICT6': 0.2 \
+                     , 'ICT7': 0.2 \
+                     , 'ICT8': 0.2 \
+                     , 'PA1': 0.2 \
+                     , 'PA2': 0.2 \
+                     , 'PA3': 0.2 \
+                     , 'PA4': 0.2 \
+                     , 'PA5': 0.2 \
+                     , 'PA6': 0.2 \
+                     , 'PA7': 0.2 \
+                     , 'PA8': 0.2 \
+                     , '': 1.0 \
+                     }
+
+
 '''
 ********************************************************************************
 *********************************Functions**************************************
@@ -54,19 +206,39 @@ Base64 to JSON Function
 ********************************************************************************
 '''
 
-def base64ToJson(zippedString):
-    json_str = zlib.decompress(base64.b64decode(zippedString)).decode()
-    json_json = json.loads(json_str)
+def base64ToJson(zippedString, metrics=NULL_METRICS):
+    with metrics.time('decompress'):
+        json_str = zlib.decompress(base64.b64decode(zippedString)).decode()
+    with metrics.time('json_parse'):
+        json_json = json.loads(json_str)
     return json_json
 
 
+'''
+********************************************************************************
+Decode Samples Function
+********************************************************************************
+'''
+
+def decodeSamples(sample_text, out):
+    
+    # Vectorized parse of "1,-2,3" straight into out, one row of the channel
+    #  array. loadtxt raises ValueError on any value that is not an integer of
+    #  out's dtype, so for int16 this is also the range check
+    if not sample_text.strip():
+        raise ValueError("invalid sample text in channel data")
+    out[...] = numpy.loadtxt([sample_text], delimiter=',', dtype=out.dtype, ndmin=1)
+    
+    return out
+
+
 '''
 ********************************************************************************
 Parse CSV Function
 ********************************************************************************
 '''
 
-def parseCsv(csv_row, dbg=False):
+def parseCsv(csv_row, dbg=False, metrics=NULL_METRICS):
     
     ############################################################################
     # Parse CSV Data
@@ -77,7 +249,7 @@ def parseCsv(csv_row, dbg=False):
     time_since_admission = csv_row[1]
     
     # Decompress channel data
-    channel_json = base64ToJson(csv_row[2])
+    channel_json = base64ToJson(csv_row[2], metrics)
     
     
     ############################################################################
@@ -98,32 +270,41 @@ def parseCsv(csv_row, dbg=False):
     # Parse channel data
     ############################################################################
     
-    # Convert channel data to list
-    channel_data = []
+    # Comma separated sample text for every channel
+    channel_texts = []
     for i in range(num_channels):
-        channel_data.append([int(j) for j in channel_json[i]['Text'].split(',')])
-        
+        channel_texts.append(channel_json[i]['Text'])
     
-    # Check to see if all channels have the same length
-    # If channels are the same length, samples_per_channel set to len element 0
-    # If theres a mismatch, pad other channels with mean and
-    #   set samples_per_channel to max length
+    # Sample count per channel, without parsing anything yet
+    channel_lengths = [text.count(',') + 1 for text in channel_texts]
+    samples_per_channel = max(channel_lengths)
     
-    if all(len(i) == len(channel_data[0]) for i in channel_data):
-        samples_per_channel = len(channel_data[0])
-        if dbg == True:
+    # Check to see if all channels have the same length
+    # If theres a mismatch, shorter channels keep trailing zeros and
+    #   samples_per_channel is set to max length
+    if dbg == True:
+        if all(length == samples_per_channel for length in channel_lengths):
             print("all channel_data sublists equal length")
-    else:
-        max_sublist_len = len(max(channel_data, key=len))
-        for i in range (num_channels):
-            len_dif_tuple = (0, max_sublist_len - len(channel_data[i]))
-            channel_data[i] = numpy.pad(channel_data[i]
-                                        , pad_width = len_dif_tuple
-                                       )
-        samples_per_channel = max_sublist_len
-        if dbg == True:
+        else:
             print("all channel_data sublists NOT equal length\
-                  - padded w/ trailing means")
+                  - padded w/ trailing zeros")
+    
+    # Decode every channel straight into one preallocated, zero padded
+    #  (channels, samples) int16 array
+    with metrics.time('int_decode'):
+        channel_data = numpy.zeros((num_channels, samples_per_channel)
+                                   , dtype=numpy.int16)
+        for i in range(num_channels):
+            try:
+                decodeSamples(channel_texts[i], channel_data[i, :channel_lengths[i]])
+            except ValueError:
+                # Only a row with samples that do not fit an int16 gets a wider
+                #  array, keeping them as they are so createAdibin rejects the
+                #  row the same way struct always has; bad text raises again
+                if channel_data.dtype == numpy.int64:
+                    raise
+                channel_data = channel_data.astype(numpy.int64)
+                decodeSamples(channel_texts[i], channel_data[i, :channel_lengths[i]])
 
 
     ############################################################################
@@ -169,17 +350,6 @@ def createAdibin(data_dict, dbg=False):
     # Define default adibin file header variables
     ############################################################################
     
-    # Define default file size variables for writing adibin file
-    FILE_HEADER_LENGTH = 68
-    CHANNEL_HEADER_LENGTH = 96
-    # CHANNEL_TITLE_LENGTH = 32
-    # UNITS_LENGTH = 32
-    
-    # Define format strings for struct
-    ADI_FILE_HEADER_FORMAT_STRING = "<4sldlllllddllll"
-    ADI_CHANNEL_HEADER_FORMAT_STRING = "<32s32sdddd"
-    ADI_CHANNEL_DATA_FORMAT_STRING = "<h"
-    
     # Define default file header variables
     magic = b'CFWB'
     version = 1
@@ -198,110 +368,7 @@ def createAdibin(data_dict, dbg=False):
     
     # Define default channel header variables
     # channel_title passed in dict
-    units = {'I':b'mV' \
-             , 'II':b'mV' \
-             , 'III':b'mV' \
-             , 'V':b'mV' \
-             , 'AVR':b'mV' \
-             , 'AVL':b'mV' \
-             , 'AVF':b'mV'  \
-             , 'SPO2':b'%' \
-             , 'RR':b'Imp' \
-             , 'RESP':b'Imp' \
-             , 'AR1':b'mmHg' \
-             , 'AR2':b'mmHg' \
-             , 'AR3':b'mmHg' \
-             , 'AR4':b'mmHg' \
-             , 'AR5':b'mmHg' \
-             , 'AR6':b'mmHg' \
-             , 'AR7':b'mmHg' \
-             , 'AR8':b'mmHg' \
-             , 'CVP1':b'mmHg' \
-             , 'CVP2':b'mmHg' \
-             , 'CVP3':b'mmHg' \
-             , 'CVP4':b'mmHg' \
-             , 'CVP5':b'mmHg' \
-             , 'CVP6':b'mmHg' \
-             , 'CVP7':b'mmHg' \
-             , 'CVP8':b'mmHg' \
-             , 'FEM1':b'mmHg' \
-             , 'FEM2':b'mmHg' \
-             , 'FEM3':b'mmHg' \
-             , 'FEM4':b'mmHg' \
-             , 'FEM5':b'mmHg' \
-             , 'FEM6':b'mmHg' \
-             , 'FEM7':b'mmHg' \
-             , 'FEM8':b'mmHg' \
-             , 'ICT1':b'mmHg' \
-             , 'ICT2':b'mmHg' \
-             , 'ICT3':b'mmHg' \
-             , 'ICT4':b'mmHg' \
-             , 'ICT5':b'mmHg' \
-             , 'ICT6':b'mmHg' \
-             , 'ICT7':b'mmHg' \
-             , 'ICT8':b'mmHg' \
-             , 'PA1':b'mmHg' \
-             , 'PA2':b'mmHg' \
-             , 'PA3':b'mmHg' \
-             , 'PA4':b'mmHg' \
-             , 'PA5':b'mmHg' \
-             , 'PA6':b'mmHg' \
-             , 'PA7':b'mmHg' \
-             , 'PA8':b'mmHg' \
-             , '':b'blank' \
-             }
-    scale = {'I': 2.44 \
-             , 'II': 2.44 \
-             , 'III': 2.44 \
-             , 'V': 2.44 \
-             , 'AVR': 2.44 \
-             , 'AVL': 2.44 \
-             , 'AVF': 2.44  \
-             , 'SPO2': 1.0 \
-             , 'RR': 0.1 \
-             , 'RESP': 0.1 \
-             , 'AR1': 0.2 \
-             , 'AR2': 0.2 \
-             , 'AR3': 0.2 \
-             , 'AR4': 0.2 \
-             , 'AR5': 0.2 \
-             , 'AR6': 0.2 \
-             , 'AR7': 0.2 \
-             , 'AR8': 0.2 \
-             , 'CVP1': 0.2 \
-             , 'CVP2': 0.2 \
-             , 'CVP3': 0.2 \
-             , 'CVP4': 0.2 \
-             , 'CVP5': 0.2 \
-             , 'CVP6': 0.2 \
-             , 'CVP7': 0.2 \
-             , 'CVP8': 0.2 \
-             , 'FEM1': 0.2 \
-             , 'FEM2': 0.2 \
-             , 'FEM3': 0.2 \
-             , 'FEM4': 0.2 \
-             , 'FEM5': 0.2 \
-             , 'FEM6': 0.2 \
-             , 'FEM7': 0.2 \
-             , 'FEM8': 0.2 \
-             , 'ICT1': 0.2 \
-             , 'ICT2': 0.2 \
-             , 'ICT3': 0.2 \
-             , 'ICT4': 0.2 \
-             , 'ICT5': 0.2 \
-             , 'ICT6': 0.2 \
-             , 'ICT7': 0.2 \
-             , 'ICT8': 0.2 \
-             , 'PA1': 0.2 \
-             , 'PA2': 0.2 \
-             , 'PA3': 0.2 \
-             , 'PA4': 0.2 \
-             , 'PA5': 0.2 \
-             , 'PA6': 0.2 \
-             , 'PA7': 0.2 \
-             , 'PA8': 0.2 \
-             , '': 1.0 \
-             }
+    # units and scale looked up in ADI_CHANNEL_UNITS and ADI_CHANNEL_SCALES
     offset = 0
     range_high = 1
     range_low = 0
@@ -318,12 +385,12 @@ def createAdibin(data_dict, dbg=False):
     # Channel units
     channel_units = []
     for i in range(data_dict['num_channels']):
-        channel_units.append(units[data_dict['channel_titles'][i]])
+        channel_units.append(ADI_CHANNEL_UNITS[data_dict['channel_titles'][i]])
         
     # Channel scales
     channel_scales = []
     for i in range(data_dict['num_channels']):
-        channel_scales.append(scale[data_dict['channel_titles'][i]])
+        channel_scales.append(ADI_CHANNEL_SCALES[data_dict['channel_titles'][i]])
             
    
     ############################################################################
@@ -336,47 +403,6 @@ def createAdibin(data_dict, dbg=False):
         bin_channel_titles.append(\
                                 data_dict['channel_titles'][i].encode('utf-8'))
     
-    ############################################################################
-    # Append all adibin fields to list of lists
-    ############################################################################
-    
-    # Append file header    
-    adibin_header = []
-    
-    adibin_header.append(magic)
-    adibin_header.append(version)
-    adibin_header.append(secs_per_tick)
-    adibin_header.append(year)
-    adibin_header.append(month)
-    adibin_header.append(day)
-    adibin_header.append(hour)
-    adibin_header.append(minute)
-    adibin_header.append(second)
-    adibin_header.append(trigger)
-    adibin_header.append(data_dict['num_channels'])
-    adibin_header.append(data_dict['samples_per_channel'])
-    adibin_header.append(time_channel)
-    adibin_header.append(data_format)
- 
-    # Append channel headers
-    adibin_channel_headers = []
-
-    for i in range(data_dict['num_channels']):
-        adibin_channel_headers.append(bin_channel_titles[i])
-        adibin_channel_headers.append(channel_units[i])
-        adibin_channel_headers.append(channel_scales[i])
-        adibin_channel_headers.append(offset)
-        adibin_channel_headers.append(range_high)
-        adibin_channel_headers.append(range_low)
-        
-    # Append interleaved channel data
-    adibin_channel_data = []
-    
-    for j in range(data_dict['samples_per_channel']):
-        for i in range(data_dict['num_channels']):
-            adibin_channel_data.append(data_dict['channel_data'][i][j])
-        
-    
     
     ############################################################################
     # Pack adibin data into writable struct buffers
@@ -388,47 +414,49 @@ def createAdibin(data_dict, dbg=False):
     file_header_buffer = bytearray(FILE_HEADER_LENGTH)
     
     # Pack file header
-    struct.pack_into(ADI_FILE_HEADER_FORMAT_STRING
-                     , file_header_buffer
-                     , 0
-                     , *adibin_header
-                     )
+    ADI_FILE_HEADER_STRUCT.pack_into(file_header_buffer
+                                     , 0
+                                     , magic
+                                     , version
+                                     , secs_per_tick
+                                     , year
+                                     , month
+                                     , day
+                                     , hour
+                                     , minute
+                                     , second
+                                     , trigger
+                                     , data_dict['num_channels']
+                                     , data_dict['samples_per_channel']
+                                     , time_channel
+                                     , data_format
+                                     )
 
     ############################################################################
     # Pack channel headers
-    # Create format string of right length for num_channels
-    channel_headers_format_string = ADI_CHANNEL_HEADER_FORMAT_STRING
-    for i in range(data_dict['num_channels'] - 1):
-        channel_headers_format_string += ADI_CHANNEL_HEADER_FORMAT_STRING[1:]
-    
     # Create placeholder buffer of the right size
     channel_headers_buffer = bytearray((data_dict['num_channels']) \
                                        * CHANNEL_HEADER_LENGTH)
     
-    # Pack channel headers
-    struct.pack_into(channel_headers_format_string
-                     , channel_headers_buffer
-                     , 0
-                     , *adibin_channel_headers
-                     )
+    # Pack one channel header at a time at its offset in the buffer
+    for i in range(data_dict['num_channels']):
+        ADI_CHANNEL_HEADER_STRUCT.pack_into(channel_headers_buffer
+                                            , i * CHANNEL_HEADER_LENGTH
+                                            , bin_channel_titles[i]
+                                            , channel_units[i]
+                                            , channel_scales[i]
+                                            , offset
+                                            , range_high
+                                            , range_low
+                                            )
 
     ############################################################################
     # Pack channel data
-    # Create format string to write all the interwoven channel data
-    channel_data_format_string = ADI_CHANNEL_DATA_FORMAT_STRING
-    for i in range(\
-        ((data_dict['num_channels'])*(data_dict['samples_per_channel']))- 1):
-        channel_data_format_string += ADI_CHANNEL_DATA_FORMAT_STRING[1:]
-    
-    # Create placeholder buffer of the right size
-    channel_data_buffer = bytearray(struct.calcsize(channel_data_format_string))
-    
-    # Pack channel data
-    struct.pack_into(channel_data_format_string
-                     , channel_data_buffer
-                     , 0
-                     , *adibin_channel_data
-                     )
+    # Interleave the (channels, samples) data straight into the buffer
+    channel_data_buffer = encodeChannelData(data_dict['channel_data']
+                                            , data_dict['samples_per_channel']
+                                            , data_format
+                                            )
 
     
     ############################################################################
@@ -437,7 +465,7 @@ def createAdibin(data_dict, dbg=False):
     if dbg == True:
         print("channel_units:", channel_units)
         print("channel_scales:", channel_scales)
-        print("adibin_data[0]:", adibin_data[0])
+        print("file_header:", file_header_buffer)
         print('\n')
         
         
@@ -456,13 +484,66 @@ def createAdibin(data_dict, dbg=False):
     return adibin_data
 
 
+'''
+********************************************************************************
+Encode Channel Data Function
+********************************************************************************
+'''
+
+def encodeChannelData(channel_data, samples_per_channel=None, data_format=3):
+    
+    ############################################################################
+    # Coerce channel data to a (channels, samples) array
+    ############################################################################
+    
+    # Accepts a 2D numpy array or a list of equal length per-channel sequences
+    sample_dtype = ADI_DATA_FORMAT_DTYPES[data_format]
+    channel_array = numpy.asarray(channel_data)
+    if channel_array.ndim != 2:
+        raise ValueError("channel_data must be (channels, samples), got shape %s"
+                         % (channel_array.shape,))
+    
+    num_channels, num_samples = channel_array.shape
+    if samples_per_channel is None:
+        samples_per_channel = num_samples
+    elif num_samples < samples_per_channel:
+        raise IndexError("channel_data has %d samples, header says %d"
+                         % (num_samples, samples_per_channel))
+    channel_array = channel_array[:, :samples_per_channel]
+    
+    # struct refuses to pack out of range shorts, so refuse here too instead
+    #  of letting numpy wrap them around silently
+    if data_format == 3 and channel_array.size > 0:
+        if not numpy.issubdtype(channel_array.dtype, numpy.integer):
+            raise struct.error("required argument is not an integer")
+        if channel_array.min() < -32768 or channel_array.max() > 32767:
+            raise struct.error("short format requires -32768 <= number <= 32767")
+    
+    
+    ############################################################################
+    # Interleave samples into the output buffer with one strided copy
+    ############################################################################
+    
+    # Create placeholder buffer of the right size and view it as
+    #  (samples, channels) so that channels are interleaved per sample
+    channel_data_buffer = bytearray(num_channels
+                                    * samples_per_channel
+                                    * sample_dtype.itemsize)
+    interleaved = numpy.frombuffer(channel_data_buffer, dtype=sample_dtype)
+    interleaved = interleaved.reshape(samples_per_channel, num_channels)
+    interleaved[...] = channel_array.T
+    
+    return channel_data_buffer
+
+
 '''
 ********************************************************************************
 Write ADIBIN Function
 ********************************************************************************
 '''
 
-def writeAdibin(adibin_data, csv_filename, output_directory, dbg=False):
+def writeAdibin(adibin_data, csv_filename, output_directory, dbg=False
+                , filename_suffix=''):
     
     # Create output filename
     filename = output_directory \
@@ -478,13 +559,19 @@ def writeAdibin(adibin_data, csv_filename, output_directory, dbg=False):
     
     # Write the returned content to a file in the output directory
     # overwrite previous file without warning
-    with open(filename, 'wb') as adibin_file:
+    # (filename_suffix lets parallel workers stage a file under another name)
+    # Write to a temporary name first so an interrupted run never leaves a
+    #  truncated adibin behind
+    with open(filename + filename_suffix + ".tmp", 'wb') as adibin_file:
         adibin_file.write(adibin_data['file_header'])
         adibin_file.write(adibin_data['channel_headers'])
         adibin_file.write(adibin_data['channel_data'])
+    os.replace(filename + filename_suffix + ".tmp", filename + filename_suffix)
 
     if dbg == True:
-        print("Writing:", filename)
+        print("Writing:", filename + filename_suffix)
+    
+    return filename
 
 
 '''
@@ -493,7 +580,8 @@ Write CSV Row to Pickle
 ********************************************************************************
 '''
 
-def pickleMe(csv_data, csv_filename, output_directory, dbg=False):
+def pickleMe(csv_data, csv_filename, output_directory, dbg=False
+             , filename_suffix=''):
     
     # Create output filename
     filename = output_directory \
@@ -509,11 +597,14 @@ def pickleMe(csv_data, csv_filename, output_directory, dbg=False):
     
     # Write the returned content to a file in the output directory
     # overwrite previous file without warning
-    with open(filename, 'wb') as pickle_file:
+    with open(filename + filename_suffix + ".tmp", 'wb') as pickle_file:
         pickle.dump(csv_data, pickle_file)
+    os.replace(filename + filename_suffix + ".tmp", filename + filename_suffix)
         
     if dbg == True:
-        print("Writing:", filename)
+        print("Writing:", filename + filename_suffix)
+    
+    return filename
 
 
 '''
@@ -548,13 +639,496 @@ def printProgress(current_iteration, total_iterations, fill = '█'):
     sys.stdout.flush()
 
 
+'''
+********************************************************************************
+Split CSV File Function
+********************************************************************************
+'''
+
+def splitCsvFile(csv_filename, chunk_bytes):
+    
+    # Files up to chunk_bytes are converted whole
+    file_size = os.path.getsize(csv_filename)
+    if chunk_bytes is None or file_size <= chunk_bytes:
+        return [None]
+    
+    # Otherwise cut roughly every chunk_bytes, moving each cut forward to
+    #  the start of the next row so that no row is split
+    boundaries = [0]
+    with open(csv_filename, 'rb') as csv_file:
+        position = chunk_bytes
+        while position < file_size:
+            csv_file.seek(position)
+            csv_file.readline()
+            boundary = csv_file.tell()
+            if boundary >= file_size:
+                break
+            boundaries.append(boundary)
+            position = boundary + chunk_bytes
+    boundaries.append(file_size)
+    
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+'''
+********************************************************************************
+Read CSV Byte Range Function
+********************************************************************************
+'''
+
+def readCsvRange(csv_file, byte_range):
+    
+    # Yield the decoded lines that start inside [start, end) of a binary file
+    start, end = byte_range
+    encoding = locale.getpreferredencoding(False)
+    
+    csv_file.seek(start)
+    position = start
+    while position < end:
+        line = csv_file.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode(encoding)
+
+
+'''
+********************************************************************************
+File Checksum Function
+********************************************************************************
+'''
+
+def fileChecksum(filename, block_size=1024 * 1024):
+    
+    # crc32 of the whole file, read in blocks
+    checksum = 0
+    with open(filename, 'rb') as checked_file:
+        for block in iter(lambda: checked_file.read(block_size), b''):
+            checksum = zlib.crc32(block, checksum)
+    
+    return "%08x" % checksum
+
+
+'''
+********************************************************************************
+Open Manifest Function
+********************************************************************************
+'''
+
+def openManifest(manifest_path):
+    
+    # sqlite manifest of converted sources and alarms. Only the parent
+    #  process ever writes to it.
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    manifest = sqlite3.connect(manifest_path)
+    
+    with manifest:
+        manifest.execute('''CREATE TABLE IF NOT EXISTS sources
+                            (admission_id TEXT PRIMARY KEY
+                            , source_size INTEGER
+                            , source_mtime REAL
+                            , complete INTEGER
+                            )''')
+        manifest.execute('''CREATE TABLE IF NOT EXISTS alarms
+                            (admission_id TEXT
+                            , alarm_id TEXT
+                            , time_since_admission TEXT
+                            , row_digest TEXT
+                            , kind TEXT
+                            , output_path TEXT
+                            , output_size INTEGER
+                            , checksum TEXT
+                            , source_size INTEGER
+                            , source_mtime REAL
+                            , PRIMARY KEY (admission_id
+                                           , alarm_id
+                                           , time_since_admission)
+                            )''')
+    
+    return manifest
+
+
+'''
+********************************************************************************
+Manifest Lookup Function
+********************************************************************************
+'''
+
+def outputIsCurrent(output_path, output_size, checksum, verify=False
+                    , key=None, archives=None):
+    
+    # Alarms in an archive are checked against the archive index instead
+    if key is not None:
+        if output_path not in archives:
+            try:
+                archives[output_path] = AlarmArchive(output_path)
+            except (OSError, ValueError, struct.error):
+                archives[output_path] = None
+        archive = archives[output_path]
+        if archive is None or key not in archive:
+            return False
+        entry = archive.index[key]
+        return entry['length'] == output_size \
+               and "%08x" % entry['crc32'] == checksum \
+               and (not verify or archive.verify(key))
+    
+    # Cheap check is existence and size, verify also rereads the checksum
+    try:
+        if os.path.getsize(output_path) != output_size:
+            return False
+    except OSError:
+        return False
+    
+    return not verify or fileChecksum(output_path) == checksum
+
+
+def manifestLookup(manifest, csv_filename, source_stat, verify=False):
+    
+    # Returns (file_is_done, done_rows) for one csv file, where done_rows maps
+    #  (alarm_id, time_since_admission) to (row_digest, output_path) for
+    #  every row whose output is still on disk and intact
+    admission_id = os.path.basename(csv_filename)[:-4]
+    
+    done_rows = {}
+    archives = {}
+    for alarm_id, time_since_admission, row_digest, kind, output_path\
+        , output_size, checksum in manifest.execute('''SELECT alarm_id
+                                                              , time_since_admission
+                                                              , row_digest
+                                                              , kind
+                                                              , output_path
+                                                              , output_size
+                                                              , checksum
+                                                       FROM alarms
+                                                       WHERE admission_id = ?'''
+                                                    , (admission_id,)):
+        if kind == 'archive':
+            key = (admission_id, alarm_id, time_since_admission)
+        else:
+            key = None
+        if outputIsCurrent(output_path, output_size, checksum, verify
+                           , key, archives):
+            done_rows[(alarm_id, time_since_admission)] = (row_digest, output_path)
+    for archive in archives.values():
+        if archive is not None:
+            archive.close()
+    
+    # The whole file is done when it has not changed since it was completed
+    #  and none of its outputs went missing
+    source = manifest.execute('''SELECT source_size, source_mtime, complete
+                                 FROM sources
+                                 WHERE admission_id = ?'''
+                              , (admission_id,)).fetchone()
+    num_rows = manifest.execute('''SELECT COUNT(*)
+                                   FROM alarms
+                                   WHERE admission_id = ?'''
+                                , (admission_id,)).fetchone()[0]
+    file_is_done = source is not None \
+                   and source[2] == 1 \
+                   and source[0] == source_stat.st_size \
+                   and source[1] == source_stat.st_mtime \
+                   and num_rows == len(done_rows)
+    
+    return file_is_done, done_rows
+
+
+'''
+********************************************************************************
+Manifest Record Function
+********************************************************************************
+'''
+
+def manifestRecord(manifest, csv_filename, source_stat, records, complete):
+    
+    # One transaction per csv file, written only after its outputs are in
+    #  their final place, so an interrupted run just redoes that file
+    admission_id = os.path.basename(csv_filename)[:-4]
+    
+    with manifest:
+        manifest.executemany('''INSERT OR REPLACE INTO alarms
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+                             , [(admission_id
+                                 , record['alarm_id']
+                                 , record['time_since_admission']
+                                 , record['row_digest']
+                                 , record['kind']
+                                 , record['output']
+                                 , record['output_size']
+                                 , record['checksum']
+                                 , source_stat.st_size
+                                 , source_stat.st_mtime
+                                 ) for record in records])
+        manifest.execute('''INSERT OR REPLACE INTO sources
+                            VALUES (?, ?, ?, ?)'''
+                         , (admission_id
+                            , source_stat.st_size
+                            , source_stat.st_mtime
+                            , 1 if complete else 0
+                            ))
+
+
+'''
+********************************************************************************
+Convert CSV File Function
+********************************************************************************
+'''
+
+def convertCsvFile(csv_filename, adibin_out_directory_path, byte_range=None
+                   , filename_suffix='', done_rows=None, archive=None
+                   , archive_mode='w', collect_metrics=False, metrics_sink=None
+                   , metrics_interval=EMIT_INTERVAL):
+    
+    # Parse admission_id from csv_filename
+    csv_basename = os.path.basename(csv_filename)
+    admission_id = csv_basename[:-4]
+    
+    # Everything the parent needs to merge this piece of work
+    result = {'csv_filename': csv_filename
+              , 'byte_range': byte_range
+              , 'rows': 0
+              , 'problem_rows': 0
+              , 'skipped_rows': 0
+              , 'skipped_keys': []
+              , 'outputs': []
+              , 'failed': False
+              , 'archive_path': None
+              , 'metrics': None
+              }
+    rewritten_rows = set()
+    
+    # Stage timings and counters travel back to the parent in the result.
+    #  With a metrics_sink (anything with put, like a queue), what was counted
+    #  so far is also put there every metrics_interval seconds, so a long
+    #  file reports progress while it is being converted
+    metrics = StageMetrics() if collect_metrics else NULL_METRICS
+    last_put_time = time.time()
+    
+    # In archive mode every alarm of this file goes into one archive
+    if archive is not None:
+        archive_filename = adibin_out_directory_path + admission_id + ARCHIVE_EXTENSION
+        result['archive_path'] = archive_filename + filename_suffix
+        alarm_archive = AlarmArchive(result['archive_path'], archive_mode)
+    
+    # Open CSV File, or only the requested row range of it
+    if byte_range is None:
+        csv_file = open(csv_filename)
+        csv_lines = csv_file
+    else:
+        csv_file = open(csv_filename, 'rb')
+        csv_lines = readCsvRange(csv_file, byte_range)
+    
+    with csv_file:
+        
+        # Parse and write out ADIBIN for every row in the CSV
+        try:
+            csv_file_reader = csv.reader(csv_lines)
+            for row in csv_file_reader:
+                if metrics_sink is not None and metrics.enabled \
+                   and time.time() - last_put_time >= metrics_interval:
+                    metrics_sink.put(metrics.take())
+                    last_put_time = time.time()
+                metrics.count('bytes_in', sum(map(len, row)))
+                
+                # Skip rows the manifest already has an intact output for,
+                #  unless an earlier row with the same key was just rewritten
+                if done_rows is not None:
+                    row_digest = hashlib.sha1(row[2].encode()).hexdigest()
+                    done_row = done_rows.get((row[0], row[1]))
+                    if done_row is not None and done_row[0] == row_digest \
+                       and (row[0], row[1]) not in rewritten_rows:
+                        result['skipped_rows'] += 1
+                        result['skipped_keys'].append((row[0], row[1]))
+                        metrics.count('skipped_rows')
+                        continue
+                    rewritten_rows.add((row[0], row[1]))
+                else:
+                    row_digest = None
+                
+                try:
+                    csv_data = parseCsv(row, dbg=False, metrics=metrics)
+                    if archive == 'raw':
+                        with metrics.time('write'):
+                            entry = alarm_archive.appendRaw((admission_id, row[0], row[1])
+                                                            , csv_data)
+                    else:
+                        with metrics.time('pack'):
+                            adibin_data = createAdibin(csv_data, dbg=False)
+                        with metrics.time('write'):
+                            if archive is not None:
+                                entry = alarm_archive.appendAdibin((admission_id, row[0], row[1])
+                                                                   , adibin_data)
+                            else:
+                                filename = writeAdibin(adibin_data
+                                                       , admission_id
+                                                       , adibin_out_directory_path
+                                                       , dbg = False
+                                                       , filename_suffix = filename_suffix
+                                                       )
+                    kind = 'archive' if archive is not None else 'adibin'
+                    result['rows'] += 1
+                    metrics.count('rows')
+                except Exception:
+                    # Create problemFile directory to catch problem files
+                    os.makedirs(os.path.dirname("./problemPickles/"), exist_ok=True)
+                    # Write csv row to pickle
+                    filename = pickleMe(parseCsv(row, dbg=False)
+                                        , admission_id
+                                        , "./problemPickles/"
+                                        , dbg=False
+                                        , filename_suffix = filename_suffix
+                                        )
+                    kind = 'problem'
+                    result['problem_rows'] += 1
+                    metrics.count('problem_rows')
+                
+                output = {'alarm_id': row[0]
+                          , 'time_since_admission': row[1]
+                          , 'kind': kind
+                          , 'row_digest': row_digest
+                          }
+                if kind == 'archive':
+                    output['output'] = archive_filename
+                    output['output_size'] = entry['length']
+                    output['checksum'] = "%08x" % entry['crc32']
+                    output['archive_offset'] = entry['offset']
+                    output['storage'] = 'raw' if archive == 'raw' else 'archive'
+                else:
+                    output['output'] = filename
+                    if done_rows is not None:
+                        output['output_size'] = os.path.getsize(filename + filename_suffix)
+                        output['checksum'] = fileChecksum(filename + filename_suffix)
+                
+                # Alarm metadata for the catalog
+                if kind != 'problem':
+                    output['channel_titles'] = csv_data['channel_titles']
+                    output['units'] = [ADI_CHANNEL_UNITS[title].decode()
+                                       for title in csv_data['channel_titles']]
+                    output['scales'] = [ADI_CHANNEL_SCALES[title]
+                                        for title in csv_data['channel_titles']]
+                    output['samples_per_channel'] = csv_data['samples_per_channel']
+                    if kind == 'archive':
+                        output['size'] = entry['length']
+                    else:
+                        output['size'] = len(adibin_data['file_header']) \
+                                         + len(adibin_data['channel_headers']) \
+                                         + len(adibin_data['channel_data'])
+                    metrics.count('bytes_out', output['size'])
+                result['outputs'].append(output)
+        except Exception:
+            # The whole file is quarantined by the caller once it is closed
+            result['failed'] = True
+            metrics.count('failed_chunks')
+        finally:
+            if archive is not None:
+                alarm_archive.close()
+    
+    result['metrics'] = metrics.snapshot()
+    return result
+
+
+'''
+********************************************************************************
+Finish CSV File Function
+********************************************************************************
+'''
+
+def finishCsvFile(csv_filename, chunk_results, report, filename_suffixes=None
+                  , manifest=None, source_stat=None, archive_mode='w'
+                  , catalog=None):
+    
+    # Move staged outputs into place in row order, so duplicate rows end up
+    #  as in a serial run, and drop whatever a serial run would never have
+    #  reached after the first failing row
+    failed = False
+    records = []
+    skipped_keys = set()
+    merged_archive = None
+    for chunk_index, result in enumerate(chunk_results):
+        if filename_suffixes is not None:
+            for output in result['outputs']:
+                if output['kind'] == 'archive':
+                    continue
+                staged_filename = output['output'] + filename_suffixes[chunk_index]
+                if failed:
+                    os.remove(staged_filename)
+                else:
+                    os.replace(staged_filename, output['output'])
+            
+            # Staged archives are appended to the real one in the same order
+            if result['archive_path'] is not None:
+                if not failed:
+                    if merged_archive is None:
+                        merged_archive = AlarmArchive(
+                            result['archive_path'][:-len(filename_suffixes[chunk_index])]
+                            , archive_mode)
+                    merged_archive.extend(result['archive_path'])
+                os.remove(result['archive_path'])
+        if not failed:
+            report['rows'] += result['rows']
+            report['problem_rows'] += result['problem_rows']
+            report['skipped_rows'] += result['skipped_rows']
+            records.extend(result['outputs'])
+            skipped_keys.update(result['skipped_keys'])
+            failed = result['failed']
+    
+    # Alarms moved in the merge, so take their offsets from the merged index
+    if merged_archive is not None:
+        admission_id = os.path.basename(csv_filename)[:-4]
+        for record in records:
+            if record['kind'] == 'archive':
+                record['archive_offset'] = merged_archive.index[
+                    (admission_id
+                     , record['alarm_id']
+                     , record['time_since_admission'])]['offset']
+        merged_archive.close()
+    
+    report['files'] += 1
+    
+    # Outputs are in place, now they can be recorded
+    if manifest is not None:
+        manifestRecord(manifest, csv_filename, source_stat, records
+                       , complete = not failed)
+    # The file's catalog rows are replaced as a whole, so alarms that are
+    #  gone from the csv or became problem rows leave the catalog too; rows
+    #  the manifest skipped keep theirs
+    if catalog is not None:
+        addAlarms(catalog
+                  , os.path.basename(csv_filename)[:-4]
+                  , [record for record in records if record['kind'] != 'problem']
+                  , replace = True
+                  , keep = skipped_keys)
+    
+    if failed:
+        report['problem_files'] += 1
+        # Create problemFile directory to catch problem files
+        os.makedirs(os.path.dirname("./problemFiles/"), exist_ok=True)
+        # Move problem csv file to the problemFiles directory
+        os.rename(csv_filename
+                 , "./problemFiles/" + os.path.basename(csv_filename))
+
+
 '''
 ********************************************************************************
 Nicely Wrapped CSV to ADIBIN Function
 ********************************************************************************
 '''
 
-def csvToAdibin(csv_in_directory_path, adibin_out_directory_path, dbg=False):
+def csvToAdibin(csv_in_directory_path, adibin_out_directory_path, dbg=False
+                , workers=1, chunk_bytes=CHUNK_BYTES, manifest_path=None
+                , verify=False, archive=None, catalog_path=None
+                , metrics_path=None, metrics_interval=EMIT_INTERVAL):
+    
+    # Every csv file in the csv_in_directory_path
+    csv_filenames = glob.glob(csv_in_directory_path + '*.csv')
+    
+    # Merged counts from every file (and every worker)
+    report = {'files': 0
+              , 'problem_files': 0
+              , 'skipped_files': 0
+              , 'rows': 0
+              , 'problem_rows': 0
+              , 'skipped_rows': 0
+              }
     
     # Size of job for dbg progress bar
     if dbg == True:
@@ -562,54 +1136,162 @@ def csvToAdibin(csv_in_directory_path, adibin_out_directory_path, dbg=False):
             len([name for name in os.listdir(csv_in_directory_path)\
             if os.path.isfile(os.path.join(csv_in_directory_path, name))])
         
-        current_iteration = 0
+        printProgress(0, num_files_to_convert)
+    
+    def updateProgress():
+        if dbg == True:
+            if report['files'] <= num_files_to_convert:
+                printProgress(report['files'], num_files_to_convert)
+            else:
+                printProgress(1,1)
+    
+    # With a manifest, work out what is left to do before converting anything
+    manifest = openManifest(manifest_path) if manifest_path else None
+    
+    # archive='adibin' or 'raw' writes one archive per csv file instead of
+    #  one adibin per alarm. Archives are appended to when resuming from a
+    #  manifest and rewritten otherwise, as adibins would be.
+    archive_mode = 'a' if manifest is not None else 'w'
+    
+    # Every converted alarm also goes into the sqlite catalog
+    catalog = openCatalog(catalog_path) if catalog_path else None
+    
+    # metrics_path ('-' for stdout) gets a json line of stage timings and
+    #  counts, merged from every worker, each metrics_interval seconds
+    if metrics_path:
+        metrics = StageMetrics()
+        emitter = MetricsEmitter(metrics, metrics_path, metrics_interval
+                                 , extra={'report': report})
+    else:
+        metrics = NULL_METRICS
+    
+    def updateMetrics(result):
+        metrics.merge(result['metrics'])
+        if metrics.enabled:
+            emitter.maybeEmit()
+    
+    jobs = []
+    for csv_filename in csv_filenames:
+        source_stat = os.stat(csv_filename)
+        done_rows = None
+        if manifest is not None:
+            file_is_done, done_rows = manifestLookup(manifest, csv_filename
+                                                     , source_stat, verify)
+            if file_is_done:
+                report['files'] += 1
+                report['skipped_files'] += 1
+                updateProgress()
+                continue
+        jobs.append((csv_filename, source_stat, done_rows))
+    
+    metrics_manager = None
+    try:
         
-        printProgress(current_iteration, num_files_to_convert)
+        # Serial: one file at a time in this process
+        if workers <= 1:
+            for csv_filename, source_stat, done_rows in jobs:
+                result = convertCsvFile(csv_filename
+                                        , adibin_out_directory_path
+                                        , done_rows = done_rows
+                                        , archive = archive
+                                        , archive_mode = archive_mode
+                                        , collect_metrics = metrics.enabled
+                                        , metrics_sink = emitter if metrics.enabled else None
+                                        , metrics_interval = metrics_interval
+                                        )
+                finishCsvFile(csv_filename
+                              , [result]
+                              , report
+                              , manifest = manifest
+                              , source_stat = source_stat
+                              , archive_mode = archive_mode
+                              , catalog = catalog
+                              )
+                updateProgress()
+                updateMetrics(result)
+            
+            return report
         
-    
-    # For every csv file in the csv_in_directory_path
-    for csv_filename in glob.glob(csv_in_directory_path + '*.csv'):
+        # Parallel: whole files, or row ranges of very large files, on a
+        #  process pool. Only this process renames outputs, quarantines files
+        #  or writes the manifest. Workers put their progress metrics on a
+        #  shared queue that is drained whenever a chunk finishes or
+        #  metrics_interval passes
+        if metrics.enabled:
+            metrics_manager = multiprocessing.Manager()
+            metrics_queue = metrics_manager.Queue()
+        else:
+            metrics_queue = None
         
-        # Parse admission_id from csv_filename
-        csv_basename = os.path.basename(csv_filename)
-        admission_id = csv_basename[:-4]
+        def drainMetrics():
+            while metrics_queue is not None and not metrics_queue.empty():
+                emitter.put(metrics_queue.get())
         
-        # Open CSV File
-        with open(csv_filename) as csv_file:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
             
-            # Parse and write out ADIBIN for every row in the CSV
-            try:
-                csv_file_reader = csv.reader(csv_file)
-                for row in csv_file_reader:
-                    try: 
-                        writeAdibin(createAdibin(parseCsv(row, dbg=False), dbg=False)
-                                    , admission_id
-                                    , adibin_out_directory_path
-                                    , dbg = False
-                                    )
-                    except:
-                        # Create problemFile directory to catch problem files
-                        os.makedirs(os.path.dirname("./problemPickles/"), exist_ok=True)
-                        # Write csv row to pickle
-                        pickleMe(parseCsv(row, dbg=False)
-                                 , admission_id
-                                 , "./problemPickles/"
-                                 , dbg=False
-                                 )
-            except:
-                # Create problemFile directory to catch problem files
-                os.makedirs(os.path.dirname("./problemFiles/"), exist_ok=True)
-                # Move problem csv file to the problemFiles directory
-                os.rename(csv_filename
-                         , "./problemFiles/" + csv_basename)
-
-
-            if dbg == True:
-                current_iteration += 1
-                if current_iteration <= num_files_to_convert:
-                    printProgress(current_iteration, num_files_to_convert)
+            futures = {}
+            pending = {}
+            for csv_filename, source_stat, done_rows in jobs:
+                byte_ranges = splitCsvFile(csv_filename, chunk_bytes)
+                if len(byte_ranges) > 1:
+                    filename_suffixes = [".part%d" % i for i in range(len(byte_ranges))]
                 else:
-                    printProgress(1,1)
+                    filename_suffixes = None
+                pending[csv_filename] = ([None] * len(byte_ranges)
+                                         , filename_suffixes
+                                         , source_stat
+                                         )
+                
+                for chunk_index, byte_range in enumerate(byte_ranges):
+                    future = executor.submit(convertCsvFile
+                                             , csv_filename
+                                             , adibin_out_directory_path
+                                             , byte_range
+                                             , filename_suffixes[chunk_index] \
+                                               if filename_suffixes else ''
+                                             , done_rows
+                                             , archive
+                                             , 'w' if filename_suffixes else archive_mode
+                                             , metrics.enabled
+                                             , metrics_queue
+                                             , metrics_interval
+                                             )
+                    futures[future] = (csv_filename, chunk_index)
+            
+            running = set(futures)
+            while running:
+                done, running = concurrent.futures.wait(
+                    running
+                    , timeout = metrics_interval if metrics.enabled else None
+                    , return_when = concurrent.futures.FIRST_COMPLETED)
+                drainMetrics()
+                for future in done:
+                    csv_filename, chunk_index = futures[future]
+                    chunk_results, filename_suffixes, source_stat = pending[csv_filename]
+                    chunk_results[chunk_index] = future.result()
+                    
+                    # Merge a file once all of its pieces are back
+                    if all(result is not None for result in chunk_results):
+                        finishCsvFile(csv_filename, chunk_results, report
+                                      , filename_suffixes, manifest, source_stat
+                                      , archive_mode, catalog)
+                        del pending[csv_filename]
+                        updateProgress()
+                    updateMetrics(chunk_results[chunk_index])
+                if metrics.enabled:
+                    emitter.maybeEmit()
+        
+        return report
+    
+    finally:
+        if metrics_manager is not None:
+            metrics_manager.shutdown()
+        if metrics.enabled:
+            emitter.emit(final=True)
+        if manifest is not None:
+            manifest.close()
+        if catalog is not None:
+            catalog.close()
 
 
 '''
@@ -618,14 +1300,20 @@ Do It To It
 ********************************************************************************
 '''
 
-csv_directory_path = "./csvFiles/"
-adibin_directory_path = "./generatedAdibins/"
+if __name__ == '__main__':
+    csv_directory_path = "./csvFiles/"
+    adibin_directory_path = "./generatedAdibins/"
 
-start_time = time.time()
-csvToAdibin(csv_directory_path, adibin_directory_path, dbg=True)
-end_time = time.time()
-printProgress(1,1)
-print("\nran in %s seconds" % (end_time - start_time))
+    start_time = time.time()
+    # Serial, as calcardiac convert; pass workers=os.cpu_count() for a pool
+    report = csvToAdibin(csv_directory_path, adibin_directory_path, dbg=True
+                         , workers=1
+                         , manifest_path=adibin_directory_path + "manifest.sqlite"
+                         , metrics_path=adibin_directory_path + "metrics.jsonl")
+    end_time = time.time()
+    printProgress(1,1)
+    print("\nran in %s seconds" % (end_time - start_time))
+    print(report)
 
 
 '''
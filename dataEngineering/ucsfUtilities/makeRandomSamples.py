@@ -54,5 +54,6 @@ Do It To It
 ********************************************************************************
 '''
 
-csv_in_directory_path = './'
-makeRandomSamples(1011,10,csv_in_directory_path, True)
\ No newline at end of file
+if __name__ == '__main__':
+    csv_in_directory_path = './'
+    makeRandomSamples(1011,10,csv_in_directory_path, True)
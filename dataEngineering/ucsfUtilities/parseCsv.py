@@ -1,24 +1,34 @@
 import struct
 
-# param adibin_file: output of 'open' command in python3 (like _io.BufferedReader)
-def parse_channels(adibin_file, dbg=False):
-    FILE_HEADER_LENGTH = 68
-    CHANNEL_HEADER_LENGTH = 96
+import numpy
 
-    ADI_FILE_HEADER_FORMAT_STRING = "<4sldlllllddllll"
-    ADI_CHANNEL_HEADER_FORMAT_STRING = "<32s32sdddd"
+FILE_HEADER_LENGTH = 68
+CHANNEL_HEADER_LENGTH = 96
 
-    # Start at the beginning of the buffer
-    adibin_file.seek(0)
-    
-    # Read in overall file header
-    file_header_bytes = adibin_file.read(FILE_HEADER_LENGTH)
-    
-    # Parse overall file header according to format string
+ADI_FILE_HEADER_FORMAT_STRING = "<4sldlllllddllll"
+ADI_CHANNEL_HEADER_FORMAT_STRING = "<32s32sdddd"
+
+ADI_FILE_HEADER_STRUCT = struct.Struct(ADI_FILE_HEADER_FORMAT_STRING)
+ADI_CHANNEL_HEADER_STRUCT = struct.Struct(ADI_CHANNEL_HEADER_FORMAT_STRING)
+
+# Sample dtype for each DataFormat: 1 = 8 byte double, 2 = 4 byte float,
+# 3 = 2 byte int. ADI files are little-endian.
+ADI_DATA_FORMAT_DTYPES = {1: '<f8',
+                          2: '<f4',
+                          3: '<i2'}
+
+# Order of entries in the array:
+data_names = ['ChannelIndex', 'ChannelTitle', 'Units', 'Scale',
+              'Offset', 'RangeHigh', 'RangeLow', 'ChannelData']
+
+
+# param file_header_bytes: the first FILE_HEADER_LENGTH bytes of an adibin file
+def unpack_file_header(file_header_bytes, dbg=False):
+    """Parses the 68 byte adibin file header into a dict."""
     magic, version, secs_per_tick, year, month, day, hour, minute, second, \
-     trigger, num_channels, samples_per_channel, time_czhannel, data_format \
-    = struct.unpack(ADI_FILE_HEADER_FORMAT_STRING, file_header_bytes)
-    
+     trigger, num_channels, samples_per_channel, time_channel, data_format \
+    = ADI_FILE_HEADER_STRUCT.unpack(file_header_bytes)
+
     if dbg == True:
         print("Magic:", magic.decode('utf-8'))
         print("Version:", version)
@@ -33,33 +43,38 @@ def parse_channels(adibin_file, dbg=False):
         print("SamplesPerChannel:", samples_per_channel)
         print("DataFormat:", data_format)
         print('---')
-    
-    # Figure out length of rest of the file 
-    if (data_format == 1): # 8 byte double
-        bytes_per_sample = 8
-        sample_format_string = 'd'
-    elif (data_format == 2): # 4 byte float
-        bytes_per_sample = 4
-        sample_format_string = 'f'
-    elif (data_format == 3): # 2 byte int
-        bytes_per_sample = 2
-        sample_format_string = 'h'
-    else:
-        return ValueError('DataFormat Not Coded to 1,2,or 3')
-    
-    # Order of entries in the array:
-    data_names = ['ChannelIndex', 'ChannelTitle', 'Units', 'Scale', 
-                            'Offset', 'RangeHigh', 'RangeLow', 'ChannelData']
-    data_values_list = []
 
-    # For every channel, read the header
+    if data_format not in ADI_DATA_FORMAT_DTYPES:
+        raise ValueError('DataFormat Not Coded to 1,2,or 3')
+
+    return {'Magic': magic,
+            'Version': version,
+            'SecsPerTick': secs_per_tick,
+            'Year': year,
+            'Month': month,
+            'Day': day,
+            'Hour': hour,
+            'Minute': minute,
+            'Second': second,
+            'Trigger': trigger,
+            'NChannels': num_channels,
+            'SamplesPerChannel': samples_per_channel,
+            'TimeChannel': time_channel,
+            'DataFormat': data_format}
+
+
+# param channel_headers_bytes: the NChannels*CHANNEL_HEADER_LENGTH bytes that
+#       follow the file header
+def unpack_channel_headers(channel_headers_bytes, num_channels, dbg=False):
+    """Parses the 96 byte channel headers into lists of channel fields, in
+    the order of data_names (without ChannelData)."""
+    channel_headers = []
     for channel_num in range(0, num_channels):
-        channel_title_buffer = adibin_file.read(CHANNEL_HEADER_LENGTH)
-        
         # Parse Channel Title Fields
         channel_title, units, scale, offset, range_high, range_low \
-        = struct.unpack(ADI_CHANNEL_HEADER_FORMAT_STRING, channel_title_buffer)
-        
+        = ADI_CHANNEL_HEADER_STRUCT.unpack_from(channel_headers_bytes,
+                                                channel_num * CHANNEL_HEADER_LENGTH)
+
         # Sanity Check
         if dbg == True:
             print("ChannelTitle:", channel_title.decode('utf-8'))
@@ -70,25 +85,114 @@ def parse_channels(adibin_file, dbg=False):
             print("RangeLow:", range_low)
             print('---')
 
-        # Append channel title fields to list
-        data_values_list.append([channel_num,
-                                 channel_title.decode('utf-8').rstrip('\0'), 
-                                 units.decode('utf-8').rstrip('\0'), 
-                                 scale, 
-                                 offset, 
-                                 range_high, 
-                                 range_low,
-                                 []])
-
-    # For every signal sample
-    for sample in range(0, samples_per_channel):
-        # For every channel
-        for channel in range(0, num_channels):           
-            data_values_list[channel][7].append(struct.unpack(sample_format_string,
-                                                              adibin_file.read(bytes_per_sample))[0])
-    
+        channel_headers.append([channel_num,
+                                channel_title.decode('utf-8').rstrip('\0'),
+                                units.decode('utf-8').rstrip('\0'),
+                                scale,
+                                offset,
+                                range_high,
+                                range_low])
+    return channel_headers
+
+
+# param adibin_file: output of 'open' command in python3 (like _io.BufferedReader)
+# param base: byte position of the adibin file header inside adibin_file
+def read_headers(adibin_file, base=0, dbg=False):
+    """Reads the file header and channel headers. Returns (file_header,
+    channel_headers, data_offset) where data_offset is the absolute byte
+    position of the first sample."""
+    adibin_file.seek(base)
+    file_header = unpack_file_header(adibin_file.read(FILE_HEADER_LENGTH), dbg)
+    num_channels = file_header['NChannels']
+    channel_headers = unpack_channel_headers(
+        adibin_file.read(num_channels * CHANNEL_HEADER_LENGTH), num_channels, dbg)
+    data_offset = base + FILE_HEADER_LENGTH + num_channels * CHANNEL_HEADER_LENGTH
+    return file_header, channel_headers, data_offset
+
+
+class ScaledChannel(object):
+    """Lazy physical-unit view of a raw int16 channel. Nothing is converted
+    until it is indexed: value = scale * (raw + offset), as in the ADI
+    TranslateBinary example."""
+
+    def __init__(self, raw, scale, offset):
+        self.raw = raw
+        self.scale = scale
+        self.offset = offset
+        self.shape = raw.shape
+        self.dtype = numpy.dtype('f8')
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        return self.scale * (self.raw[key] + self.offset)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[...]
+        return values if dtype is None else values.astype(dtype)
+
+
+# param adibin_file: filename, or a file opened in binary mode
+# param physical: if True, int16 channels come back as lazy ScaledChannel views
+#       in physical units instead of raw counts
+# param base: byte position of the adibin file header inside adibin_file, so
+#       adibin blobs embedded in bigger files can be mapped too
+def map_channels(adibin_file, physical=False, base=0, dbg=False):
+    """Memory-maps an adibin file without reading the samples. Returns the
+    same list of dicts as parse_channels, except that 'ChannelData' is a
+    strided numpy.memmap view of that channel (nothing is copied)."""
+    if isinstance(adibin_file, str):
+        with open(adibin_file, 'rb') as header_file:
+            file_header, channel_headers, data_offset = \
+                read_headers(header_file, base, dbg)
+    else:
+        file_header, channel_headers, data_offset = \
+            read_headers(adibin_file, base, dbg)
+
+    num_channels = file_header['NChannels']
+    samples_per_channel = file_header['SamplesPerChannel']
+    sample_dtype = numpy.dtype(ADI_DATA_FORMAT_DTYPES[file_header['DataFormat']])
+
+    # Samples are interleaved, so the (samples, channels) map has one channel
+    # per column and every column is a zero-copy strided view
+    if num_channels * samples_per_channel > 0:
+        samples = numpy.memmap(adibin_file, dtype=sample_dtype, mode='r',
+                               offset=data_offset,
+                               shape=(samples_per_channel, num_channels))
+    else:
+        samples = numpy.zeros((samples_per_channel, num_channels), sample_dtype)
+
+    channels = []
+    for channel_header in channel_headers:
+        channel_num, scale, offset = channel_header[0], channel_header[3], channel_header[4]
+        channel_data = samples[:, channel_num]
+        if physical and file_header['DataFormat'] == 3:
+            channel_data = ScaledChannel(channel_data, scale, offset)
+        channels.append(dict(zip(data_names, channel_header + [channel_data])))
+    return channels
+
+
+# param adibin_file: output of 'open' command in python3 (like _io.BufferedReader)
+def parse_channels(adibin_file, dbg=False):
+    """Compatibility reader: returns a list of dicts, one per channel, with
+    'ChannelData' as a plain Python list."""
+    file_header, channel_headers, data_offset = read_headers(adibin_file, 0, dbg)
+
+    num_channels = file_header['NChannels']
+    samples_per_channel = file_header['SamplesPerChannel']
+    sample_dtype = numpy.dtype(ADI_DATA_FORMAT_DTYPES[file_header['DataFormat']])
+
+    # Read every sample in one go and deinterleave with a reshape
+    data_bytes = adibin_file.read(num_channels * samples_per_channel * sample_dtype.itemsize)
+    if len(data_bytes) < num_channels * samples_per_channel * sample_dtype.itemsize:
+        raise struct.error('adibin file is shorter than its header says')
+    samples = numpy.frombuffer(data_bytes, dtype=sample_dtype)
+    samples = samples.reshape(samples_per_channel, num_channels)
+
     # Return parsed list
-    return list(map(lambda x: dict(zip(data_names, x)), data_values_list))
+    return [dict(zip(data_names, channel_header + [samples[:, channel_header[0]].tolist()]))
+            for channel_header in channel_headers]
 
 
 def test(filename):
@@ -0,0 +1,348 @@
+'''
+********************************************************************************
+Import Packages
+********************************************************************************
+'''
+
+import csv\
+    , glob\
+    , os\
+    , pickle\
+    , sys\
+    , time\
+    , types\
+    , concurrent.futures
+
+import numpy
+import scipy.signal
+
+from parseCsv import map_channels\
+    , read_headers
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__))
+                             , '..', 'adiConversion'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__))
+                             , '..', 'mitbihExploration'))
+from processing_components import resample\
+    , MITBIH_FS
+from beat_features import beat_features\
+    , MODEL_WINDOWS\
+    , MODEL_DIR
+
+
+'''
+********************************************************************************
+Scoring Settings
+********************************************************************************
+
+Every alarm is resampled to the MIT-BIH rate, its beats are located, and every
+beat whose model window fits inside the alarm is scored. The models were fit on
+MIT-BIH channel 1 (a chest lead), so the first of SCORE_CHANNELS present in the
+alarm is used. A beat is a PVC when its score is above PVC_THRESHOLD; the
+random forests are regressors, so their prediction is the score.
+
+UCSF alarms are 10 s long, which only fits windows of the 0.4 s models; the
+RandomForest_10s.pkl windows need 10 s on their own, so DEFAULT_MODEL is one
+of the small ones.
+
+'''
+
+DEFAULT_MODEL = os.path.join(MODEL_DIR, 'RandomForestSmall.pkl')
+
+SCORE_CHANNELS = ['V', 'II', 'I', 'III', 'AVF', 'AVL', 'AVR']
+
+PVC_THRESHOLD = 0.5
+
+# Alarms per pool task, and windows per model call inside a task
+ALARMS_PER_TASK = 64
+BATCH_WINDOWS = 4096
+
+OUTPUT_FIELDS = ['admission_id'
+                 , 'alarm_id'
+                 , 'time_since_admission'
+                 , 'channel'
+                 , 'seconds'
+                 , 'beats'
+                 , 'scored_beats'
+                 , 'pvc_beats'
+                 , 'max_score'
+                 , 'mean_score'
+                 , 'error'
+                 ]
+
+# The model of this worker process, loaded once by initWorker
+WORKER_STATE = {}
+
+
+'''
+********************************************************************************
+*********************************Functions**************************************
+********************************************************************************
+'''
+
+
+'''
+********************************************************************************
+Beat Location Function
+********************************************************************************
+'''
+
+def locateBeats(ecg, fs=MITBIH_FS):
+
+    # Offline Pan-Tompkins: zero-phase 5-15 Hz band-pass, squared derivative,
+    #  centred 150 ms moving average, peaks at least 250 ms apart, then the
+    #  R-peak is the largest deviation from the median within 75 ms. A flat
+    #  line has no beats: filtering it only leaves rounding noise
+    if len(ecg) < fs or numpy.ptp(ecg) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    b, a = scipy.signal.butter(2, [5. / (fs / 2.), 15. / (fs / 2.)], 'bandpass')
+    band = scipy.signal.filtfilt(b, a, ecg)
+    integration = int(0.15 * fs)
+    energy = numpy.convolve(numpy.gradient(band)**2
+                            , numpy.ones(integration) / integration, mode='same')
+    if not numpy.any(energy > 0):
+        return numpy.zeros(0, dtype=numpy.int64)
+    peaks, _ = scipy.signal.find_peaks(energy
+                                       , height=0.3 * numpy.percentile(energy, 99)
+                                       , distance=int(0.25 * fs))
+
+    search = int(0.075 * fs)
+    deviation = numpy.pad(numpy.abs(ecg - numpy.median(ecg)), search, mode='constant')
+    neighbourhoods = numpy.lib.stride_tricks.sliding_window_view(deviation, 2 * search + 1)
+    return numpy.unique(peaks + neighbourhoods[peaks].argmax(axis=1) - search)
+
+
+'''
+********************************************************************************
+Alarm Window Function
+********************************************************************************
+'''
+
+def alarmRow(adibin_filename):
+
+    # Output row of an alarm, keyed as writeAdibin names its file
+    admission_id, alarm_id, time_since_admission = \
+        os.path.basename(adibin_filename)[:-len('.adibin')].rsplit('_', 2)
+    return {'admission_id': admission_id
+            , 'alarm_id': alarm_id
+            , 'time_since_admission': time_since_admission
+            , 'beats': 0
+            , 'scored_beats': 0
+            }
+
+
+def alarmWindows(adibin_filename, sec, row):
+
+    # Model input windows of one alarm; row is filled in as the alarm is read,
+    #  so it keeps what was found if a later step raises
+    with open(adibin_filename, 'rb') as adibin_file:
+        file_header = read_headers(adibin_file)[0]
+        channels = dict((channel['ChannelTitle'], channel)
+                        for channel in map_channels(adibin_file, physical=True))
+    titles = [title for title in SCORE_CHANNELS if title in channels]
+    if not titles:
+        row['error'] = 'no ECG channel'
+        return None
+
+    fs = 1. / file_header['SecsPerTick']
+    ecg = numpy.asarray(channels[titles[0]]['ChannelData'], dtype=numpy.float64)
+    row['channel'] = titles[0]
+    row['seconds'] = round(len(ecg) / fs, 3)
+    if len(ecg) / fs < 2 * sec:
+        row['error'] = 'alarm shorter than the %g s model window' % (2 * sec)
+        return None
+
+    ecg = resample(ecg, fs, MITBIH_FS)
+    beats = locateBeats(ecg)
+    row['beats'] = len(beats)
+    annotation = types.SimpleNamespace(sample=beats
+                                       , symbol=['?'] * len(beats)
+                                       , fs=MITBIH_FS)
+    model_input = beat_features(ecg, annotation, sec)[0]
+    row['scored_beats'] = len(model_input)
+    return model_input
+
+
+'''
+********************************************************************************
+Worker Functions
+********************************************************************************
+'''
+
+def initWorker(model_path, sec):
+
+    # Runs once in every pool process
+    with open(model_path, 'rb') as model_file:
+        WORKER_STATE['model'] = pickle.load(model_file)
+    WORKER_STATE['sec'] = sec
+
+
+def predictScores(model_input):
+
+    model = WORKER_STATE['model']
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(model_input)[:, 1]
+    return model.predict(model_input)
+
+
+def scoreRows(rows, windows):
+
+    # One model call for the windows of many alarms
+    if windows:
+        scores = predictScores(numpy.concatenate(windows))
+    start = 0
+    for row in rows:
+        n = row['scored_beats']
+        if n:
+            alarm_scores = scores[start:start + n]
+            row['pvc_beats'] = int((alarm_scores > PVC_THRESHOLD).sum())
+            row['max_score'] = round(float(alarm_scores.max()), 4)
+            row['mean_score'] = round(float(alarm_scores.mean()), 4)
+            start += n
+        elif 'error' not in row:
+            row['pvc_beats'] = 0
+
+
+def scoreTask(adibin_filenames):
+
+    rows = []
+    pending_rows = []
+    pending_windows = []
+    pending_count = 0
+    for adibin_filename in adibin_filenames:
+        row = alarmRow(adibin_filename)
+        try:
+            model_input = alarmWindows(adibin_filename, WORKER_STATE['sec'], row)
+        except Exception as e:
+            model_input = None
+            row['scored_beats'] = 0
+            row['error'] = repr(e)
+        rows.append(row)
+        pending_rows.append(row)
+        if model_input is not None and len(model_input):
+            pending_windows.append(model_input)
+            pending_count += len(model_input)
+        if pending_count >= BATCH_WINDOWS:
+            scoreRows(pending_rows, pending_windows)
+            pending_rows, pending_windows, pending_count = [], [], 0
+    scoreRows(pending_rows, pending_windows)
+    return rows
+
+
+'''
+********************************************************************************
+Settings Check Function
+********************************************************************************
+'''
+
+def modelWindow(model_path, sec, adibin_filenames):
+
+    # Half-width of the model windows, checked before any worker starts, so a
+    #  bad model or one whose windows cannot fit the alarms fails here instead
+    #  of as a broken pool or a csv of empty rows
+    if not os.path.isfile(model_path):
+        raise ValueError('no model file %s' % model_path)
+    if sec is None:
+        if os.path.basename(model_path) not in MODEL_WINDOWS:
+            raise ValueError('window of %s unknown: pass sec, or use one of %s'
+                             % (model_path, ', '.join(sorted(MODEL_WINDOWS))))
+        sec = MODEL_WINDOWS[os.path.basename(model_path)]
+    if adibin_filenames:
+        with open(adibin_filenames[0], 'rb') as adibin_file:
+            file_header = read_headers(adibin_file)[0]
+        seconds = file_header['SamplesPerChannel'] * file_header['SecsPerTick']
+        if seconds < 2 * sec:
+            raise ValueError('%s is %g s long, shorter than the %g s windows of %s'
+                             % (adibin_filenames[0], seconds, 2 * sec
+                                , os.path.basename(model_path)))
+    return sec
+
+
+'''
+********************************************************************************
+scoreAlarms Function
+********************************************************************************
+'''
+
+def scoreAlarms(adibin_directory_path, output_filename
+                , model_path=DEFAULT_MODEL, sec=None
+                , workers=None, alarms_per_task=ALARMS_PER_TASK, dbg=False):
+
+    # Scores every .adibin in the directory and writes one csv row per alarm,
+    #  in file name order; returns throughput figures. sec is the model window
+    #  half-width, looked up in MODEL_WINDOWS when None
+    adibin_filenames = sorted(glob.glob(adibin_directory_path + '*.adibin'))
+    sec = modelWindow(model_path, sec, adibin_filenames)
+    tasks = [adibin_filenames[i:i + alarms_per_task]
+             for i in range(0, len(adibin_filenames), alarms_per_task)]
+
+    start_time = time.time()
+    report = {'alarms': 0
+              , 'problem_alarms': 0
+              , 'beats': 0
+              , 'ecg_seconds': 0.
+              }
+
+    if workers == 1:
+        initWorker(model_path, sec)
+        results = map(scoreTask, tasks)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(workers
+                                                          , initializer=initWorker
+                                                          , initargs=(model_path, sec))
+        results = executor.map(scoreTask, tasks)
+
+    try:
+        with open(output_filename, 'w', newline='') as output_file:
+            csv_writer = csv.DictWriter(output_file, OUTPUT_FIELDS, restval='')
+            csv_writer.writeheader()
+            for rows in results:
+                for row in rows:
+                    csv_writer.writerow(row)
+                    report['alarms'] += 1
+                    report['problem_alarms'] += 'error' in row
+                    report['beats'] += row.get('scored_beats', 0)
+                    report['ecg_seconds'] += row.get('seconds', 0)
+                if dbg == True:
+                    print("%d / %d alarms scored" % (report['alarms'], len(adibin_filenames)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.time() - start_time
+    report['seconds'] = elapsed
+    report['alarms_per_second'] = report['alarms'] / max(elapsed, 1e-9)
+    report['beats_per_second'] = report['beats'] / max(elapsed, 1e-9)
+    report['ecg_seconds_per_second'] = report['ecg_seconds'] / max(elapsed, 1e-9)
+    return report
+
+
+'''
+********************************************************************************
+Do It To It
+********************************************************************************
+'''
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Score UCSF alarm adibins with a pickled classical PVC model')
+    parser.add_argument('adibin_directory', help='directory of .adibin files (with trailing /)')
+    parser.add_argument('--output', default='alarmScores.csv')
+    parser.add_argument('--model', default=DEFAULT_MODEL
+                        , help='one of ' + ', '.join(sorted(MODEL_WINDOWS)))
+    parser.add_argument('--sec', type=float
+                        , help='model window half-width in seconds, for other models')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--alarms-per-task', type=int, default=ALARMS_PER_TASK)
+    args = parser.parse_args()
+
+    report = scoreAlarms(args.adibin_directory, args.output, args.model, args.sec
+                         , args.workers, args.alarms_per_task, dbg=True)
+    print("%d alarms (%d problems), %d beats in %.1f s"
+          % (report['alarms'], report['problem_alarms'], report['beats'], report['seconds']))
+    print("    %.1f alarms/s %.1f beats/s %.1f ECG s/s"
+          % (report['alarms_per_second']
+             , report['beats_per_second']
+             , report['ecg_seconds_per_second']))
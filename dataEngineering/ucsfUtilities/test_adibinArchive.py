@@ -0,0 +1,79 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from adibinArchive import AlarmArchive, exportAdibins, ARCHIVE_EXTENSION
+from benchmarkPipeline import makeSyntheticCsv, CHANNEL_SETS
+from csvToAdibin import csvToAdibin
+from parseCsv import map_channels
+
+
+@pytest.fixture
+def converted(tmp_path, monkeypatch):
+    # the same synthetic admission as standalone adibin files and as an archive of each kind
+    monkeypatch.chdir(tmp_path)
+    csv_dir = str(tmp_path / 'csv') + os.sep
+    makeSyntheticCsv(os.path.join(csv_dir, 'adm1.csv'), CHANNEL_SETS['bedside'], 4, 12,
+                     mismatch=5, mismatch_every=4, seed=3)
+    outputs = {}
+    for archive in (None, 'adibin', 'raw'):
+        out_dir = str(tmp_path / str(archive)) + os.sep
+        report = csvToAdibin(csv_dir, out_dir, archive=archive)
+        assert report['rows'] == 12 and report['problem_rows'] == 0
+        outputs[archive] = out_dir
+    return outputs
+
+
+def adibin_files(directory):
+    files = {}
+    for filename in glob.glob(directory + '*.adibin'):
+        with open(filename, 'rb') as adibin_file:
+            files[tuple(os.path.basename(filename)[:-len('.adibin')].rsplit('_', 2))] = \
+                adibin_file.read()
+    return files
+
+
+@pytest.mark.parametrize('kind', ['adibin', 'raw'])
+def test_archive_round_trip(converted, kind):
+    files = adibin_files(converted[None])
+    archive_path = converted[kind] + 'adm1' + ARCHIVE_EXTENSION
+    with AlarmArchive(archive_path) as archive:
+        assert sorted(archive.keys()) == sorted(files)
+        for key, data in files.items():
+            assert archive.verify(key)
+            assert archive.readBlob(key) == data
+            mapped = archive.mapAlarm(key, physical=True)
+            expected = map_channels(os.path.join(converted[None], '_'.join(key) + '.adibin'),
+                                    physical=True)
+            assert [c['ChannelTitle'] for c in mapped] == [c['ChannelTitle'] for c in expected]
+            for channel, expected_channel in zip(mapped, expected):
+                assert np.allclose(np.asarray(channel['ChannelData']),
+                                   np.asarray(expected_channel['ChannelData']))
+
+    export_dir = converted[kind] + 'export' + os.sep
+    exportAdibins(archive_path, export_dir)
+    assert adibin_files(export_dir) == files
+
+
+def test_reopened_archive_appends(converted, tmp_path):
+    archive_path = converted['adibin'] + 'adm1' + ARCHIVE_EXTENSION
+    with AlarmArchive(archive_path) as archive:
+        key = sorted(archive.keys())[0]
+        blob = archive.readBlob(key)
+    copy_path = str(tmp_path / ('copy' + ARCHIVE_EXTENSION))
+    with AlarmArchive(copy_path, 'w') as copy:
+        copy.extend(archive_path)
+    with AlarmArchive(copy_path, 'a') as copy:
+        # the parts are stored back to back, so one part can hold the whole file
+        copy.appendAdibin(('adm2', 'a1', '0'), {'file_header': blob, 'channel_headers': b'',
+                                                'channel_data': b''})
+    with AlarmArchive(copy_path) as copy:
+        assert len(copy) == 13
+        assert copy.readBlob(key) == blob
+        assert copy.readBlob(('adm2', 'a1', '0')) == blob
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
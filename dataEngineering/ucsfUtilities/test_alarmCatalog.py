@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from alarmCatalog import openCatalog, addAlarms, findAlarms
+from benchmarkPipeline import makeSyntheticCsv, CHANNEL_SETS
+from csvToAdibin import csvToAdibin
+
+
+def record(alarm_id, channel_titles=('I', 'II'), samples_per_channel=2400):
+    return {'alarm_id': alarm_id,
+            'time_since_admission': '0',
+            'channel_titles': list(channel_titles),
+            'units': ['mV'] * len(channel_titles),
+            'scales': [1.0] * len(channel_titles),
+            'samples_per_channel': samples_per_channel,
+            'output': alarm_id + '.adibin',
+            'size': 100}
+
+
+def alarm_ids(catalog, **conditions):
+    return [handle.alarm_id for handle in findAlarms(catalog, **conditions)]
+
+
+def count_rows(catalog):
+    return catalog.execute('SELECT COUNT(*) FROM alarms').fetchone()[0], \
+        catalog.execute('SELECT COUNT(*) FROM alarm_channels').fetchone()[0]
+
+
+def test_converting_a_file_twice_leaves_one_row_per_alarm(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_dir = str(tmp_path / 'csv') + os.sep
+    csv_filename = os.path.join(csv_dir, 'adm1.csv')
+    catalog_path = str(tmp_path / 'catalog.sqlite')
+    makeSyntheticCsv(csv_filename, CHANNEL_SETS['ecg'], 2, 6, seed=6)
+
+    for i in range(2):
+        csvToAdibin(csv_dir, str(tmp_path / 'out') + os.sep, catalog_path=catalog_path)
+        catalog = openCatalog(catalog_path)
+        assert count_rows(catalog) == (6, 6 * len(CHANNEL_SETS['ecg']))
+        catalog.close()
+
+    # alarms that are gone from the csv leave the catalog
+    with open(csv_filename) as csv_file:
+        lines = csv_file.readlines()
+    with open(csv_filename, 'w') as csv_file:
+        csv_file.writelines(lines[:4])
+    csvToAdibin(csv_dir, str(tmp_path / 'out') + os.sep, catalog_path=catalog_path)
+    catalog = openCatalog(catalog_path)
+    assert count_rows(catalog) == (4, 4 * len(CHANNEL_SETS['ecg']))
+    catalog.close()
+
+
+def test_rows_skipped_by_the_manifest_stay(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_dir = str(tmp_path / 'csv') + os.sep
+    csv_filename = os.path.join(csv_dir, 'adm1.csv')
+    options = {'catalog_path': str(tmp_path / 'catalog.sqlite'),
+               'manifest_path': str(tmp_path / 'manifest.sqlite')}
+    makeSyntheticCsv(csv_filename, CHANNEL_SETS['ecg'], 2, 6, seed=7)
+    csvToAdibin(csv_dir, str(tmp_path / 'out') + os.sep, **options)
+
+    # a touched source is read again with every row skipped
+    stat = os.stat(csv_filename)
+    os.utime(csv_filename, (stat.st_atime, stat.st_mtime + 10))
+    report = csvToAdibin(csv_dir, str(tmp_path / 'out') + os.sep, **options)
+    assert report['skipped_rows'] == 6 and report['rows'] == 0
+    catalog = openCatalog(options['catalog_path'])
+    assert count_rows(catalog) == (6, 6 * len(CHANNEL_SETS['ecg']))
+    catalog.close()
+
+
+def test_replace_keeps_only_keep(tmp_path):
+    catalog = openCatalog(str(tmp_path / 'catalog.sqlite'))
+    addAlarms(catalog, 'adm1', [record('a1'), record('a2'), record('a3')])
+    addAlarms(catalog, 'adm2', [record('b1')])
+
+    addAlarms(catalog, 'adm1', [record('a3', ('V',))], replace=True, keep={('a2', '0')})
+    assert alarm_ids(catalog) == ['a2', 'a3', 'b1']
+    assert findAlarms(catalog, alarm_ids=['a3'])[0].channel_titles == ['V']
+    assert count_rows(catalog) == (3, 5)
+
+    # without replace, rows of the admission that are not in records stay
+    addAlarms(catalog, 'adm1', [record('a4')])
+    assert alarm_ids(catalog) == ['a2', 'a3', 'a4', 'b1']
+    catalog.close()
+
+
+def test_find_alarms_by_channel_and_duration(tmp_path):
+    catalog = openCatalog(str(tmp_path / 'catalog.sqlite'))
+    addAlarms(catalog, 'adm1', [record('a1', ('I', 'II'), 2400),
+                                record('a2', ('II', 'V'), 4800),
+                                record('a3', ('I', 'II', 'V'), 1200)])
+
+    assert alarm_ids(catalog, channels=['ii']) == ['a1', 'a2', 'a3']
+    assert alarm_ids(catalog, channels=['II', 'V']) == ['a2', 'a3']
+    assert alarm_ids(catalog, min_duration=10) == ['a1', 'a2']
+    assert alarm_ids(catalog, max_duration=10) == ['a1', 'a3']
+    assert alarm_ids(catalog, channels=['I'], min_duration=8, max_duration=12) == ['a1']
+    assert [handle.duration for handle in findAlarms(catalog, limit=1)] == [pytest.approx(10)]
+    catalog.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
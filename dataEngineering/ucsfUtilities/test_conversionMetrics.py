@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from benchmarkPipeline import makeSyntheticCsv, CHANNEL_SETS
+from conversionMetrics import StageMetrics
+from csvToAdibin import csvToAdibin
+
+
+def test_take_splits_into_pieces_that_add_up():
+    metrics = StageMetrics()
+    merged = StageMetrics()
+    for i in range(5):
+        metrics.count('rows')
+        metrics.observe('pack', 0.001 * (i + 1))
+        if i % 2:
+            merged.merge(metrics.take())
+    merged.merge(metrics.take())
+    assert merged.counters['rows'] == 5
+    assert merged.histograms['pack']['count'] == 5
+    assert merged.histograms['pack']['max_seconds'] == pytest.approx(0.005)
+    assert metrics.take() == {'counters': {}, 'histograms': {}}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_metrics_are_emitted_during_one_long_file(tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    csv_dir = str(tmp_path / 'csv') + os.sep
+    makeSyntheticCsv(os.path.join(csv_dir, 'adm1.csv'), CHANNEL_SETS['bedside'], 10, 60, seed=4)
+    metrics_path = str(tmp_path / 'metrics.jsonl')
+
+    report = csvToAdibin(csv_dir, str(tmp_path / 'out') + os.sep, workers=workers,
+                         metrics_path=metrics_path, metrics_interval=0.01)
+    with open(metrics_path) as metrics_file:
+        lines = [json.loads(line) for line in metrics_file]
+
+    # lines written before the only file was finished already count its rows
+    during = [line for line in lines if line['report']['files'] == 0]
+    assert during and any(line['counters'].get('rows', 0) > 0 for line in during)
+    assert lines[-1]['final'] and lines[-1]['counters']['rows'] == report['rows'] == 60
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,43 @@
+import glob
+import os
+
+import pytest
+
+from benchmarkPipeline import makeSyntheticCsv, CHANNEL_SETS
+from csvToAdibin import csvToAdibin
+
+
+def make_csvs(csv_dir):
+    # two admissions, one with mismatched channel lengths
+    makeSyntheticCsv(os.path.join(csv_dir, 'adm1.csv'), CHANNEL_SETS['bedside'], 4, 30, seed=1)
+    makeSyntheticCsv(os.path.join(csv_dir, 'adm2.csv'), CHANNEL_SETS['ecg'], 4, 25,
+                     mismatch=7, mismatch_every=3, seed=2)
+
+
+def read_outputs(directory):
+    outputs = {}
+    for filename in sorted(glob.glob(os.path.join(directory, '*'))):
+        with open(filename, 'rb') as output_file:
+            outputs[os.path.basename(filename)] = output_file.read()
+    return outputs
+
+
+@pytest.mark.parametrize('workers, chunk_bytes', [(2, 1 << 20), (3, 4096)])
+def test_parallel_output_is_byte_identical(tmp_path, monkeypatch, workers, chunk_bytes):
+    monkeypatch.chdir(tmp_path)
+    csv_dir = str(tmp_path / 'csv') + os.sep
+    make_csvs(csv_dir)
+
+    serial = csvToAdibin(csv_dir, str(tmp_path / 'serial') + os.sep, workers=1)
+    parallel = csvToAdibin(csv_dir, str(tmp_path / 'parallel') + os.sep, workers=workers,
+                           chunk_bytes=chunk_bytes)
+    assert serial == parallel
+    assert serial['rows'] == 55 and serial['problem_rows'] == 0
+
+    serial_outputs = read_outputs(str(tmp_path / 'serial'))
+    assert len(serial_outputs) == 55
+    assert serial_outputs == read_outputs(str(tmp_path / 'parallel'))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
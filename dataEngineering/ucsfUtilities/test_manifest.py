@@ -0,0 +1,97 @@
+import glob
+import os
+
+import pytest
+
+from benchmarkPipeline import makeSyntheticCsv, CHANNEL_SETS
+from csvToAdibin import csvToAdibin, openManifest, manifestLookup
+
+NUM_ROWS = 8
+
+
+@pytest.fixture
+def converted(tmp_path, monkeypatch):
+    # one admission converted once with a manifest
+    monkeypatch.chdir(tmp_path)
+    paths = {'csv_dir': str(tmp_path / 'csv') + os.sep,
+             'out_dir': str(tmp_path / 'out') + os.sep,
+             'manifest': str(tmp_path / 'manifest.sqlite')}
+    paths['csv'] = os.path.join(paths['csv_dir'], 'adm1.csv')
+    makeSyntheticCsv(paths['csv'], CHANNEL_SETS['ecg'], 2, NUM_ROWS, seed=5)
+    report = convert(paths)
+    assert report['rows'] == NUM_ROWS and report['skipped_files'] == 0
+    return paths
+
+
+def convert(paths, verify=False):
+    return csvToAdibin(paths['csv_dir'], paths['out_dir'], manifest_path=paths['manifest'],
+                       verify=verify)
+
+
+def read_outputs(directory):
+    outputs = {}
+    for filename in sorted(glob.glob(directory + '*.adibin')):
+        with open(filename, 'rb') as adibin_file:
+            outputs[filename] = adibin_file.read()
+    return outputs
+
+
+def test_unchanged_source_is_skipped(converted):
+    outputs = read_outputs(converted['out_dir'])
+    report = convert(converted)
+    assert report['skipped_files'] == 1 and report['rows'] == 0 and report['skipped_rows'] == 0
+    assert read_outputs(converted['out_dir']) == outputs
+
+
+def test_changed_source_is_converted_again(converted):
+    stat = os.stat(converted['csv'])
+    os.utime(converted['csv'], (stat.st_atime, stat.st_mtime + 10))
+    report = convert(converted)
+    # the file is read again, but every row still has an intact output
+    assert report['skipped_files'] == 0
+    assert report['rows'] == 0 and report['skipped_rows'] == NUM_ROWS
+
+    # a new row grows the file and is the only one converted
+    with open(converted['csv']) as csv_file:
+        lines = csv_file.readlines()
+    with open(converted['csv'], 'w') as csv_file:
+        csv_file.writelines(lines + [lines[0].replace(lines[0].split(',')[0], 'new_alarm', 1)])
+    report = convert(converted)
+    assert report['rows'] == 1 and report['skipped_rows'] == NUM_ROWS
+    assert len(read_outputs(converted['out_dir'])) == NUM_ROWS + 1
+
+
+def test_verify_catches_corrupted_output(converted):
+    outputs = read_outputs(converted['out_dir'])
+    corrupted = sorted(outputs)[3]
+    data = bytearray(outputs[corrupted])
+    data[-1] ^= 0xff
+    with open(corrupted, 'wb') as adibin_file:
+        adibin_file.write(data)
+
+    # same size, so only verify rereads and notices it
+    assert convert(converted)['skipped_files'] == 1
+    report = convert(converted, verify=True)
+    assert report['rows'] == 1 and report['skipped_rows'] == NUM_ROWS - 1
+    assert read_outputs(converted['out_dir']) == outputs
+
+
+def test_missing_output_resumes_the_rest(converted):
+    outputs = read_outputs(converted['out_dir'])
+    missing = sorted(outputs)[5]
+    os.remove(missing)
+
+    manifest = openManifest(converted['manifest'])
+    file_is_done, done_rows = manifestLookup(manifest, converted['csv'], os.stat(converted['csv']))
+    manifest.close()
+    assert not file_is_done
+    assert len(done_rows) == NUM_ROWS - 1
+    assert missing not in [output_path for row_digest, output_path in done_rows.values()]
+
+    report = convert(converted)
+    assert report['rows'] == 1 and report['skipped_rows'] == NUM_ROWS - 1
+    assert read_outputs(converted['out_dir']) == outputs
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
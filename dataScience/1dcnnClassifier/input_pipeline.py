@@ -0,0 +1,193 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+###############################################################
+###                     Data                                ###
+###############################################################
+# Produces data batches of (training(X,y), validation(X,y)) sets for
+# pvc_p.train_n_steps from (memory-mapped) window and label arrays, e.g. the
+# .npy files written by mitbihExploration/window_cache.py.
+
+# queue sentinels of data_gen.prefetched
+END_OF_DATA = object()
+
+
+class producer_error(object):
+    # carries an exception of a prefetch thread to the consumer
+    def __init__(self, error):
+        self.error = error
+
+
+class data_gen(object):
+
+    # param X: (n_windows, T, C) array of windows, may be a numpy.memmap
+    # param y: (n_windows,) labels
+    # param batch_size: N of the pvc_p model
+    # param validation_fraction: the last part of X/y is held out for validation;
+    #       windows are stored record by record, so this holds out whole records
+    # param shuffle_buffer: windows kept in memory to shuffle from, like tf.data's shuffle
+    # param prefetch: batches prepared ahead on background threads, 0 prepares each
+    #       batch in the caller's thread
+    # param block_size: training windows are streamed from X in blocks of this many
+    #       rows, with the block order reshuffled each epoch
+    def __init__(self, X, y, batch_size, validation_fraction=0.1, shuffle_buffer=10000,
+                 prefetch=4, block_size=1024, seed=0):
+        self.X = X
+        self.y = np.asarray(y, dtype=np.float32).reshape(-1, 1)
+        self.batch_size = batch_size
+        self.shuffle_buffer = max(batch_size, shuffle_buffer)
+        self.prefetch = prefetch
+        self.block_size = block_size
+        self.rng = np.random.RandomState(seed)
+
+        n_windows = len(self.y)
+        self.num_train = n_windows - int(round(validation_fraction * n_windows))
+        if self.num_train < self.batch_size or n_windows - self.num_train < self.batch_size:
+            raise ValueError('need at least one batch of training and of validation windows')
+
+    # Training windows, one block at a time, reshuffling block order every epoch
+    def train_stream(self, rng):
+        starts = np.arange(0, self.num_train, self.block_size)
+        while True:
+            rng.shuffle(starts)
+            for start in starts:
+                end = min(start + self.block_size, self.num_train)
+                yield np.asarray(self.X[start:end], dtype=np.float32), self.y[start:end]
+
+    # Endless shuffled training batches drawn from a bounded buffer
+    def train_batches(self, rng):
+        stream = self.train_stream(rng)
+        buffer_X = []
+        buffer_y = []
+        buffered = 0
+        while buffered < min(self.shuffle_buffer, self.num_train):
+            X_block, y_block = next(stream)
+            buffer_X.append(X_block)
+            buffer_y.append(y_block)
+            buffered += len(y_block)
+        buffer_X = np.concatenate(buffer_X)
+        buffer_y = np.concatenate(buffer_y)
+        pending_X = np.empty((0,) + buffer_X.shape[1:], dtype=np.float32)
+        pending_y = np.empty((0, 1), dtype=np.float32)
+
+        while True:
+            # every batch takes random windows out of the buffer and the next
+            # windows of the stream take their places
+            while len(pending_y) < self.batch_size:
+                X_block, y_block = next(stream)
+                pending_X = np.concatenate((pending_X, X_block))
+                pending_y = np.concatenate((pending_y, y_block))
+            slots = rng.choice(len(buffer_y), self.batch_size, replace=False)
+            batch = buffer_X[slots], buffer_y[slots]
+            buffer_X[slots] = pending_X[:self.batch_size]
+            buffer_y[slots] = pending_y[:self.batch_size]
+            pending_X = pending_X[self.batch_size:]
+            pending_y = pending_y[self.batch_size:]
+            yield batch
+
+    # Endless random validation batches, rows read in sorted order
+    def validation_batches(self, rng):
+        n_windows = len(self.y)
+        while True:
+            rows = np.sort(rng.choice(np.arange(self.num_train, n_windows), self.batch_size,
+                                      replace=False))
+            yield np.asarray(self.X[rows], dtype=np.float32), self.y[rows]
+
+    # Runs a batch generator on a daemon thread, feeding a queue of size prefetch.
+    # The producer always ends with a sentinel, END_OF_DATA when the generator
+    # is exhausted or a producer_error when it raised, so the consumer never
+    # waits on a thread that is gone
+    def prefetched(self, batches, stop):
+        batch_queue = queue.Queue(maxsize=self.prefetch)
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for batch in batches:
+                    if not put(batch):
+                        return
+            except Exception as e:
+                put(producer_error(e))
+                return
+            put(END_OF_DATA)
+
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            item = batch_queue.get()
+            if item is END_OF_DATA:
+                return
+            if isinstance(item, producer_error):
+                raise item.error
+            yield item
+
+    # param n: number of (train, validation) pairs to produce, as pvc_p.train_n_steps expects
+    def __call__(self, n):
+        seeds = self.rng.randint(2**31, size=2)
+        train = self.train_batches(np.random.RandomState(seeds[0]))
+        validation = self.validation_batches(np.random.RandomState(seeds[1]))
+        if self.prefetch <= 0:
+            for i, batches in zip(range(n), zip(train, validation)):
+                yield batches
+            return
+
+        stop = threading.Event()
+        try:
+            train = self.prefetched(train, stop)
+            validation = self.prefetched(validation, stop)
+            for i, batches in zip(range(n), zip(train, validation)):
+                yield batches
+        finally:
+            stop.set()
+
+
+# Measures training steps per second with and without prefetching
+# param step: callable(train_batch, validation_batch), e.g. one pvc_p training step;
+#       when it is None only the pipeline itself is timed
+def steps_per_sec(pipeline, n, step=None, prefetch_values=(0, 4)):
+    results = {}
+    original_prefetch = pipeline.prefetch
+    try:
+        for prefetch in prefetch_values:
+            pipeline.prefetch = prefetch
+            start_time = time.perf_counter()
+            for train_batch, validation_batch in pipeline(n):
+                if step is not None:
+                    step(train_batch, validation_batch)
+            results[prefetch] = n / (time.perf_counter() - start_time)
+    finally:
+        pipeline.prefetch = original_prefetch
+    return results
+
+
+def pvc_p_step(model):
+    # the body of pvc_p.train_n_steps as a step for steps_per_sec
+    def step(train_batch, validation_batch):
+        model.sgd_update(train_batch[0], train_batch[1])
+        model.get_error(validation_batch[0], validation_batch[1])
+    return step
+
+
+if __name__ == '__main__':
+    import sys
+
+    # python input_pipeline.py windows.npy labels.npy [batch_size]
+    X = np.load(sys.argv[1], mmap_mode='r')
+    y = np.load(sys.argv[2], mmap_mode='r')
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    pipeline = data_gen(X, y, batch_size)
+
+    from pvc_p import pvc_p
+    model = pvc_p(batch_size, X.shape[1], X.shape[2])
+    for prefetch, rate in sorted(steps_per_sec(pipeline, 200, pvc_p_step(model)).items()):
+        print('prefetch %d: %.1f steps/sec' % (prefetch, rate))
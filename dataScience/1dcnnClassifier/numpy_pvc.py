@@ -0,0 +1,154 @@
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+###############################################################
+###              NumPy inference for pvc_p weights          ###
+###############################################################
+# Scores windows with the parameters written by pvc_p.export_weights, without
+# TensorFlow. The network has no nonlinearity before its sigmoid:
+#
+#   logit = sum_t,f (sum_k,c X[t+k, c] W1[k, c, f] + b1[f]) fc[t*F + f] + b2
+#
+# so at load time the convolution and the fully connected layer are folded into
+# one (T, C) weight array and a constant, and a batch of windows is scored with
+# a single matrix-vector product.
+
+PREDICT_CHUNK_SIZE = 1024
+
+
+class numpy_pvc(object):
+
+    # param weights_filename: .npz written by pvc_p.export_weights
+    def __init__(self, weights_filename):
+        with np.load(weights_filename) as weights:
+            self.layer_1_filters = weights['layer_1_filters']   # (width, C, F)
+            self.layer_1_bias = weights['layer_1_bias']         # (1, 1, F)
+            self.layer_2_fc = weights['layer_2_fc']             # ((T - width + 1) * F, 1)
+            self.layer_2_bias = weights['layer_2_bias']         # (1,)
+            self.num_samples = int(weights['num_samples'])
+            self.num_channels = int(weights['num_channels'])
+
+        width, C, F = self.layer_1_filters.shape
+        fc = self.layer_2_fc.reshape(self.num_samples - width + 1, F).astype(np.float64)
+        filters = self.layer_1_filters.astype(np.float64)
+
+        # weight of input sample s = t + k: sum over every filter tap k that reads it
+        weights = np.zeros((self.num_samples, C))
+        for k in range(width):
+            weights[k:k + len(fc)] += fc.dot(filters[k].T)
+        self.weights = weights.reshape(-1).astype(np.float32)
+        self.constant = float(fc.dot(self.layer_1_bias.reshape(-1)).sum() + self.layer_2_bias[0])
+
+    # param X: any number of (T, C) windows
+    def predict(self, X, thresh=0.5, chunk_size=PREDICT_CHUNK_SIZE):
+        return self.predict_proba(X, chunk_size) > thresh
+
+    # PVC probabilities, shape (len(X), 1), as pvc_p.predict_proba
+    def predict_proba(self, X, chunk_size=PREDICT_CHUNK_SIZE):
+        probabilities = np.empty((len(X), 1), dtype=np.float32)
+        for start in range(0, len(X), chunk_size):
+            probabilities[start:start + chunk_size, 0] = self.logits(X[start:start + chunk_size])
+        return 1. / (1. + np.exp(-probabilities))
+
+    # param X: array (or numpy.memmap) of windows, read chunk_size at a time
+    # yields (probabilities, labels) for every chunk in order
+    def predict_chunks(self, X, thresh=0.5, chunk_size=PREDICT_CHUNK_SIZE):
+        for start in range(0, len(X), chunk_size):
+            probabilities = self.predict_proba(X[start:start + chunk_size], chunk_size)
+            yield probabilities, probabilities > thresh
+
+    def logits(self, X):
+        X = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+        return X.dot(self.weights) + self.constant
+
+    # The graph of pvc_p layer by layer, for checking the folded weights
+    def layer_forward(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        width = self.layer_1_filters.shape[0]
+        T_out = self.num_samples - width + 1
+        X_1 = sum(np.einsum('ntc,cf->ntf', X[:, k:k + T_out], self.layer_1_filters[k])
+                  for k in range(width)) + self.layer_1_bias
+        logits = X_1.reshape(len(X), -1).dot(self.layer_2_fc) + self.layer_2_bias
+        return 1. / (1. + np.exp(-logits))
+
+
+###############################################################
+###                        Benchmark                        ###
+###############################################################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_SCRIPTS = {
+    'numpy': ("import time; start = time.perf_counter()\n"
+              "from numpy_pvc import numpy_pvc\n"
+              "model = numpy_pvc(%(weights)r)\n"
+              "print(time.perf_counter() - start)\n"),
+    'tensorflow': ("import time; start = time.perf_counter()\n"
+                   "from pvc_p import pvc_p\n"
+                   "model = pvc_p(10, %(T)d, %(C)d)\n"
+                   "model.load_session(%(session)r)\n"
+                   "print(time.perf_counter() - start)\n"),
+}
+
+
+# Seconds from a fresh interpreter to a model ready to score, imports included
+def startup_seconds(engine, weights_filename=None, session_filename=None, T=2400, C=1):
+    script = STARTUP_SCRIPTS[engine] % {'weights': weights_filename, 'session': session_filename,
+                                        'T': T, 'C': C}
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=HERE)
+    return float(output.decode().strip().splitlines()[-1])
+
+
+# windows/sec of predict_proba for each chunk size
+def throughput(model, X, chunk_sizes=(64, 256, 1024, 4096)):
+    results = {}
+    for chunk_size in chunk_sizes:
+        model.predict_proba(X[:chunk_size], chunk_size)  # warm up
+        start_time = time.perf_counter()
+        model.predict_proba(X, chunk_size)
+        results[chunk_size] = len(X) / (time.perf_counter() - start_time)
+    return results
+
+
+# Compares the exported engine with the TF graph a session was restored into
+def compare(session_filename, weights_filename, T=2400, C=1, n=8192):
+    X = np.random.rand(n, T, C).astype(np.float32)
+    engine = numpy_pvc(weights_filename)
+    report = {'numpy': {'startup_sec': startup_seconds('numpy', weights_filename, T=T, C=C),
+                        'windows_per_sec': throughput(engine, X)}}
+    try:
+        from pvc_p import pvc_p
+    except ImportError as e:
+        report['tensorflow'] = {'error': str(e)}
+        return report
+
+    model = pvc_p(10, T, C)
+    model.load_session(session_filename)
+    report['tensorflow'] = {'startup_sec': startup_seconds('tensorflow', session_filename=session_filename,
+                                                           T=T, C=C),
+                            'windows_per_sec': model.predict_throughput(X)}
+    report['max_abs_difference'] = float(np.abs(model.predict_proba(X) - engine.predict_proba(X)).max())
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Export pvc_p weights and compare NumPy and TF inference')
+    parser.add_argument('session', help='saved session name in tf_saved_models/')
+    parser.add_argument('--weights', default='pvc_p_weights.npz')
+    parser.add_argument('--samples', type=int, default=2400, help='samples per window (T)')
+    parser.add_argument('--channels', type=int, default=1, help='channels per window (C)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        from pvc_p import pvc_p
+        model = pvc_p(10, args.samples, args.channels)
+        model.load_session(args.session)
+        model.export_weights(args.weights)
+    print(json.dumps(compare(args.session, args.weights, args.samples, args.channels), indent=2))
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+###############################################################
+###              Load generator for pvc_service             ###
+###############################################################
+# Sends random windows to a running pvc_service from many threads at once and
+# reports client-side latency percentiles, throughput and the service's /stats.
+
+
+def post_windows(url, windows, binary=True):
+    if binary:
+        request = urllib.request.Request(url + '/predict', data=windows.astype('<f4').tobytes(),
+                                         headers={'Content-Type': 'application/octet-stream'})
+    else:
+        request = urllib.request.Request(url + '/predict',
+                                         data=json.dumps({'windows': windows.tolist()}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())['probabilities']
+
+
+def get_stats(url):
+    with urllib.request.urlopen(url + '/stats') as response:
+        return json.loads(response.read())
+
+
+# param clients: concurrent client threads
+# param requests: requests per client
+# param windows_per_request: windows in each request
+def generate_load(url, T, C=1, clients=16, requests=100, windows_per_request=1, binary=True,
+                  seed=0):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(client_seed):
+        rng = np.random.RandomState(client_seed)
+        for i in range(requests):
+            windows = rng.randn(windows_per_request, T, C).astype(np.float32)
+            start_time = time.perf_counter()
+            try:
+                probabilities = post_windows(url, windows, binary)
+                assert len(probabilities) == windows_per_request
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start_time)
+
+    threads = [threading.Thread(target=client, args=(seed + i,)) for i in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    latencies = np.array(latencies) * 1000
+    results = {'requests': len(latencies),
+               'errors': len(errors),
+               'requests_per_sec': len(latencies) / elapsed,
+               'windows_per_sec': len(latencies) * windows_per_request / elapsed}
+    if len(latencies):
+        results['latency_ms'] = dict(('p%d' % q, float(np.percentile(latencies, q)))
+                                     for q in (50, 90, 99))
+        results['latency_ms']['max'] = float(latencies.max())
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load generator for pvc_service')
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--samples', type=int, default=2400, help='samples per window (T)')
+    parser.add_argument('--channels', type=int, default=1, help='channels per window (C)')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100, help='requests per client')
+    parser.add_argument('--windows', type=int, default=1, help='windows per request')
+    parser.add_argument('--json', action='store_true', help='send json instead of float32 bytes')
+    args = parser.parse_args()
+
+    results = generate_load(args.url, args.samples, args.channels, args.clients, args.requests,
+                            args.windows, not args.json)
+    print('client:', json.dumps(results, indent=2))
+    print('service:', json.dumps(get_stats(args.url), indent=2))
@@ -1,12 +1,21 @@
 import tensorflow as tf
 import datetime
+import os
+import time
+import numpy as np
 import scipy as sci
 
+from input_pipeline import data_gen
+
 #############################################################
 ###                    CNN Trainer                        ###
 #############################################################
 
 
+# Windows per session.run when predicting
+PREDICT_CHUNK_SIZE = 1024
+
+
 class pvc_p(object):
 
     def __init__(self, N, T, C):
@@ -15,13 +24,16 @@ class pvc_p(object):
         self.num_samples = T  # Number of samples/dimension of input space
         self.num_channels = C    # Number of channels
 
-        self.input_shape = [self.num_mini_batch,
+        # Batch dimension left open so any number of windows can be fed;
+        # N is only the training mini-batch size
+        self.input_shape = [None,
                             self.num_samples,
                             self.num_channels]
 
         self.X_in = tf.placeholder(dtype=tf.float32, shape=self.input_shape)
         self.y_in = tf.placeholder(dtype=tf.float32, shape=[
                                    self.input_shape[0], 1])
+        self.batch_size = tf.cast(tf.shape(self.X_in)[0], tf.float32)
 
         # Model Hyperparameters and Convenience Quantities
         self.learning_rate = 1.0
@@ -68,14 +80,14 @@ class pvc_p(object):
                                            filters=self.layer_1_filters,
                                            stride=1,
                                            padding='VALID') + self.layer_1_bias,
-                              [self.num_mini_batch, self.layer_1_output_reshape_size])
+                              [-1, self.layer_1_output_reshape_size])
 
         self.pvc_logits = tf.matmul(
             self.X_1, self.layer_2_fc) + self.layer_2_bias
         self.pvc_dobs = tf.sigmoid(self.pvc_logits)
 
         # Error measure
-        self.error = (1/self.num_mini_batch)*(self.learning_rate*tf.reduce_sum(
+        self.error = (1/self.batch_size)*(self.learning_rate*tf.reduce_sum(
             tf.nn.sigmoid_cross_entropy_with_logits(labels=self.y_in,
                                                     logits=self.pvc_logits)) +
                                               self.regularization_rate*(tf.reduce_sum(tf.square(self.layer_1_filters)) +
@@ -95,9 +107,35 @@ class pvc_p(object):
         self.model_dir = 'tf_saved_models/'
         self.saver = tf.train.Saver()
 
-    # param X: input values (ecg sequences)
-    def predict(self, X, thresh=0.5):
-        return self.sess.run(self.pvc_dobs, feed_dict={self.X_in: X}) > thresh
+    # param X: input values (ecg sequences), any number of (T, C) windows
+    def predict(self, X, thresh=0.5, chunk_size=PREDICT_CHUNK_SIZE):
+        return self.predict_proba(X, chunk_size) > thresh
+
+    # PVC probabilities, shape (len(X), 1)
+    def predict_proba(self, X, chunk_size=PREDICT_CHUNK_SIZE):
+        probabilities = [chunk_probabilities for chunk_probabilities, _
+                         in self.predict_chunks(X, chunk_size=chunk_size)]
+        if not probabilities:
+            return np.zeros((0, self.network_output_size), dtype=np.float32)
+        return np.concatenate(probabilities)
+
+    # param X: array (or numpy.memmap) of windows, read chunk_size at a time
+    # yields (probabilities, labels) for every chunk in order
+    def predict_chunks(self, X, thresh=0.5, chunk_size=PREDICT_CHUNK_SIZE):
+        for start in range(0, len(X), chunk_size):
+            X_chunk = np.asarray(X[start:start + chunk_size], dtype=np.float32)
+            probabilities = self.sess.run(self.pvc_dobs, feed_dict={self.X_in: X_chunk})
+            yield probabilities, probabilities > thresh
+
+    # windows/sec of predict_proba over X for each chunk size
+    def predict_throughput(self, X, chunk_sizes=(64, 256, 1024, 4096)):
+        results = {}
+        for chunk_size in chunk_sizes:
+            self.predict_proba(X[:chunk_size], chunk_size)  # warm up
+            start_time = time.perf_counter()
+            self.predict_proba(X, chunk_size)
+            results[chunk_size] = len(X) / (time.perf_counter() - start_time)
+        return results
 
     # param n: number of training steps
     # param data_gen_iterable: on each iteration, should return a pair of dataset batches (X,y):
@@ -116,13 +154,13 @@ class pvc_p(object):
     # Performs a single training step based on X and y
     def sgd_update(self, X_instance, y_instance):
         E, _ = self.sess.run([self.error, self.train_step], feed_dict={
-                             X_in: X_instance, y_in: y_instance})
+                             self.X_in: X_instance, self.y_in: y_instance})
         return E
 
     # just returns error without update
     def get_error(self, X_instance, y_instance):
         E = self.sess.run(self.error, feed_dict={
-                          X_in: X_instance, y_in: y_instance})
+                          self.X_in: X_instance, self.y_in: y_instance})
         return E
 
     def reinitialize_sess(self):
@@ -141,27 +179,23 @@ class pvc_p(object):
         self.saver.restore(self.sess,
                            self.model_dir + in_filename)
 
+    # Writes the trained parameters to a .npz for numpy_pvc, which scores without TensorFlow
+    def export_weights(self, out_filename):
+        filters, bias, fc, fc_bias = self.sess.run([self.layer_1_filters, self.layer_1_bias,
+                                                    self.layer_2_fc, self.layer_2_bias])
+        np.savez(out_filename,
+                 layer_1_filters=filters,
+                 layer_1_bias=bias,
+                 layer_2_fc=fc,
+                 layer_2_bias=fc_bias,
+                 num_samples=self.num_samples,
+                 num_channels=self.num_channels)
+
     # Tests the forward pass for shape compatibility
     def test_forward(self, N, T, C):
         X = sci.random.rand(N, T).reshape([N, T, C])
         print(self.predict(X))
 
-###############################################################
-###                     Data                                ###
-###############################################################
-# data_gen will be moved into a separate module.
-# Will produce data batches of (training(X,y), validation(X,y)) sets
-
-class data_gen:
-    def __init__(self):
-        pass
-
-    def __iter__(self):
-        pass
-
-    def __next__(self, n):
-        pass
-
 
 def train_repl():
     print()
@@ -180,7 +214,7 @@ Available Commands:
     set:     
         param:   set hyperparameters of tf model
         init:    initialize or reinitialize session (loss warning)
-        data:    
+        data:    load windows.npy and labels.npy for training
 
     save:        save current session
 
@@ -201,7 +235,7 @@ Available Commands:
     C = 1
 
     aa = pvc_p(N, T, C)
-    data_source = data_gen()
+    data_source = None
 
     PS1 = 'CalCardiac>>> '
 
@@ -231,7 +265,20 @@ Available Commands:
             if second == 'param':  # Parameter setting
                 print('not yet implemented')
 
+            elif second == 'data':  # Memory-mapped (n, T, C) windows and (n,) labels
+                windows_filename = input('Windows .npy filename: ')
+                labels_filename = input('Labels .npy filename: ')
+                try:
+                    data_source = data_gen(np.load(windows_filename, mmap_mode='r'),
+                                           np.load(labels_filename, mmap_mode='r'),
+                                           N)
+                except Exception as e:
+                    print('failed to load data \n', str(e))
+
         elif first == 'train':  # Training
+            if data_source is None:
+                print('no data loaded. type "set data" first')
+                continue
             try:
                 n = int(input('Number of steps: '))
                 aa.train_n_steps(n, data_source)
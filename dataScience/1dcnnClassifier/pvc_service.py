@@ -0,0 +1,250 @@
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+###############################################################
+###                 Micro-batching PVC service              ###
+###############################################################
+# Long-running localhost HTTP service that loads a pvc_p session once and
+# scores windows for many concurrent clients, gathering their requests into
+# micro-batches so the model runs once per batch instead of once per request.
+#
+#   POST /predict  body: {"windows": [[...], ...]} (each window T samples, or T x C)
+#                  or application/octet-stream: little-endian float32 windows
+#                  reply: {"probabilities": [...]} one per window
+#   GET  /stats    latency percentiles and batch size statistics
+
+MAX_BATCH = 1024        # windows per model call
+MAX_DELAY = 0.005       # seconds the first request of a batch may wait for others
+STATS_WINDOW = 10000    # most recent requests/batches kept for statistics
+
+
+class service_stopped(Exception):
+    # raised to requests that arrive, or are still waiting, when the batcher stops
+    pass
+
+
+class micro_batcher(object):
+
+    # param predict_fn: callable mapping an (n, T, C) float32 array to n probabilities
+    # param max_batch: most windows run in one predict_fn call
+    # param max_delay: longest time (s) a request waits for others to join its batch
+    def __init__(self, predict_fn, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+
+        self.stats_lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=STATS_WINDOW)
+        self.batch_sizes = collections.deque(maxlen=STATS_WINDOW)
+        self.num_requests = 0
+        self.num_windows = 0
+        self.num_batches = 0
+
+        self.running = True
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    # Blocks until the windows of one request are scored, returns their probabilities
+    def submit(self, windows):
+        request = {'windows': windows, 'done': threading.Event(),
+                   'start_time': time.perf_counter()}
+        with self.condition:
+            if not self.running:
+                raise service_stopped('service is stopping')
+            self.pending.append(request)
+            self.condition.notify()
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+
+        with self.stats_lock:
+            self.latencies.append(time.perf_counter() - request['start_time'])
+            self.num_requests += 1
+        return request['probabilities']
+
+    # Takes requests until max_batch windows are waiting or the oldest has waited max_delay
+    def next_batch(self):
+        with self.condition:
+            while not self.pending and self.running:
+                self.condition.wait()
+            if not self.running:
+                return []
+            deadline = self.pending[0]['start_time'] + self.max_delay
+            while sum(len(request['windows']) for request in self.pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = []
+            batch_windows = 0
+            while self.pending and (not batch or
+                                    batch_windows + len(self.pending[0]['windows']) <= self.max_batch):
+                request = self.pending.popleft()
+                batch.append(request)
+                batch_windows += len(request['windows'])
+            return batch
+
+    def run(self):
+        while self.running:
+            batch = self.next_batch()
+            if not batch:
+                continue
+            num_windows = sum(len(request['windows']) for request in batch)
+            try:
+                windows = np.concatenate([request['windows'] for request in batch])
+                probabilities = np.asarray(self.predict_fn(windows)).reshape(-1)
+                start = 0
+                for request in batch:
+                    request['probabilities'] = probabilities[start:start + len(request['windows'])]
+                    start += len(request['windows'])
+            except Exception as e:
+                for request in batch:
+                    request['error'] = e
+            with self.stats_lock:
+                self.batch_sizes.append(num_windows)
+                self.num_windows += num_windows
+                self.num_batches += 1
+            for request in batch:
+                request['done'].set()
+
+        # requests still waiting when stop() was called are answered with an
+        # error instead of being left blocked in submit
+        with self.condition:
+            while self.pending:
+                request = self.pending.popleft()
+                request['error'] = service_stopped('service is stopping')
+                request['done'].set()
+
+    # Stops the worker; the batch it is running finishes, waiting requests fail
+    def stop(self, timeout=None):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.worker.join(timeout)
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = np.array(self.batch_sizes)
+            stats = {'requests': self.num_requests,
+                     'windows': self.num_windows,
+                     'batches': self.num_batches,
+                     'max_batch': self.max_batch,
+                     'max_delay_ms': self.max_delay * 1000}
+        if len(latencies):
+            stats['latency_ms'] = dict(('p%d' % q, float(np.percentile(latencies, q)))
+                                       for q in (50, 90, 99))
+            stats['latency_ms']['max'] = float(latencies.max())
+        if len(batch_sizes):
+            stats['batch_size'] = {'mean': float(batch_sizes.mean()),
+                                   'p50': float(np.percentile(batch_sizes, 50)),
+                                   'max': int(batch_sizes.max())}
+        return stats
+
+
+def make_handler(batcher, T, C):
+
+    class pvc_handler(BaseHTTPRequestHandler):
+
+        def reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.reply(200, batcher.stats())
+            else:
+                self.reply(404, {'error': 'unknown path'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.reply(404, {'error': 'unknown path'})
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                if self.headers.get('Content-Type') == 'application/octet-stream':
+                    windows = np.frombuffer(body, dtype='<f4').reshape(-1, T, C)
+                else:
+                    windows = np.asarray(json.loads(body)['windows'], dtype=np.float32)
+                    windows = windows.reshape(len(windows), T, C)
+            except Exception as e:
+                self.reply(400, {'error': 'bad windows: ' + str(e)})
+                return
+            try:
+                probabilities = batcher.submit(windows)
+            except service_stopped as e:
+                self.reply(503, {'error': str(e)})
+                return
+            except Exception as e:
+                self.reply(500, {'error': str(e)})
+                return
+            self.reply(200, {'probabilities': probabilities.tolist()})
+
+        def log_message(self, format, *args):
+            pass
+
+    return pvc_handler
+
+
+class pvc_server(ThreadingHTTPServer):
+    # one thread per connection; a deep listen backlog so bursts of clients are
+    # queued instead of refused
+    daemon_threads = True
+    request_queue_size = 128
+
+
+# param predict_fn: as for micro_batcher
+# param T, C: samples and channels per window
+def make_server(predict_fn, T, C, host='127.0.0.1', port=8765,
+                max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+    batcher = micro_batcher(predict_fn, max_batch, max_delay)
+    server = pvc_server((host, port), make_handler(batcher, T, C))
+    server.batcher = batcher
+    return server
+
+
+# Builds the graph and restores a saved session once, for the life of the service
+def load_model(session_filename, T, C, N=10):
+    from pvc_p import pvc_p
+    model = pvc_p(N, T, C)
+    model.load_session(session_filename)
+    return model
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Micro-batching PVC scoring service')
+    parser.add_argument('session', help='saved session name in tf_saved_models/')
+    parser.add_argument('--samples', type=int, default=2400, help='samples per window (T)')
+    parser.add_argument('--channels', type=int, default=1, help='channels per window (C)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max-delay-ms', type=float, default=MAX_DELAY * 1000)
+    args = parser.parse_args()
+
+    model = load_model(args.session, args.samples, args.channels)
+    server = make_server(model.predict_proba, args.samples, args.channels, args.host, args.port,
+                         args.max_batch, args.max_delay_ms / 1000)
+    print('serving PVC probabilities on http://%s:%d/predict' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.batcher.stop()
+        server.server_close()
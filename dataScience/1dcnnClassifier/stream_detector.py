@@ -0,0 +1,374 @@
+import collections
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.signal as sig
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'dataEngineering', 'adiConversion'))
+from processing_components import StreamingResampler
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'dataEngineering', 'mitbihExploration'))
+from beat_features import BEAT_SYMBOLS
+
+###############################################################
+###              Real-time streaming PVC detector           ###
+###############################################################
+# Samples arrive a chunk at a time for any number of patients. Each stream
+# keeps a ring buffer and a causal beat locator; once a beat's window has all
+# of its trailing context it is queued, and evaluate() scores every queued beat
+# of every stream in one model call and publishes one decision per beat.
+
+MITBIH_FS = 360
+HALF_WINDOW = 0.4          # seconds either side of the R-peak, the small models' 288 samples
+BUFFER_SECONDS = 10        # history kept per stream
+
+# decision: one scored beat
+# beat_sample: R-peak index in the stream (model rate, from the start of the stream)
+# latency: seconds from the arrival of the beat's last window sample to the decision
+decision = collections.namedtuple('decision', ['patient_id', 'beat_sample', 'probability',
+                                               'is_pvc', 'latency'])
+
+
+class ring_buffer(object):
+
+    # Last capacity samples of a (samples, channels) stream, addressed by absolute index
+    def __init__(self, capacity, channels, dtype=np.float32):
+        self.data = np.zeros((capacity, channels), dtype=dtype)
+        self.capacity = capacity
+        self.end = 0  # absolute index of the next sample
+
+    @property
+    def start(self):
+        return max(0, self.end - self.capacity)
+
+    def append(self, samples):
+        n = len(samples)
+        if n > self.capacity:
+            self.end += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+        position = self.end % self.capacity
+        first = min(n, self.capacity - position)
+        self.data[position:position + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.end += n
+
+    def get(self, start, end):
+        if start < self.start or end > self.end:
+            raise IndexError('samples %d:%d are not in the buffer' % (start, end))
+        return self.data[np.arange(start, end) % self.capacity]
+
+
+class beat_locator(object):
+
+    # Causal Pan-Tompkins style QRS locator: 5-15 Hz band-pass, derivative,
+    # squaring and a 150 ms moving window integral, an adaptive threshold and a
+    # refractory period. Filter states carry across chunks.
+    # param fs: sampling frequency
+    # param refractory: shortest time (s) between beats
+    # param lookahead: time (s) a peak must stay the largest before it is a beat
+    # param learning: time (s) at the start used to set the first threshold
+    def __init__(self, fs, refractory=0.25, lookahead=0.1, learning=2.0):
+        self.fs = fs
+        self.band_b, self.band_a = sig.butter(2, [5. / (fs / 2.), 15. / (fs / 2.)], 'bandpass')
+        self.band_zi = None
+        self.integration = np.ones(int(0.15 * fs)) / int(0.15 * fs)
+        self.integration_zi = np.zeros(len(self.integration) - 1)
+        self.previous = 0.
+
+        self.refractory = int(refractory * fs)
+        self.lookahead = int(lookahead * fs)
+        self.learning = int(learning * fs)
+        self.search = int(0.2 * fs)
+
+        self.n = 0                  # absolute index of the next sample
+        self.signal_level = 0.      # running peak level of the integrated signal
+        self.candidate = None       # (index, value) of the largest peak not yet confirmed
+        self.last_beat = -self.refractory
+        self.learning_max = 0.
+
+    # param x: next samples of the detection channel
+    # returns absolute indices of beats confirmed in this chunk (integrated signal peaks)
+    def process(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.band_zi is None:
+            self.band_zi = sig.lfilter_zi(self.band_b, self.band_a) * x[0] if len(x) else None
+            if self.band_zi is None:
+                return []
+        band, self.band_zi = sig.lfilter(self.band_b, self.band_a, x, zi=self.band_zi)
+        derivative = np.diff(np.concatenate(([self.previous], band)))
+        self.previous = band[-1]
+        integrated, self.integration_zi = sig.lfilter(self.integration, 1., derivative**2,
+                                                      zi=self.integration_zi)
+
+        start = self.n
+        self.n += len(x)
+        beats = []
+
+        # first seconds only set the level
+        if start < self.learning:
+            learn = integrated[:self.learning - start]
+            self.learning_max = max(self.learning_max, learn.max())
+            if self.n < self.learning:
+                return beats
+            self.signal_level = self.learning_max
+            integrated = integrated[self.learning - start:]
+            start = self.learning
+
+        threshold = 0.3 * self.signal_level
+        for i in np.flatnonzero(integrated > 0.5 * threshold):
+            index = start + i
+            value = integrated[i]
+            if self.candidate is not None and index >= self.candidate[0] + self.lookahead:
+                beats.append(self.confirm())
+                threshold = 0.3 * self.signal_level
+            if self.candidate is None:
+                if value > threshold and index - self.last_beat > self.refractory:
+                    self.candidate = (index, value)
+            elif value > self.candidate[1]:
+                self.candidate = (index, value)
+        if self.candidate is not None and self.n - 1 >= self.candidate[0] + self.lookahead:
+            beats.append(self.confirm())
+
+        # recover after a long pause, e.g. an amplitude drop
+        if self.n - self.last_beat > 2 * self.fs and self.candidate is None:
+            self.signal_level *= 0.5
+            self.last_beat = self.n - self.fs
+        return beats
+
+    def confirm(self):
+        index, value = self.candidate
+        self.signal_level = 0.125 * value + 0.875 * self.signal_level
+        self.last_beat = index
+        self.candidate = None
+        return index
+
+
+class patient_stream(object):
+
+    def __init__(self, patient_id, fs, half_width, channels, detect_channel, input_fs):
+        self.patient_id = patient_id
+        self.buffer = ring_buffer(max(int(BUFFER_SECONDS * fs), 4 * half_width), channels)
+        self.locator = beat_locator(fs)
+        self.detect_channel = detect_channel
+        self.resampler = StreamingResampler(input_fs, fs, axis=0) \
+            if input_fs is not None and input_fs != fs else None
+        self.beats = collections.deque()   # located R-peaks whose window is not complete yet
+
+
+class stream_detector(object):
+
+    # param predict_fn: callable mapping (n, 2*half_width, channels) float32 windows to
+    #       n PVC probabilities, see pvc_p_predict_fn and sklearn_predict_fn
+    # param fs: model sampling frequency
+    # param sec: window half-width in seconds
+    # param input_fs: sampling frequency of the incoming samples, resampled to fs if different
+    # param on_decision: called with every decision as it is made
+    def __init__(self, predict_fn, fs=MITBIH_FS, sec=HALF_WINDOW, channels=1, detect_channel=0,
+                 thresh=0.5, input_fs=None, on_decision=None):
+        self.predict_fn = predict_fn
+        self.fs = fs
+        self.half_width = int(round(sec * fs))
+        self.channels = channels
+        self.detect_channel = detect_channel
+        self.thresh = thresh
+        self.input_fs = input_fs
+        self.on_decision = on_decision
+        self.streams = {}
+        self.ready = []     # (stream, r_peak, time its window completed)
+
+    def add_stream(self, patient_id):
+        self.streams[patient_id] = patient_stream(patient_id, self.fs, self.half_width,
+                                                  self.channels, self.detect_channel,
+                                                  self.input_fs)
+        return self.streams[patient_id]
+
+    # param samples: (n, channels) or (n,) new samples of one patient
+    # param arrival_time: time.perf_counter() when they arrived, now if None
+    def push(self, patient_id, samples, arrival_time=None):
+        arrival_time = time.perf_counter() if arrival_time is None else arrival_time
+        stream = self.streams.get(patient_id) or self.add_stream(patient_id)
+
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if stream.resampler is not None:
+            samples = stream.resampler.process(samples)
+        if len(samples) == 0:
+            return
+
+        stream.buffer.append(samples)
+        for beat in stream.locator.process(samples[:, self.detect_channel]):
+            stream.beats.append(self.refine(stream, beat))
+
+        # beats whose trailing context has now arrived
+        while stream.beats and stream.beats[0] + self.half_width <= stream.buffer.end:
+            r_peak = stream.beats.popleft()
+            if r_peak - self.half_width >= stream.buffer.start:
+                self.ready.append((stream, r_peak, arrival_time))
+
+    # R-peak: largest deviation of the raw signal shortly before the integrated peak
+    def refine(self, stream, beat):
+        start = max(stream.buffer.start, beat - stream.locator.search)
+        if start >= beat:
+            return beat
+        x = stream.buffer.get(start, beat)[:, self.detect_channel]
+        return start + int(np.argmax(np.abs(x - np.median(x))))
+
+    # Scores every beat whose window is complete, across all streams, in one model call
+    def evaluate(self):
+        if not self.ready:
+            return []
+        ready, self.ready = self.ready, []
+        windows = np.stack([stream.buffer.get(r_peak - self.half_width, r_peak + self.half_width)
+                            for stream, r_peak, _ in ready])
+        probabilities = np.asarray(self.predict_fn(windows), dtype=float).reshape(-1)
+
+        now = time.perf_counter()
+        decisions = [decision(stream.patient_id, r_peak, probability,
+                              probability > self.thresh, now - completed)
+                     for (stream, r_peak, completed), probability in zip(ready, probabilities)]
+        if self.on_decision is not None:
+            for beat_decision in decisions:
+                self.on_decision(beat_decision)
+        return decisions
+
+    def push_and_evaluate(self, patient_id, samples, arrival_time=None):
+        self.push(patient_id, samples, arrival_time)
+        return self.evaluate()
+
+
+###############################################################
+###                     Model adapters                      ###
+###############################################################
+
+def pvc_p_predict_fn(model):
+    # a pvc_p whose num_samples is 2*half_width
+    return lambda windows: model.predict_proba(windows)[:, 0]
+
+
+def sklearn_predict_fn(model):
+    # the pickled classical models take raw flattened windows; the random
+    # forests are regressors whose prediction is the PVC score
+    if hasattr(model, 'predict_proba'):
+        return lambda windows: model.predict_proba(windows.reshape(len(windows), -1))[:, 1]
+    return lambda windows: model.predict(windows.reshape(len(windows), -1))
+
+
+###############################################################
+###                     Replay harness                      ###
+###############################################################
+
+# param signals: {patient_id: (n, channels) array}
+# param speed: 1 is real time, 10 ten times faster, float('inf') as fast as possible
+# param chunk_seconds: seconds of samples pushed per stream per step
+# param annotations: optional {patient_id: (samples, symbols)} to score the decisions against
+def replay_signals(detector, signals, fs=MITBIH_FS, speed=1.0, chunk_seconds=0.1,
+                   annotations=None, dbg=False):
+    chunk = max(1, int(round(chunk_seconds * fs)))
+    length = max(len(x) for x in signals.values())
+    decisions = []
+
+    start_time = time.perf_counter()
+    for step, offset in enumerate(range(0, length, chunk)):
+        if speed != float('inf'):
+            delay = start_time + step * chunk / (fs * speed) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        for patient_id, x in signals.items():
+            if offset < len(x):
+                detector.push(patient_id, x[offset:offset + chunk])
+        decisions.extend(detector.evaluate())
+    elapsed = time.perf_counter() - start_time
+
+    latencies = np.array([d.latency for d in decisions]) * 1000
+    report = {'streams': len(signals),
+              'seconds_replayed': length / float(fs),
+              'elapsed_seconds': elapsed,
+              'realtime_factor': length / float(fs) / elapsed,
+              'beats': len(decisions),
+              'pvc_beats': int(sum(d.is_pvc for d in decisions))}
+    if len(latencies):
+        report['latency_ms'] = dict(('p%d' % q, float(np.percentile(latencies, q)))
+                                    for q in (50, 90, 99))
+        report['latency_ms']['max'] = float(latencies.max())
+    if annotations is not None:
+        record_lengths = dict((patient_id, len(x)) for patient_id, x in signals.items())
+        report.update(score_decisions(decisions, annotations, fs, detector.half_width,
+                                      record_lengths))
+    if dbg:
+        print(report)
+    return decisions, report
+
+
+# Beat detection and PVC agreement with the beat annotations (rhythm, noise and
+# comment marks are left out), matching within 50 ms
+# param record_lengths: {patient_id: samples streamed}, to leave out annotations
+#       too close to the end of a record to be windowed
+def score_decisions(decisions, annotations, fs, half_width, record_lengths):
+    tolerance = int(0.05 * fs)
+    counts = collections.Counter()
+    for patient_id, (samples, symbols) in annotations.items():
+        symbols = np.asarray(symbols)
+        is_beat = np.isin(symbols, BEAT_SYMBOLS)
+        samples = np.asarray(samples)[is_beat]
+        symbols = symbols[is_beat]
+        found = sorted((d.beat_sample, d.is_pvc) for d in decisions if d.patient_id == patient_id)
+        matched = np.zeros(len(samples), dtype=bool)
+        for beat, is_pvc in found:
+            nearest = np.searchsorted(samples, beat)
+            candidates = [j for j in (nearest - 1, nearest) if 0 <= j < len(samples)]
+            j = min(candidates, key=lambda j: abs(samples[j] - beat)) if candidates else None
+            if j is None or abs(samples[j] - beat) > tolerance or matched[j]:
+                counts['false_beats'] += 1
+                counts['pvc_false_positives'] += int(is_pvc)
+                continue
+            matched[j] = True
+            counts['matched_beats'] += 1
+            if symbols[j] == 'V':
+                counts['pvc_true_positives' if is_pvc else 'pvc_false_negatives'] += 1
+            elif is_pvc:
+                counts['pvc_false_positives'] += 1
+        # only annotations the detector could have windowed count as missed
+        windowable = (samples >= half_width) & (samples + half_width <= record_lengths[patient_id])
+        counts['missed_beats'] += int(np.sum(windowable & ~matched))
+        counts['missed_pvcs'] += int(np.sum(windowable & ~matched & (symbols == 'V')))
+    return dict(counts)
+
+
+# Streams MIT-BIH records side by side, one patient stream per record
+def replay(detector, records, data_dir=None, pb_dir='mitdb', channels=(1,), speed=1.0,
+           chunk_seconds=0.1, dbg=False):
+    from build_windows import read_signals, read_annotation
+
+    signals = {}
+    annotations = {}
+    for record in records:
+        signals[record] = read_signals(record, channels, data_dir, pb_dir)
+        annotation = read_annotation(record, data_dir, pb_dir)
+        annotations[record] = (annotation.sample, annotation.symbol)
+    return replay_signals(detector, signals, MITBIH_FS, speed, chunk_seconds, annotations, dbg)
+
+
+if __name__ == '__main__':
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description='Replay MIT-BIH records through the streaming PVC detector')
+    parser.add_argument('model', help='pickled classical model, e.g. RandomForestSmall.pkl')
+    parser.add_argument('records', nargs='+', type=int)
+    parser.add_argument('--data-dir', help='local MIT-BIH directory (physiobank when omitted)')
+    parser.add_argument('--speed', type=float, default=1.0, help="1 is real time, 'inf' as fast as possible")
+    parser.add_argument('--sec', type=float, default=HALF_WINDOW)
+    parser.add_argument('--thresh', type=float, default=0.5)
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as model_file:
+        model = pickle.load(model_file)
+    detector = stream_detector(sklearn_predict_fn(model), sec=args.sec, thresh=args.thresh)
+    decisions, report = replay(detector, args.records, args.data_dir, speed=args.speed)
+    for key, value in sorted(report.items()):
+        print('%s: %s' % (key, value))
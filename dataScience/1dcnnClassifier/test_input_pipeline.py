@@ -0,0 +1,70 @@
+import threading
+
+import numpy as np
+import pytest
+
+from input_pipeline import data_gen
+
+
+class failing_windows(object):
+    # windows whose reads fail after the first few, like a broken memmap
+    def __init__(self, n, T, fail_after):
+        self.windows = np.zeros((n, T, 1), dtype=np.float32)
+        self.reads = 0
+        self.fail_after = fail_after
+
+    def __len__(self):
+        return len(self.windows)
+
+    def __getitem__(self, key):
+        self.reads += 1
+        if self.reads > self.fail_after:
+            raise IOError('read failed')
+        return self.windows[key]
+
+
+def run_with_timeout(function, seconds=10):
+    result = {}
+
+    def target():
+        try:
+            result['value'] = function()
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), 'pipeline hung'
+    return result
+
+
+def test_batches_have_batch_size():
+    X = np.random.rand(200, 16, 1).astype(np.float32)
+    y = np.arange(200) % 2
+    for prefetch in (0, 2):
+        pipeline = data_gen(X, y, 8, shuffle_buffer=32, prefetch=prefetch, block_size=16)
+        pairs = list(pipeline(5))
+        assert len(pairs) == 5
+        for (X_train, y_train), (X_val, y_val) in pairs:
+            assert X_train.shape == (8, 16, 1) and y_train.shape == (8, 1)
+            assert X_val.shape == (8, 16, 1) and y_val.shape == (8, 1)
+
+
+def test_producer_error_reaches_consumer():
+    X = failing_windows(200, 16, fail_after=20)
+    pipeline = data_gen(X, np.zeros(200), 8, shuffle_buffer=32, prefetch=2, block_size=16)
+    result = run_with_timeout(lambda: list(pipeline(1000)))
+    assert isinstance(result.get('error'), IOError)
+
+
+def test_finite_generator_ends():
+    pipeline = data_gen(np.zeros((200, 4, 1)), np.zeros(200), 8, prefetch=2)
+    stop = threading.Event()
+    result = run_with_timeout(lambda: list(pipeline.prefetched(iter(range(5)), stop)))
+    stop.set()
+    assert result['value'] == [0, 1, 2, 3, 4]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
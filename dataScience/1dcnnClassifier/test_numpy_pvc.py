@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from numpy_pvc import numpy_pvc
+
+
+def save_weights(filename, T, C, F, width, seed=0):
+    # random parameters in the layout pvc_p.export_weights writes
+    rng = np.random.RandomState(seed)
+    np.savez(filename,
+             layer_1_filters=rng.normal(size=(width, C, F)).astype(np.float32),
+             layer_1_bias=rng.normal(size=(1, 1, F)).astype(np.float32),
+             layer_2_fc=rng.normal(scale=0.01, size=((T - width + 1) * F, 1)).astype(np.float32),
+             layer_2_bias=rng.normal(size=1).astype(np.float32),
+             num_samples=T, num_channels=C)
+    return filename
+
+
+@pytest.mark.parametrize('T, C, F, width', [(2400, 1, 10, 3), (288, 2, 4, 5)])
+def test_folded_weights_match_layer_forward(tmp_path, T, C, F, width):
+    engine = numpy_pvc(save_weights(str(tmp_path / 'weights.npz'), T, C, F, width))
+    X = np.random.RandomState(1).rand(300, T, C).astype(np.float32)
+    probabilities = engine.predict_proba(X, chunk_size=128)
+    assert probabilities.shape == (300, 1)
+    assert np.allclose(probabilities, engine.layer_forward(X), atol=1e-5)
+
+
+def test_predict_chunks_match_predict(tmp_path):
+    engine = numpy_pvc(save_weights(str(tmp_path / 'weights.npz'), 100, 1, 3, 3))
+    X = np.random.RandomState(2).rand(70, 100, 1).astype(np.float32)
+    chunks = list(engine.predict_chunks(X, chunk_size=32))
+    assert [len(probabilities) for probabilities, labels in chunks] == [32, 32, 6]
+    assert np.array_equal(np.concatenate([labels for probabilities, labels in chunks]),
+                          engine.predict(X))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pvc_service import micro_batcher, service_stopped
+
+
+class recording_model(object):
+    # predict_fn that remembers the size of every call and can be held back
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, windows):
+        self.release.wait(10)
+        self.calls.append(len(windows))
+        return windows.reshape(len(windows), -1).mean(axis=1)
+
+
+def submit_all(batcher, requests):
+    results = [None] * len(requests)
+
+    def submit(i):
+        try:
+            results[i] = batcher.submit(requests[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def windows(n, value):
+    return np.full((n, 4, 1), value, dtype=np.float32)
+
+
+def test_concurrent_requests_share_one_call():
+    model = recording_model()
+    batcher = micro_batcher(model, max_batch=64, max_delay=0.5)
+    threads, results = submit_all(batcher, [windows(2, i) for i in range(8)])
+    for thread in threads:
+        thread.join(5)
+    batcher.stop()
+
+    assert model.calls == [16]
+    for i, probabilities in enumerate(results):
+        assert np.allclose(probabilities, i)
+
+
+def test_batches_never_exceed_max_batch():
+    model = recording_model()
+    model.release.clear()
+    batcher = micro_batcher(model, max_batch=10, max_delay=0.05)
+    threads, results = submit_all(batcher, [windows(n, n) for n in (3, 4, 5, 6, 2, 7, 1, 10)])
+    time.sleep(0.2)
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+    batcher.stop()
+
+    assert sum(model.calls) == 38
+    assert max(model.calls) <= 10
+    assert all(np.allclose(probabilities, len(probabilities)) for probabilities in results)
+
+
+def test_stop_answers_pending_requests():
+    model = recording_model()
+    model.release.clear()
+    batcher = micro_batcher(model, max_batch=2, max_delay=0.001)
+    threads, results = submit_all(batcher, [windows(2, i) for i in range(5)])
+    time.sleep(0.2)
+
+    # one batch is held inside predict_fn, the other four requests wait in the queue
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    time.sleep(0.1)
+    model.release.set()
+    stopper.join(5)
+    for thread in threads:
+        thread.join(5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    answered = [result for result in results if not isinstance(result, Exception)]
+    stopped = [result for result in results if isinstance(result, service_stopped)]
+    assert len(answered) == 1 and len(stopped) == 4
+    with pytest.raises(service_stopped):
+        batcher.submit(windows(1, 0))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
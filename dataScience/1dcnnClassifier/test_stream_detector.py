@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from stream_detector import score_decisions, decision
+
+FS = 360
+HALF_WIDTH = 144
+
+
+def found(patient_id, beats):
+    return [decision(patient_id, beat, 0.9 if is_pvc else 0.1, is_pvc, 0.0)
+            for beat, is_pvc in beats]
+
+
+def test_silent_stream_misses_every_windowable_beat():
+    annotations = {1: ([100, 500, 900, 1300], ['N', 'V', 'N', 'N'])}
+    counts = score_decisions([], annotations, FS, HALF_WIDTH, {1: 2000})
+    assert counts == {'missed_beats': 3, 'missed_pvcs': 1}
+
+
+def test_only_beat_annotations_are_scored():
+    annotations = {1: ([500, 700, 900, 1100], ['N', '+', '~', 'V'])}
+    counts = score_decisions(found(1, [(503, False), (1100, True)]), annotations, FS,
+                             HALF_WIDTH, {1: 2000})
+    assert counts == {'matched_beats': 2, 'pvc_true_positives': 1,
+                      'missed_beats': 0, 'missed_pvcs': 0}
+
+    # a decision on a rhythm mark is a false beat, not a match
+    counts = score_decisions(found(1, [(700, False)]), annotations, FS, HALF_WIDTH, {1: 2000})
+    assert counts['false_beats'] == 1 and counts['missed_beats'] == 2
+
+
+def test_record_edges_are_not_missed():
+    annotations = {1: ([50, 500, 990], ['N', 'N', 'N'])}
+    counts = score_decisions([], annotations, FS, HALF_WIDTH, {1: 1000})
+    assert counts['missed_beats'] == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])